@@ -0,0 +1,567 @@
+#!/usr/bin/env python
+'''Rebuild the figures and statistics from stored results, without Mininet.
+
+    ./analyze.py -d results
+
+redraws figures 15(a) and (b) from the raw FCT samples in samples.sqlite,
+and figures 16 and 17 from the priority tests' iperf3 JSON output, and
+prints the statistics of every FCT cell. With --check-pairs, it instead
+checks that FCT samples taken on parallel host pairs (rc3test.py --pairs)
+match those taken serially. With --check-regressions, it checks the
+latest run's FCTs against the paper's and a baseline run's, writes a pass
+or fail report, and exits non-zero on regressions. It needs neither root
+nor Mininet, and only imports matplotlib to draw, so with --no-plots it
+runs wherever NumPy does. By default the FCT figures use the latest run
+that tested each configuration; see --run.
+'''
+
+from argparse import ArgumentParser
+import json
+import os
+import numpy as np
+from fct_stats import summarize, cellStats, storeMatrix, ksTest, \
+    confidenceInterval
+from figure15_helpers import plotBarClusers
+from experiment_configs import fctTestConfigs, FCT_FLOW_LENGTHS, \
+    FCT_FLOW_TYPES, PRIO_TEST_ARGS
+
+# Default tolerances of checkRegressions(), as fractions of the reference.
+PAPER_TOLERANCE = 0.5
+BASELINE_TOLERANCE = 0.1
+ADVANTAGE_TOLERANCE = 0.25
+
+def fctChart(matrix, time_scale_factor, starter_data_function, fig_file_name,
+             fct_offset):
+    '''A figure 15 style chart of FCT samples, with the paper data.
+
+    Args:
+        matrix: Raw FCTs in ms, indexed [flow length][flow type][iteration]
+            in FCT_FLOW_LENGTHS and FCT_FLOW_TYPES order, NaN padded.
+        time_scale_factor, starter_data_function, fig_file_name,
+            fct_offset: As in the rc3Test() configurations.
+
+    Returns the chart as (plotBarClusers, args), to draw with
+    plotBarClusers(*args) or RenderPool.submit().
+    '''
+    # Start with the bar-graph data from the paper
+    (data, flow_types, flow_type_colors, title) = starter_data_function()
+
+    # Compute all statistics for all cells at once, and add to graph data.
+    o = fct_offset
+    s = time_scale_factor * 0.001 # external scale and msecs to secs
+    stats = summarize(o + s * matrix)
+    for (i, flow_length) in enumerate(FCT_FLOW_LENGTHS):
+        for (j, (protocol, flow_type)) in enumerate(FCT_FLOW_TYPES):
+            data[flow_length][flow_type] = cellStats(stats, (i, j))
+
+    return (plotBarClusers,
+            (data, flow_types, flow_type_colors, title, fig_file_name))
+
+def configFct(cols, config):
+    '''FCTs of loadFct() columns in ms at config's own time scale.
+
+    A sample taken at a calibrated rate (see calibrate.py), k times the
+    config's bandwidth, ran k times faster than at the config's own
+    settings, so its FCT is scaled back by its stored bandwidth.
+    '''
+    return cols['fct_ms'] * cols['bandwidth'] / float(config['bandwidth'])
+
+def storeFctMatrix(store, config, run_id=None):
+    '''The sample matrix of one configuration, for fctChart().
+
+    Skipped (warm up) samples are left out. FCTs are at the config's own
+    time scale, see configFct(), so calibrated runs are scaled correctly by
+    config['time_scale_factor'].
+
+    Args:
+        store: A SampleStore.
+        config: The configuration, as from fctTestConfigs().
+        run_id: Run to use, None for the latest run with samples of this
+            configuration, or 'all' to pool every run.
+
+    Returns (matrix, run_id), or (None, None) if there are no samples.
+    '''
+    cols = store.loadFct(config=config['name'], skipped=0)
+    cols['fct_ms'] = configFct(cols, config)
+    if len(cols['run_id']) == 0:
+        return (None, None)
+    if run_id is None:
+        run_id = max(cols['run_id']) # Run ids sort by time.
+    if run_id != 'all':
+        keep = cols['run_id'] == run_id
+        cols = dict((name, values[keep]) for (name, values) in cols.items())
+        if not keep.any():
+            return (None, None)
+
+    (cells, labels) = storeMatrix(cols, ['flow_length', 'protocol'])
+    matrix = np.empty((len(FCT_FLOW_LENGTHS), len(FCT_FLOW_TYPES),
+                       cells.shape[-1]))
+    matrix.fill(np.nan)
+    for (i, flow_length) in enumerate(FCT_FLOW_LENGTHS):
+        for (j, (protocol, _)) in enumerate(FCT_FLOW_TYPES):
+            li = np.flatnonzero(labels[0] == flow_length)
+            lj = np.flatnonzero(labels[1] == protocol)
+            if len(li) and len(lj):
+                matrix[i, j] = cells[li[0], lj[0]]
+    return (matrix, run_id)
+
+def fctStatsTable(matrix, time_scale_factor, fct_offset):
+    '''Text table of the statistics of each cell, in scaled seconds.'''
+    stats = summarize(fct_offset + time_scale_factor * 0.001 * matrix)
+    lines = ['%11s %-9s %5s %10s %10s %10s %10s %10s'
+             % ('flow_length', 'protocol', 'n', 'mean', 'median', 'p99',
+                'ci_low', 'ci_high')]
+    for (i, flow_length) in enumerate(FCT_FLOW_LENGTHS):
+        for (j, (protocol, _)) in enumerate(FCT_FLOW_TYPES):
+            c = cellStats(stats, (i, j))
+            lines.append('%11d %-9s %5d %10.6f %10.6f %10.6f %10.6f %10.6f'
+                         % (flow_length, protocol, c['count'], c['mean'],
+                            c['median'], c['p99'], c['ci_low'],
+                            c['ci_high']))
+    return '\n'.join(lines)
+
+def analyzeFct(store, configs, run_id=None, renderer=None):
+    '''Print the statistics of each configuration, and redraw its figure.
+
+    Args:
+        store: A SampleStore.
+        configs: Configurations, as from fctTestConfigs().
+        run_id: Run to use, as in storeFctMatrix().
+        renderer: A RenderPool to draw with, or None for no figures.
+    '''
+    for config in configs:
+        (matrix, used_run) = storeFctMatrix(store, config, run_id)
+        if matrix is None:
+            print "%s: no samples" % config['name']
+            continue
+        print "%s (run %s):" % (config['name'], used_run)
+        print fctStatsTable(matrix, config['time_scale_factor'],
+                            config['fct_offset'])
+        if renderer is not None:
+            (plot, plot_args) = fctChart(matrix, config['time_scale_factor'],
+                                         config['starter_data_function'],
+                                         config['fig_file_name'],
+                                         config['fct_offset'])
+            renderer.submit(plot, *plot_args)
+
+def checkPairs(store, alpha=0.05):
+    '''Check that parallel host pairs don't change the FCT samples.
+
+    For every configuration, flow length and protocol with samples taken
+    both serially and on several host pairs at once (from any runs), a
+    two sample Kolmogorov-Smirnov test compares the two. A cell differs if
+    its p value is below alpha over the number of cells compared
+    (Bonferroni), so about one run in 1/alpha has a false alarm.
+
+    Returns (number of cells compared, number of cells that differ).
+    '''
+    cols = store.loadFct(skipped=0)
+    parallel = cols['pairs'] > 1
+    cells = sorted(set(zip(cols['config'].tolist(),
+                           cols['flow_length'].tolist(),
+                           cols['protocol'].tolist())))
+    rows = []
+    for (config, flow_length, protocol) in cells:
+        cell = ((cols['config'] == config) &
+                (cols['flow_length'] == flow_length) &
+                (cols['protocol'] == protocol))
+        serial = cols['fct_ms'][cell & ~parallel]
+        pairs = cols['fct_ms'][cell & parallel]
+        if len(serial) and len(pairs):
+            rows.append((config, flow_length, protocol, serial, pairs) +
+                        ksTest(serial, pairs))
+    if not rows:
+        print "No cells with both serial and parallel pair samples."
+        return (0, 0)
+
+    threshold = alpha / len(rows)
+    print '%-18s %11s %-8s %6s %6s %10s %10s %6s %8s' \
+        % ('config', 'flow_length', 'protocol', 'n_ser', 'n_par',
+           'mean_ser', 'mean_par', 'ks_d', 'p')
+    differ = 0
+    for (config, flow_length, protocol, serial, pairs, d, p) in rows:
+        flag = p < threshold
+        differ += flag
+        print '%-18s %11d %-8s %6d %6d %10.3f %10.3f %6.3f %8.4f%s' \
+            % (config, flow_length, protocol, len(serial), len(pairs),
+               np.mean(serial), np.mean(pairs), d, p,
+               '  DIFFERS' if flag else '')
+    print "%d of %d cells differ (p < %.2g)" % (differ, len(rows), threshold)
+    return (len(rows), differ)
+
+def scaledFct(cols, config):
+    '''FCTs of loadFct() columns in scaled seconds, as in the figures.'''
+    return config['fct_offset'] + \
+        config['time_scale_factor'] * 0.001 * configFct(cols, config)
+
+def runCells(store, config, run_id=None, before=None):
+    '''Scaled FCTs of one run of a configuration, cell by cell.
+
+    Args:
+        store: A SampleStore.
+        config: The configuration, as from fctTestConfigs().
+        run_id: Run to use, None for the latest run with samples of config.
+        before: With run_id None, only consider runs before this run id.
+
+    Returns (cells, run_id): a dictionary of (flow length, protocol) to
+    the cell's samples, and the run used (None if there is none).
+    '''
+    cols = store.loadFct(config=config['name'], skipped=0)
+    if run_id is None:
+        runs = [r for r in set(cols['run_id'].tolist())
+                if before is None or r < before]
+        if not runs:
+            return ({}, None)
+        run_id = max(runs) # Run ids sort by time.
+    keep = cols['run_id'] == run_id
+    fct = scaledFct(cols, config)
+    cells = {}
+    for flow_length in FCT_FLOW_LENGTHS:
+        for (protocol, _) in FCT_FLOW_TYPES:
+            cell = keep & (cols['flow_length'] == flow_length) & \
+                (cols['protocol'] == protocol)
+            if cell.any():
+                cells[(flow_length, protocol)] = fct[cell]
+    return (cells, run_id if cells else None)
+
+def meanInterval(samples, confidence):
+    '''(mean, ci_low, ci_high) of samples; NaN bounds under two samples.'''
+    (low, high) = confidenceInterval(np.asarray(samples)[None, :], confidence)
+    return (float(np.mean(samples)), float(low[0]), float(high[0]))
+
+def checkRegressions(store, configs, run_id=None, baseline_store=None,
+                     baseline_run=None, paper='Real',
+                     paper_tolerance=PAPER_TOLERANCE,
+                     baseline_tolerance=BASELINE_TOLERANCE,
+                     advantage_tolerance=ADVANTAGE_TOLERANCE, alpha=0.05,
+                     confidence=0.95):
+    '''Check a run's FCTs against the paper's and against a baseline run's.
+
+    FCTs are compared in scaled seconds, as drawn in figure 15, so runs at
+    different calibrated scales compare. Each (configuration, flow length,
+    protocol) cell gets these checks:
+
+      * paper: fails if the confidence interval of the cell's mean lies
+        wholly outside paper_tolerance of the paper's mean,
+      * baseline: a two sample Kolmogorov-Smirnov test against the
+        baseline run's samples. Fails if they differ (p below alpha over
+        the number of cells compared, as in checkPairs()) and the mean is
+        more than baseline_tolerance slower. As much faster is 'improved'.
+
+    and each (configuration, flow length), with protocol 'rc3/tcp':
+
+      * advantage_paper, advantage_baseline: RC3's speedup, the TCP mean
+        over the RC3 mean, fails if even the upper bound from the two
+        confidence intervals is more than advantage_tolerance below the
+        paper's or the baseline's speedup.
+
+    A check without the samples or reference it needs is 'skipped'.
+
+    Args:
+        store: A SampleStore.
+        configs: Configurations, as from fctTestConfigs().
+        run_id: Run to check, None for the latest of each configuration.
+        baseline_store: SampleStore of the baseline, None for store.
+        baseline_run: Baseline run, None for the latest of each
+            configuration, before the checked run if in the same store.
+        paper: Paper data to compare with, 'Real' or 'Simulated', or None
+            for no paper checks.
+        paper_tolerance, baseline_tolerance, advantage_tolerance: Relative
+            tolerances, as above.
+        alpha: Family-wise false alarm rate of the baseline tests.
+        confidence: Confidence level of the intervals.
+
+    Returns the report: a dictionary of the runs and settings used,
+    'checks', a list of dictionaries of config, flow_length, protocol,
+    check, value, ci_low, ci_high, reference, p and status, and the number
+    of 'regressions'.
+    '''
+    if baseline_store is None:
+        baseline_store = store
+    checks = []
+    runs = {}
+    baseline_runs = {}
+
+    def add(config, flow_length, protocol, check, value=None, low=None,
+            high=None, reference=None, p=None, status='skipped'):
+        checks.append({'config': config['name'], 'flow_length': flow_length,
+                       'protocol': protocol, 'check': check, 'value': value,
+                       'ci_low': low, 'ci_high': high,
+                       'reference': reference, 'p': p, 'status': status})
+        return checks[-1]
+
+    def speedup(cells, flow_length):
+        '''(speedup, low, high) of RC3 over TCP, or None.'''
+        if (flow_length, 'tcp') not in cells or \
+                (flow_length, 'rc3') not in cells:
+            return None
+        (tcp, tcp_low, tcp_high) = meanInterval(cells[(flow_length, 'tcp')],
+                                                confidence)
+        (rc3, rc3_low, rc3_high) = meanInterval(cells[(flow_length, 'rc3')],
+                                                confidence)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (tcp / rc3, tcp_low / rc3_high, tcp_high / rc3_low)
+
+    ks_checks = []
+    for config in configs:
+        (cells, used_run) = runCells(store, config, run_id)
+        if used_run is None:
+            print "%s: no samples" % config['name']
+            continue
+        runs[config['name']] = used_run
+        if baseline_run is not None:
+            (base_cells, used_base) = runCells(baseline_store, config,
+                                               baseline_run)
+        else:
+            (base_cells, used_base) = runCells(
+                baseline_store, config,
+                before=used_run if baseline_store is store else None)
+        baseline_runs[config['name']] = used_base
+        paper_data = config['starter_data_function']()[0]
+
+        for flow_length in FCT_FLOW_LENGTHS:
+            for (protocol, flow_type) in FCT_FLOW_TYPES:
+                samples = cells.get((flow_length, protocol))
+                if samples is None:
+                    continue
+                (mean, low, high) = meanInterval(samples, confidence)
+
+                if paper is not None:
+                    reference = paper_data[flow_length].get(
+                        flow_type.replace('Mininet', paper), {}).get('mean')
+                    check = add(config, flow_length, protocol, 'paper', mean,
+                                low, high, reference)
+                    if reference and not np.isnan(low):
+                        outside = high < reference * (1 - paper_tolerance) or \
+                            low > reference * (1 + paper_tolerance)
+                        check['status'] = 'fail' if outside else 'pass'
+
+                base = base_cells.get((flow_length, protocol))
+                check = add(config, flow_length, protocol, 'baseline', mean,
+                            low, high)
+                if base is not None:
+                    check['reference'] = float(np.mean(base))
+                    check['p'] = ksTest(samples, base)[1]
+                    ks_checks.append(check)
+
+            current = speedup(cells, flow_length)
+            references = []
+            if paper is not None:
+                types = dict((protocol, flow_type.replace('Mininet', paper))
+                             for (protocol, flow_type) in FCT_FLOW_TYPES)
+                paper_cell = paper_data[flow_length]
+                if types['tcp'] in paper_cell and types['rc3'] in paper_cell:
+                    references.append(('advantage_paper',
+                                       paper_cell[types['tcp']]['mean'] /
+                                       paper_cell[types['rc3']]['mean']))
+                else:
+                    references.append(('advantage_paper', None))
+            base = speedup(base_cells, flow_length)
+            references.append(('advantage_baseline',
+                               base[0] if base is not None else None))
+            for (name, reference) in references:
+                if current is None:
+                    add(config, flow_length, 'rc3/tcp', name,
+                        reference=reference)
+                    continue
+                check = add(config, flow_length, 'rc3/tcp', name, current[0],
+                            current[1], current[2], reference)
+                if reference is not None and not np.isnan(current[2]):
+                    smaller = current[2] < \
+                        reference * (1 - advantage_tolerance)
+                    check['status'] = 'fail' if smaller else 'pass'
+
+    # Bonferroni, over the cells that have a baseline.
+    threshold = alpha / max(len(ks_checks), 1)
+    for check in ks_checks:
+        change = check['value'] / check['reference'] - 1
+        if check['p'] < threshold and change > baseline_tolerance:
+            check['status'] = 'fail'
+        elif check['p'] < threshold and change < -baseline_tolerance:
+            check['status'] = 'improved'
+        else:
+            check['status'] = 'pass'
+
+    # Plain JSON, without NaN.
+    for check in checks:
+        for (key, value) in check.items():
+            if isinstance(value, float) and np.isnan(value):
+                check[key] = None
+
+    print '%-18s %11s %-8s %-18s %10s %10s %10s %8s %s' \
+        % ('config', 'flow_length', 'protocol', 'check', 'value',
+           'ci_high', 'reference', 'p', 'status')
+    for c in checks:
+        print '%-18s %11d %-8s %-18s %10s %10s %10s %8s %s' \
+            % (c['config'], c['flow_length'], c['protocol'], c['check'],
+               '-' if c['value'] is None else '%.6f' % c['value'],
+               '-' if c['ci_high'] is None else '%.6f' % c['ci_high'],
+               '-' if c['reference'] is None else '%.6f' % c['reference'],
+               '-' if c['p'] is None else '%.4f' % c['p'],
+               c['status'].upper() if c['status'] == 'fail' else c['status'])
+    regressions = sum(c['status'] == 'fail' for c in checks)
+    print "%d regressions in %d checks (%d skipped)" \
+        % (regressions, len(checks),
+           sum(c['status'] == 'skipped' for c in checks))
+    return {'runs': runs, 'baseline_runs': baseline_runs, 'paper': paper,
+            'paper_tolerance': paper_tolerance,
+            'baseline_tolerance': baseline_tolerance,
+            'advantage_tolerance': advantage_tolerance, 'alpha': alpha,
+            'confidence': confidence, 'checks': checks,
+            'regressions': regressions}
+
+def analyzePrio(output_dir, duration, renderer):
+    '''Redraw the priority test figures whose iperf3 output is present.'''
+    from prio_plots import PRIO_FIGURES, prioFigureArgs, iperfPlotJSON
+
+    for stem in sorted(PRIO_FIGURES):
+        fargs = prioFigureArgs(output_dir, stem, duration)
+        missing = [f for f in fargs[:4] if not os.path.exists(f)]
+        if missing:
+            print "%s: missing %s" % (PRIO_FIGURES[stem][0],
+                                      ', '.join(missing))
+            continue
+        renderer.submit(iperfPlotJSON, *fargs)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Rebuild RC3 test figures and "
+                                        "statistics from stored results.")
+    parser.add_argument('--dir', '-d',
+                        dest="output_dir",
+                        action="store",
+                        help="Directory holding the results, where the "
+                             "figures are written.",
+                        default="results")
+    parser.add_argument('--run',
+                        dest="run_id",
+                        action="store",
+                        help="Run id of the FCT samples to use, or 'all' to "
+                             "pool every run. Default: the latest run of "
+                             "each configuration.",
+                        default=None)
+    parser.add_argument('--only',
+                        dest="only",
+                        choices=['fct', 'prio'],
+                        help="Only analyze the FCT or the priority tests.",
+                        default=None)
+    parser.add_argument('--check-pairs',
+                        dest="check_pairs",
+                        action="store_true",
+                        help="Only check that FCT samples from parallel host "
+                             "pairs match serial samples, exiting non-zero "
+                             "if any cell differs.",
+                        default=False)
+    parser.add_argument('--check-regressions',
+                        dest="check_regressions",
+                        action="store_true",
+                        help="Only check the FCTs of the run (see --run) "
+                             "against the paper's and a baseline run's, "
+                             "write a report, and exit non-zero on "
+                             "regressions. See checkRegressions().",
+                        default=False)
+    parser.add_argument('--baseline-dir',
+                        dest="baseline_dir",
+                        action="store",
+                        help="Results folder of the baseline run, for "
+                             "--check-regressions. Default: --dir.",
+                        default=None)
+    parser.add_argument('--baseline-run',
+                        dest="baseline_run",
+                        action="store",
+                        help="Run id of the baseline. Default: the latest "
+                             "run of each configuration, before the checked "
+                             "run if in the same folder.",
+                        default=None)
+    parser.add_argument('--paper',
+                        dest="paper",
+                        choices=['real', 'simulated', 'none'],
+                        help="Paper data to check against. Default: real.",
+                        default='real')
+    parser.add_argument('--paper-tolerance',
+                        dest="paper_tolerance",
+                        type=float,
+                        help="Relative tolerance of FCTs from the paper's. "
+                             "Default: %g." % PAPER_TOLERANCE,
+                        default=PAPER_TOLERANCE)
+    parser.add_argument('--baseline-tolerance',
+                        dest="baseline_tolerance",
+                        type=float,
+                        help="Relative FCT slowdown from the baseline "
+                             "tolerated. Default: %g." % BASELINE_TOLERANCE,
+                        default=BASELINE_TOLERANCE)
+    parser.add_argument('--advantage-tolerance',
+                        dest="advantage_tolerance",
+                        type=float,
+                        help="Relative loss of RC3's speedup over TCP "
+                             "tolerated. Default: %g." % ADVANTAGE_TOLERANCE,
+                        default=ADVANTAGE_TOLERANCE)
+    parser.add_argument('--alpha',
+                        dest="alpha",
+                        type=float,
+                        help="False alarm rate of the statistical tests of "
+                             "--check-pairs and --check-regressions. "
+                             "Default: 0.05.",
+                        default=0.05)
+    parser.add_argument('--report',
+                        dest="report",
+                        action="store",
+                        help="File for the --check-regressions report. "
+                             "Default: regressions.json in --dir.",
+                        default=None)
+    parser.add_argument('--no-plots',
+                        dest="plots",
+                        action="store_false",
+                        help="Only print statistics, don't draw figures.",
+                        default=True)
+    args = parser.parse_args()
+
+    if args.check_pairs:
+        from sample_store import SampleStore
+        db = os.path.join(args.output_dir, 'samples.sqlite')
+        if not os.path.exists(db):
+            print "No sample store at", db
+            exit(1)
+        (compared, differ) = checkPairs(SampleStore(db), args.alpha)
+        exit(1 if differ else 0)
+
+    if args.check_regressions:
+        from sample_store import SampleStore
+        if args.run_id == 'all':
+            parser.error("--check-regressions checks one run, not 'all'")
+        db = os.path.join(args.output_dir, 'samples.sqlite')
+        baseline_db = os.path.join(args.baseline_dir or args.output_dir,
+                                   'samples.sqlite')
+        for path in set([db, baseline_db]):
+            if not os.path.exists(path):
+                print "No sample store at", path
+                exit(1)
+        store = SampleStore(db)
+        report = checkRegressions(
+            store, fctTestConfigs(args.output_dir), args.run_id,
+            SampleStore(baseline_db) if args.baseline_dir else store,
+            args.baseline_run,
+            None if args.paper == 'none' else args.paper.capitalize(),
+            args.paper_tolerance, args.baseline_tolerance,
+            args.advantage_tolerance, args.alpha)
+        report_file = args.report or os.path.join(args.output_dir,
+                                                  'regressions.json')
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print "Report written to", report_file
+        exit(1 if report['regressions'] else 0)
+
+    from render_pool import RenderPool
+    renderer = RenderPool() if args.plots else None
+
+    if args.only in (None, 'fct'):
+        from sample_store import SampleStore
+        db = os.path.join(args.output_dir, 'samples.sqlite')
+        if os.path.exists(db):
+            analyzeFct(SampleStore(db), fctTestConfigs(args.output_dir),
+                       args.run_id, renderer)
+        else:
+            print "No sample store at", db
+    if args.only in (None, 'prio') and renderer is not None:
+        analyzePrio(args.output_dir, PRIO_TEST_ARGS[3], renderer)
+    if renderer is not None:
+        renderer.join()
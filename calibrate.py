@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+'''Pick the fastest time scale this machine emulates faithfully.
+
+The FCT test configurations emulate the paper's 10 Gbps and 1 Gbps
+networks slowed down: the rate is divided by some factor and the delay
+multiplied by it, which keeps the bandwidth-delay product, and so the TCP
+dynamics, while flows take that factor longer. The factors in
+experiment_configs.py suit a small 2015 EC2 instance. A faster machine can
+emulate HTB and netem accurately at higher rates and shorter delays, and
+finish the same runs proportionally sooner.
+
+A configuration scaled up by k runs at k times its bandwidth, with 1/k its
+delay, and k times its time_scale_factor. k is at most 1/time_scale_factor,
+the paper's own rate and delay. calibrate() tries the scales of
+CALIBRATION_SCALES from the fastest down, measuring each with two
+benchmarks, and keeps the first within the error budget:
+
+  * rate: a bulk flow through the priority qdiscs, without netem delay (so
+    its bandwidth-delay product is small and TCP fills the link), whose
+    throughput must be within budget of the configured rate, and
+  * delay: single packet flows, whose smallest TCP_INFO RTT must be within
+    budget of the configured round trip: the delay at each host's egress,
+    plus serialization.
+
+Results are cached, so configurations sharing a rate or a rate and delay
+are measured once. The measuring itself is up to the caller, see
+rc3test.py --calibrate, which saves the result as calibration.json for
+applyCalibration() to use in later runs.
+'''
+
+import json
+
+# Scale factors to try, fastest first.
+CALIBRATION_SCALES = [1000, 500, 200, 100, 50, 20, 10, 5, 2, 1]
+
+# Seconds of data in a rate benchmark flow.
+RATE_TEST_SECONDS = 0.5
+
+# Bytes on the wire of a full data packet and of its ACK.
+PACKET_BYTES = 1514
+ACK_BYTES = 66
+
+
+def parseDelay(text):
+    '''Seconds of a tc delay string, e.g. '1000ms', '20us' or '1s'.'''
+    for (unit, seconds) in (('us', 1e-6), ('ms', 1e-3), ('s', 1.0)):
+        if text.endswith(unit):
+            return float(text[:-len(unit)]) * seconds
+    return float(text) * 1e-6 # tc's default unit
+
+def formatDelay(seconds):
+    '''A tc delay string for seconds, in whole microseconds.'''
+    return '%dus' % round(seconds * 1e6)
+
+def scaledSettings(config, scale):
+    '''The bandwidth, delay and time_scale_factor of config, scaled up.
+
+    Args:
+        config: An FCT test configuration, as described in rc3Test().
+        scale: Factor to multiply the rate by and divide the delay by.
+    '''
+    return {'bandwidth': config['bandwidth'] * scale,
+            'delay': formatDelay(parseDelay(config['delay']) / scale),
+            'time_scale_factor': config['time_scale_factor'] * scale}
+
+def candidateScales(config):
+    '''Scales to try for config, fastest first, none faster than real time.'''
+    return [scale for scale in CALIBRATION_SCALES
+            if config['time_scale_factor'] * scale <= 1.0 + 1e-9]
+
+def rateError(bandwidth, size, fct_ms):
+    '''Relative error of a bulk flow's throughput from bandwidth (Mbps).'''
+    throughput = size * 8.0 / (fct_ms * 1e3) # Mbps
+    return abs(throughput - bandwidth) / bandwidth
+
+def delayError(bandwidth, delay, rtt_us):
+    '''Relative error of a measured RTT from the configured one.
+
+    Args:
+        bandwidth: Rate of the links, in Mbps.
+        delay: tc delay string, at each host's egress.
+        rtt_us: Measured RTT, in microseconds.
+    '''
+    # A data packet and its ACK each cross two shaped links.
+    expected = 2 * parseDelay(delay) + \
+        2 * (PACKET_BYTES + ACK_BYTES) * 8.0 / (bandwidth * 1e6)
+    return abs(rtt_us * 1e-6 - expected) / expected
+
+def calibrate(configs, measureRate, measureDelay, budget=0.05):
+    '''Pick the fastest faithful scale of each configuration.
+
+    Args:
+        configs: FCT test configurations, as from fctTestConfigs().
+        measureRate: Function of bandwidth (Mbps) returning the relative
+            rate error of the emulation, e.g. from rateError().
+        measureDelay: Function of bandwidth and delay string returning the
+            relative delay error, e.g. from delayError().
+        budget: Largest relative error allowed of either.
+
+    Returns a dictionary of configuration name to its calibration: its
+    'scale', the scaledSettings() at that scale, and every 'measurement'
+    taken for it, as dictionaries of scale, bandwidth, delay, rate_error
+    and delay_error (None if not measured). A configuration with no
+    faithful scale gets scale 1, its own settings.
+    '''
+    rate_errors = {}
+    delay_errors = {}
+    calibration = {}
+    for config in configs:
+        measurements = []
+        chosen = 1
+        for scale in candidateScales(config):
+            settings = scaledSettings(config, scale)
+            bandwidth = settings['bandwidth']
+            delay = settings['delay']
+            if bandwidth not in rate_errors:
+                rate_errors[bandwidth] = measureRate(bandwidth)
+            measurement = dict(settings, scale=scale,
+                               rate_error=rate_errors[bandwidth],
+                               delay_error=None)
+            measurements.append(measurement)
+            if rate_errors[bandwidth] > budget:
+                continue
+            if (bandwidth, delay) not in delay_errors:
+                delay_errors[(bandwidth, delay)] = \
+                    measureDelay(bandwidth, delay)
+            measurement['delay_error'] = delay_errors[(bandwidth, delay)]
+            if measurement['delay_error'] <= budget:
+                chosen = scale
+                break
+        else:
+            print "[WARNING]: %s: no scale within the error budget, " \
+                  "using its own settings" % config['name']
+        calibration[config['name']] = dict(scaledSettings(config, chosen),
+                                           scale=chosen, budget=budget,
+                                           measurements=measurements)
+    return calibration
+
+def applyCalibration(configs, calibration):
+    '''Copies of configs, scaled as calibrated.
+
+    Configurations missing from calibration are left as they are.
+    '''
+    scaled = []
+    for config in configs:
+        config = dict(config)
+        if config['name'] in calibration:
+            config.update(scaledSettings(
+                config, calibration[config['name']]['scale']))
+        scaled.append(config)
+    return scaled
+
+def calibrationTable(calibration):
+    '''Text table of the scales chosen, and the measurements behind them.'''
+    lines = ['%-18s %6s %10s %10s %8s %10s %11s'
+             % ('config', 'scale', 'bandwidth', 'delay', 'factor',
+                'rate_err', 'delay_err')]
+    for name in sorted(calibration):
+        for m in calibration[name]['measurements']:
+            chosen = m['scale'] == calibration[name]['scale']
+            lines.append('%-18s %6d %10g %10s %8g %10.4f %11s%s'
+                         % (name, m['scale'], m['bandwidth'], m['delay'],
+                            m['time_scale_factor'], m['rate_error'],
+                            '-' if m['delay_error'] is None
+                            else '%.4f' % m['delay_error'],
+                            '  <-' if chosen else ''))
+    return '\n'.join(lines)
+
+def saveCalibration(calibration, file_name):
+    '''Write a calibration from calibrate() as JSON.'''
+    with open(file_name, 'w') as f:
+        json.dump(calibration, f, indent=2, sort_keys=True)
+
+def loadCalibration(file_name):
+    '''Read a calibration written by saveCalibration().'''
+    with open(file_name) as f:
+        return json.load(f)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+'''Vectorized statistics over matrices of FCT samples.
+
+Samples are held in a NumPy array whose last axis is the iteration, e.g.
+shape (config, flow size, protocol, iteration). Cells with fewer samples
+than others are padded with NaN. summarize() computes every statistic for
+every cell in one call, returning arrays of shape matrix.shape[:-1]:
+
+    'count'     Number of (non-NaN) samples.
+    'mean'      Mean.
+    'stddev'    Population standard deviation (as np.std).
+    'median'    Median.
+    'p95'       95th percentile.
+    'p99'       99th percentile.
+    'ci_low'    Lower and upper bounds of the Student t confidence interval
+    'ci_high'       of the mean.
+    'boot_low'  Lower and upper bounds of the bootstrap percentile
+    'boot_high'     confidence interval of the mean.
+
+cellStats() picks one cell out as a dictionary of floats, in the same form
+as the plot_data cells used by plotBarClusers() in figure15_helpers.py.
+
+ksTest() compares two sets of samples, e.g. of one cell measured in two
+ways, for a difference in distribution.
+'''
+
+import warnings
+import numpy as np
+
+STAT_NAMES = ['count', 'mean', 'stddev', 'median', 'p95', 'p99',
+              'ci_low', 'ci_high', 'boot_low', 'boot_high']
+
+
+def sampleMatrix(samples):
+    '''Build a NaN padded sample matrix from nested lists of sample lists.
+
+    E.g. samples[size][protocol] = [fct, fct, ...] gives a matrix of shape
+    (sizes, protocols, max samples per cell). Any cell may be empty, e.g.
+    for a test that gave up, and the last axis is at least 1 long, so even
+    a matrix of only empty cells can be summarized:
+
+    >>> sampleMatrix([[[], [3.]], [[4.], [5., 6., 7.]]]).shape
+    (2, 2, 3)
+    >>> sampleMatrix([[[], []]]).shape
+    (1, 2, 1)
+    '''
+    def depth(x):
+        # The deepest element, as an empty list tells nothing of its level.
+        if not isinstance(x, (list, tuple)):
+            return 0
+        return 1 + max([depth(y) for y in x] or [0])
+    def shape(x, d):
+        if d == 1:
+            return [len(x)]
+        inner = [shape(y, d - 1) for y in x]
+        return [len(x)] + list(np.max(inner, axis=0)) if inner else [0]
+    def fill(m, x, d):
+        if d == 1:
+            m[:len(x)] = x
+        else:
+            for (i, y) in enumerate(x):
+                fill(m[i], y, d - 1)
+
+    d = depth(samples)
+    dims = shape(samples, d)
+    dims[-1] = max(dims[-1], 1)
+    matrix = np.empty(dims)
+    matrix.fill(np.nan)
+    fill(matrix, samples, d)
+    return matrix
+
+def storeMatrix(columns, axes, value='fct_ms'):
+    '''Build a sample matrix from columns loaded from a SampleStore.
+
+    Args:
+        columns: Dictionary of column arrays, e.g. from SampleStore.loadFct().
+        axes: Column names to use as the leading axes, e.g.
+            ['config', 'flow_length', 'protocol'].
+        value: Name of the sample column.
+
+    Returns (matrix, labels), where labels[i] holds the sorted distinct
+    values of axes[i], giving the meaning of each index along that axis.
+    '''
+    labels = []
+    index = []
+    for axis in axes:
+        (uniq, inverse) = np.unique(columns[axis], return_inverse=True)
+        labels.append(uniq)
+        index.append(inverse)
+
+    values = np.asarray(columns[value], dtype=np.float64)
+    shape = [len(l) for l in labels]
+    if len(values) == 0:
+        return (np.empty(shape + [0]), labels)
+
+    # Iteration slot of each sample: its rank among samples of the same cell.
+    cell = np.ravel_multi_index(index, shape)
+    order = np.argsort(cell, kind='mergesort')
+    sorted_cells = cell[order]
+    starts = np.searchsorted(sorted_cells, sorted_cells, side='left')
+    slot = np.empty(len(cell), dtype=np.int64)
+    slot[order] = np.arange(len(cell)) - starts
+
+    matrix = np.empty(shape + [slot.max() + 1])
+    matrix.fill(np.nan)
+    matrix[tuple(index) + (slot,)] = values
+    return (matrix, labels)
+
+def normalQuantile(p):
+    '''Inverse of the standard normal CDF, elementwise.
+
+    Uses Acklam's rational approximation (relative error below 1.2e-9).
+    '''
+    a = [-3.969683028665376e+01, 2.209460984245205e+02,
+         -2.759285104469687e+02, 1.383577518672690e+02,
+         -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02,
+         -1.556989798598866e+02, 6.680131188771972e+01,
+         -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01,
+         -2.400758277161838e+00, -2.549732539343734e+00,
+         4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01,
+         2.445134137142996e+00, 3.754408661907416e+00]
+
+    p = np.asarray(p, dtype=np.float64)
+    # Tails are computed for the lower tail, then mirrored.
+    q = np.minimum(p, 1 - p)
+    r = np.sqrt(-2 * np.log(q))
+    tail = ((((((c[0] * r + c[1]) * r + c[2]) * r + c[3]) * r + c[4]) * r
+             + c[5]) /
+            ((((d[0] * r + d[1]) * r + d[2]) * r + d[3]) * r + 1))
+    tail = np.where(p > 0.5, -tail, tail)
+
+    q = p - 0.5
+    r = q * q
+    central = ((((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r
+                + a[5]) * q /
+               (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r
+                + 1))
+    return np.where(np.abs(p - 0.5) <= 0.5 - 0.02425, central, tail)
+
+def tQuantile(p, df):
+    '''Inverse of the Student t CDF with df degrees of freedom, elementwise.
+
+    Exact for df of 1 and 2, and a Cornish-Fisher expansion about the normal
+    quantile otherwise, which is good to about 1e-3 from df = 3.
+    '''
+    p = np.asarray(p, dtype=np.float64)
+    v = np.asarray(df, dtype=np.float64)
+    z = normalQuantile(p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (z + (z**3 + z) / (4 * v)
+               + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * v**2)
+               + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * v**3)
+               + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3
+                  - 945 * z) / (92160 * v**4))
+        t = np.where(v == 1, np.tan(np.pi * (p - 0.5)), t)
+        t = np.where(v == 2, (2 * p - 1) / np.sqrt(2 * p * (1 - p)), t)
+        return np.where(v >= 1, t, np.nan)
+
+def confidenceInterval(matrix, confidence=0.95):
+    '''Student t confidence interval of the mean of each cell.
+
+    Returns (low, high) arrays of shape matrix.shape[:-1]. Cells with fewer
+    than two samples get NaN bounds.
+    '''
+    count = np.sum(~np.isnan(matrix), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(matrix, axis=-1) / count
+        dev = np.where(np.isnan(matrix), 0, matrix - mean[..., None])
+        sem = np.sqrt(np.sum(dev ** 2, axis=-1) / (count - 1) / count)
+        half = tQuantile(0.5 + confidence / 2.0, count - 1) * sem
+    return (mean - half, mean + half)
+
+def bootstrapInterval(matrix, confidence=0.95, resamples=1000, seed=None):
+    '''Bootstrap percentile confidence interval of the mean of each cell.
+
+    All cells are resampled at once: each cell is resampled with
+    replacement from its own samples, to its own sample count.
+
+    Returns (low, high) arrays of shape matrix.shape[:-1].
+    '''
+    cells = matrix.reshape(-1, matrix.shape[-1])
+    (ncells, width) = cells.shape
+    low = np.empty(ncells)
+    high = np.empty(ncells)
+    low.fill(np.nan)
+    high.fill(np.nan)
+    if ncells == 0 or width == 0:
+        return (low.reshape(matrix.shape[:-1]), high.reshape(matrix.shape[:-1]))
+
+    # np.sort moves the NaN padding to the end of each cell.
+    cells = np.sort(cells, axis=-1)
+    count = np.sum(~np.isnan(cells), axis=-1)
+
+    rng = np.random.RandomState(seed)
+    draws = rng.random_sample((ncells, resamples, width))
+    idx = np.floor(draws * count[:, None, None]).astype(np.int64)
+    resampled = cells[np.arange(ncells)[:, None, None], idx]
+    # Only the first count draws of each resample are used.
+    used = np.arange(width)[None, None, :] < count[:, None, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = (np.where(used, resampled, 0).sum(axis=-1)
+                 / count[:, None])
+
+    ok = count > 0
+    alpha = (1 - confidence) / 2.0
+    if ok.any():
+        low[ok] = np.percentile(means[ok], 100 * alpha, axis=-1)
+        high[ok] = np.percentile(means[ok], 100 * (1 - alpha), axis=-1)
+    return (low.reshape(matrix.shape[:-1]), high.reshape(matrix.shape[:-1]))
+
+def summarize(matrix, confidence=0.95, resamples=1000, seed=None):
+    '''Compute every statistic in STAT_NAMES for every cell of matrix.
+
+    Args:
+        matrix: NaN padded samples, the last axis being the iteration.
+        confidence: Confidence level of the t and bootstrap intervals.
+        resamples: Number of bootstrap resamples per cell.
+        seed: Seed for the bootstrap, for reproducible error bars.
+
+    Returns a dictionary mapping each statistic name to an array of shape
+    matrix.shape[:-1].
+    '''
+    matrix = np.asarray(matrix, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = np.sum(~np.isnan(matrix), axis=-1)
+        mean = np.nansum(matrix, axis=-1) / count
+        dev = np.where(np.isnan(matrix), 0, matrix - mean[..., None])
+        stddev = np.sqrt(np.sum(dev ** 2, axis=-1) / count)
+    # np.nanpercentile warns on all-NaN cells, which just come out as NaN.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        (median, p95, p99) = np.nanpercentile(matrix, [50, 95, 99], axis=-1)
+    (ci_low, ci_high) = confidenceInterval(matrix, confidence)
+    (boot_low, boot_high) = bootstrapInterval(matrix, confidence, resamples,
+                                              seed)
+    return {'count': count, 'mean': mean, 'stddev': stddev,
+            'median': median, 'p95': p95, 'p99': p99,
+            'ci_low': ci_low, 'ci_high': ci_high,
+            'boot_low': boot_low, 'boot_high': boot_high}
+
+def ksTest(a, b):
+    '''Two sample Kolmogorov-Smirnov test of whether a and b differ.
+
+    NaNs are ignored. The p value is the asymptotic one (as in Numerical
+    Recipes), which is fair from about 4 samples on each side.
+
+    Returns (d, p): the largest distance between the two empirical CDFs,
+    and the probability of a distance at least that large if both sets of
+    samples come from the same distribution. Both NaN if either is empty.
+    '''
+    a = np.sort(np.asarray(a, dtype=np.float64)[~np.isnan(a)])
+    b = np.sort(np.asarray(b, dtype=np.float64)[~np.isnan(b)])
+    (n, m) = (len(a), len(b))
+    if n == 0 or m == 0:
+        return (np.nan, np.nan)
+
+    # Both CDFs, evaluated at every sample.
+    points = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, points, side='right') / float(n)
+    cdf_b = np.searchsorted(b, points, side='right') / float(m)
+    d = float(np.max(np.abs(cdf_a - cdf_b)))
+
+    en = np.sqrt(n * m / float(n + m))
+    lam = (en + 0.12 + 0.11 / en) * d
+    j = np.arange(1, 101)
+    terms = 2 * (-1) ** (j - 1) * np.exp(-2 * j ** 2 * lam ** 2)
+    p = 1.0 if lam < 1e-3 else float(np.clip(np.sum(terms), 0.0, 1.0))
+    return (d, p)
+
+def cellStats(stats, index):
+    '''The statistics of one cell of summarize() output, as a dictionary.'''
+    return dict((name, float(values[index]))
+                for (name, values) in stats.items())
@@ -1,16 +1,42 @@
 /*
   fcctest
 
-  Test the flow completion time. Server and client must each be started
-  with the size of the flow specified. The client and server first establish
-  a connection, then the client marks the start time, and sends a flow
-  of the specified size. The server, once receiving the specified number
-  of bytes, sends back a single-byte token. Upon receiving the token,
-  the client marks the end time. The flow completing time reported is
-  the difference between this start and end time.
+  Test the flow completion time. The client is started with the size of
+  the flow. The client and server first establish a connection, then the
+  client marks the start time, and sends a header holding the flow size
+  (8 bytes, an unsigned big-endian integer) followed by a flow of that
+  size. The server, once receiving the number of bytes in the header,
+  sends back a single-byte token. Upon receiving the token, the client
+  marks the end time. The flow completing time reported is the difference
+  between this start and end time.
+
+  The server learns each flow's size from its header, so one server can
+  serve flows of every size. It handles all of its connections at once
+  from one epoll loop, discarding the data into a fixed size buffer, so it
+  can also serve many concurrent flows, e.g. from workload.py.
+
+  The client can run several flows in one process using the -n option,
+  printing one result per line as each flow completes. Each flow still uses
+  a fresh connection, so only the connection and the flow are measured.
+  With -n 0, the client instead runs one flow for each line it reads on
+  standard input, until end of file, so a controlling program can decide
+  after each result whether more flows are needed.
 
   Can enable RC3 mode if needed using the -r option, but it must be
   enabled for both the client and server.
+
+  The TCP congestion control algorithm can be chosen per socket using the
+  -C option, so several tests with different algorithms can run at once
+  without changing the system-wide default.
+
+  With the -i option, the client reads TCP_INFO from each flow's socket
+  once the token arrives, and adds selected fields to the flow's result
+  line as name=value pairs, e.g.
+
+    12.345678 retransmits=0 total_retrans=2 rtt_us=20125 rttvar_us=310
+      snd_cwnd=14 snd_ssthresh=7 delivery_rate=12500000 bytes_acked=146009
+
+  (on one line). Fields the kernel doesn't report are -1.
 */
 #include <stdlib.h>
 #include <stdio.h>
@@ -20,15 +46,65 @@
 #include <sys/types.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <netinet/tcp.h>
 #include <arpa/inet.h>
 #include <stdbool.h>
+#include <stddef.h>
 #include <time.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <errno.h>
+#include <endian.h>
+#include <sys/epoll.h>
 
 #define vprintf(...)  {if(verbose) printf(__VA_ARGS__);}
 
+// Size of the flow size header sent before each flow's data.
+#define HEADER_LEN 8
+// Size of the buffer the server discards flow data into.
+#define DISCARD_LEN (64 * 1024)
+#define MAX_EVENTS 256
+
+// struct tcp_info as reported by newer kernels than the C library's
+// header knows about. Older kernels fill in only a prefix of it.
+struct tcp_info_ext {
+  struct tcp_info base;
+  uint64_t tcpi_pacing_rate;
+  uint64_t tcpi_max_pacing_rate;
+  uint64_t tcpi_bytes_acked;
+  uint64_t tcpi_bytes_received;
+  uint32_t tcpi_segs_out;
+  uint32_t tcpi_segs_in;
+  uint32_t tcpi_notsent_bytes;
+  uint32_t tcpi_min_rtt;
+  uint32_t tcpi_data_segs_in;
+  uint32_t tcpi_data_segs_out;
+  uint64_t tcpi_delivery_rate;
+};
+
+// Whether the kernel filled in field, given the length it returned.
+#define HAS_FIELD(len, field) \
+  ((len) >= offsetof(struct tcp_info_ext, field) \
+            + sizeof(((struct tcp_info_ext *)0)->field))
+
+// State of one connection to the server.
+struct conn {
+  int fd;
+  unsigned char header[HEADER_LEN];
+  int header_got;
+  uint64_t remaining;
+};
+
 static void do_server(uint16_t port);
-static void do_client(const char *addr, uint16_t port);
+static void accept_conns(int epoll_fd, int serv_fd);
+static bool read_conn(struct conn *c, char *discard);
+static void close_conn(struct conn *c);
+static void do_client(const char *addr, uint16_t port, int count);
+static double do_client_flow(struct sockaddr_in *serv_addr, char *buff,
+                             char *info, size_t info_len);
+static void format_tcp_info(int fd, char *info, size_t info_len);
 static void set_rc3_options(int sock_fd);
+static void set_congestion_control(int sock_fd);
 
 bool verbose = false;
 
@@ -36,8 +112,12 @@ bool rc3 = false;
 bool rc3_log = false;
 bool rc3_logtime = false;
 
+bool tcp_info_out = false;
+
 int length = 0;
 
+char *congestion_control = NULL;
+
 void usage()
 {
   printf(
@@ -51,16 +131,27 @@ void usage()
     "\n"
     "  -a address    Address of server (must be specified in client mode).\n"
     "\n"
-    "  -g flow_len    Length, in bytes, of flow. Must be specified on\n"
-    "                 both the server and client.\n"
+    "  -g flow_len    Length, in bytes, of flow (client mode only). The\n"
+    "                 server reads each flow's length from its header.\n"
+    "\n"
+    "  -n count    Number of flows to run (client mode only). One result\n"
+    "              is printed per line as each flow completes. Default 1.\n"
+    "              If 0, run one flow per line read from stdin, until EOF.\n"
     "\n"
     "  -r    Enable RC3 mode. Must be specified for both client and server,\n"
     "        or neither.\n"
     "\n"
+    "  -C algorithm    TCP congestion control algorithm to use for this\n"
+    "                  test's sockets, e.g. reno or cubic. Defaults to the\n"
+    "                  system setting.\n"
+    "\n"
     "  -l    Enable RC3 logging mode (kernel socket option).\n"
     "\n"
     "  -t    Enable RC3 logging time mode (kernel socket option).\n"
     "\n"
+    "  -i    Add selected TCP_INFO fields of each flow to its result line\n"
+    "        (client mode only).\n"
+    "\n"
     "  -v    Verbose mode. Only recommended for troubleshooting, can\n"
     "        increase the measured times, due to extra printing.\n"
   );
@@ -74,8 +165,9 @@ int main(int argc, char *argv[])
   bool client = false;
   uint16_t port = 0;
   char *address = 0;
+  int count = 1;
 
-  while ((opt = getopt(argc, argv, "sca:p:g:rltv")) != -1) {
+  while ((opt = getopt(argc, argv, "sca:p:g:n:C:rltiv")) != -1) {
     switch (opt) {
     case 's':
       vprintf("server mode\n");
@@ -98,6 +190,15 @@ int main(int argc, char *argv[])
       length = atoi(optarg);
       vprintf("length = %d\n", length);
       break;
+    case 'n':
+      count = atoi(optarg);
+      vprintf("count = %d\n", count);
+      break;
+    case 'C':
+      vprintf("congestion control = %s\n", optarg);
+      congestion_control = malloc(strlen(optarg)+1);
+      strcpy(congestion_control, optarg);
+      break;
     case 'r':
       vprintf("RC3 mode on!\n");
       rc3 = true;
@@ -110,6 +211,10 @@ int main(int argc, char *argv[])
       vprintf("RC3 logging time mode on!\n");
       rc3_logtime = true;
       break;
+    case 'i':
+      vprintf("TCP_INFO output on!\n");
+      tcp_info_out = true;
+      break;
     case 'v':
       verbose = true;
       vprintf("Verbose mode on!. Timing is now less accurate.\n");
@@ -134,8 +239,15 @@ int main(int argc, char *argv[])
     exit(EXIT_FAILURE);
   }
 
-  if (!length) {
-    fprintf(stderr, "[ERROR] Need length!\n");
+  if (client && length <= 0) {
+    fprintf(stderr, "[ERROR] Need a positive length!\n");
+    printf("\n");
+    usage();
+    exit(EXIT_FAILURE);
+  }
+
+  if (count < 0) {
+    fprintf(stderr, "[ERROR] Flow count can't be negative!\n");
     printf("\n");
     usage();
     exit(EXIT_FAILURE);
@@ -146,7 +258,7 @@ int main(int argc, char *argv[])
     exit(0);
   }
   if (client) {
-    do_client(address, port);
+    do_client(address, port, count);
     exit(0);
   }
 
@@ -158,8 +270,7 @@ int main(int argc, char *argv[])
 static void do_server(uint16_t port)
 {
   int serv_fd;
-  int client_fd;
-  struct sockaddr_in serv_addr, client_addr;
+  struct sockaddr_in serv_addr;
 
   serv_fd = socket(AF_INET, SOCK_STREAM, 0);
   if (serv_fd == -1) {
@@ -172,12 +283,13 @@ static void do_server(uint16_t port)
   setsockopt(serv_fd, SOL_SOCKET, SO_REUSEPORT, &one, sizeof(one));
 
   set_rc3_options(serv_fd);
+  set_congestion_control(serv_fd);
 
   // Setup address for bind to listen on any addres, and specific port
   memset(&serv_addr, 0, sizeof(serv_addr));
   serv_addr.sin_family = AF_INET;
   serv_addr.sin_addr.s_addr = INADDR_ANY;
-  serv_addr.sin_port = port;
+  serv_addr.sin_port = htons(port);
 
   if (-1 == bind(serv_fd, (struct sockaddr *)&serv_addr, sizeof(serv_addr))) {
     fprintf(stderr, "[ERROR] couldn't bind.\n");
@@ -189,58 +301,187 @@ static void do_server(uint16_t port)
     exit(EXIT_FAILURE);
   }
 
-  // Setup a buffer to receive in.
-  char *buffer = malloc(length);
+  fcntl(serv_fd, F_SETFL, fcntl(serv_fd, F_GETFL) | O_NONBLOCK);
+
+  int epoll_fd = epoll_create1(0);
+  if (epoll_fd == -1) {
+    fprintf(stderr, "[ERROR] couldn't make epoll instance.\n");
+    exit(EXIT_FAILURE);
+  }
+
+  // The listening socket is told apart from connections by its NULL ptr.
+  struct epoll_event ev;
+  ev.events = EPOLLIN;
+  ev.data.ptr = NULL;
+  epoll_ctl(epoll_fd, EPOLL_CTL_ADD, serv_fd, &ev);
+
+  // Every connection's data is discarded into this one buffer.
+  char *discard = malloc(DISCARD_LEN);
+
+  // Serve fct tests as clients request them, any number at once.
+  struct epoll_event events[MAX_EVENTS];
+  while (1) {
+    int n = epoll_wait(epoll_fd, events, MAX_EVENTS, -1);
+    if (n == -1) {
+      if (errno == EINTR) {
+        continue;
+      }
+      fprintf(stderr, "[ERROR] epoll_wait failed.\n");
+      exit(EXIT_FAILURE);
+    }
+
+    int i;
+    for (i = 0; i < n; i++) {
+      struct conn *c = events[i].data.ptr;
+      if (c == NULL) {
+        accept_conns(epoll_fd, serv_fd);
+      } else if (!read_conn(c, discard)) {
+        close_conn(c);
+      }
+    }
+  }
+}
+
+// Accept every pending connection, and add it to the epoll set.
+static void accept_conns(int epoll_fd, int serv_fd)
+{
+  struct sockaddr_in client_addr;
 
-  // Repeatedly do fct tests as clients request them (one at a time).
   while (1) {
     socklen_t slen = sizeof(client_addr);
-    client_fd = accept(serv_fd, (struct sockaddr *)&client_addr, &slen);
+    int client_fd = accept(serv_fd, (struct sockaddr *)&client_addr, &slen);
     if (client_fd == -1) {
-      fprintf(stderr, "[ERROR] couldn't bind.\n");
-      exit(EXIT_FAILURE);
+      if (errno != EAGAIN && errno != EWOULDBLOCK && errno != EINTR) {
+        fprintf(stderr, "[ERROR] couldn't accept.\n");
+      }
+      return;
     }
 
     vprintf("Got connection!\n");
 
     set_rc3_options(client_fd);
+    set_congestion_control(client_fd);
+    fcntl(client_fd, F_SETFL, fcntl(client_fd, F_GETFL) | O_NONBLOCK);
+
+    struct conn *c = calloc(1, sizeof(*c));
+    c->fd = client_fd;
+
+    struct epoll_event ev;
+    ev.events = EPOLLIN;
+    ev.data.ptr = c;
+    if (epoll_ctl(epoll_fd, EPOLL_CTL_ADD, client_fd, &ev)) {
+      fprintf(stderr, "[ERROR] couldn't add connection to epoll.\n");
+      close_conn(c);
+    }
+  }
+}
 
-    // Read data loop.
-    int total = 0;
-    int got = 0;
-    while(total < length) {
-      got = read(client_fd, &buffer[total], length - total);
-      if (got <= 0) {
-        fprintf(stderr, "[ERROR] got a bad amount of bytes %d\n", got);
-        exit(EXIT_FAILURE);
-      }
-      vprintf("Got %d bytes\n", got);
-      total += got;
+// Read what a connection has ready: first its header, then its data.
+// Once the whole flow is in, send the response token. Returns false when
+// the connection is finished with, and should be closed.
+static bool read_conn(struct conn *c, char *discard)
+{
+  while (c->header_got < HEADER_LEN) {
+    int got = read(c->fd, &c->header[c->header_got],
+                   HEADER_LEN - c->header_got);
+    if (got == -1 && (errno == EAGAIN || errno == EWOULDBLOCK)) {
+      return true;
+    }
+    if (got <= 0) {
+      fprintf(stderr, "[ERROR] got a bad amount of header bytes %d\n", got);
+      return false;
+    }
+    c->header_got += got;
+    if (c->header_got == HEADER_LEN) {
+      uint64_t size;
+      memcpy(&size, c->header, HEADER_LEN);
+      c->remaining = be64toh(size);
+      vprintf("Flow of %llu bytes\n", (unsigned long long)c->remaining);
+    }
+  }
+
+  while (c->remaining > 0) {
+    size_t want = c->remaining < DISCARD_LEN ? c->remaining : DISCARD_LEN;
+    int got = read(c->fd, discard, want);
+    if (got == -1 && (errno == EAGAIN || errno == EWOULDBLOCK)) {
+      return true;
+    }
+    if (got <= 0) {
+      fprintf(stderr, "[ERROR] got a bad amount of bytes %d\n", got);
+      return false;
     }
+    vprintf("Got %d bytes\n", got);
+    c->remaining -= got;
+  }
+
+  vprintf("Writing response token\n");
 
-    vprintf("Writing response token\n");
+  // Send the response token, siginalling to the client that I have
+  // received the whole flow. The send buffer is empty, so this can't
+  // block.
+  char response_token = '$';
+  write(c->fd, &response_token, 1);
 
-    // Send the response token, siginalling to the client that I have
-    // received the whole flow.
-    char response_token = '$';
-    write(client_fd, &response_token, 1);
+  vprintf("Write token.\n");
+  return false;
+}
 
-    vprintf("Write token.\n");
+static void close_conn(struct conn *c)
+{
+  close(c->fd);
+  free(c);
 
-    // Useful for debugging:
-    // buffer[length-1]= '\0';
-    // vprintf("Transfered string: \"%s\" \n", buffer);
+  vprintf("Connection closed.\n");
+}
 
-    close(client_fd);
+static void do_client(const char *addr, uint16_t port, int count)
+{
+  struct sockaddr_in serv_addr;
 
-    vprintf("Connection closed.\n");
+  memset(&serv_addr, 0, sizeof(serv_addr));
+  serv_addr.sin_family = AF_INET;
+  inet_aton(addr, &serv_addr.sin_addr);
+  //serv_addr.sin_addr.s_addr =
+  serv_addr.sin_port = htons(port);
+
+  // One buffer is shared by every flow in the batch: the flow size
+  // header, followed by the flow's data.
+  char *buff = calloc(1, HEADER_LEN + length);
+  uint64_t size = htobe64((uint64_t)length);
+  memcpy(buff, &size, HEADER_LEN);
+
+  // TCP_INFO fields of the latest flow, with -i.
+  char info[256];
+
+  int i;
+  for (i = 0; count == 0 || i < count; i++) {
+    if (count == 0) {
+      // Wait for the next request line, stopping at end of file.
+      int c;
+      while ((c = getchar()) != '\n' && c != EOF);
+      if (c == EOF) {
+        break;
+      }
+    }
+
+    double f_msecs = do_client_flow(&serv_addr, buff, info, sizeof(info));
+
+    if (!verbose) {
+      // Flush each result, so a reader on a pipe sees it immediately.
+      printf("%f%s\n", f_msecs, info);
+      fflush(stdout);
+    }
   }
+
+  free(buff);
 }
 
-static void do_client(const char *addr, uint16_t port)
+// Run a single flow on a new connection, returning the FCT in msecs.
+// With -i, info is set to the flow's TCP_INFO fields, else to "".
+static double do_client_flow(struct sockaddr_in *serv_addr, char *buff,
+                             char *info, size_t info_len)
 {
   int fd;
-  struct sockaddr_in serv_addr, client_addr;
 
   fd = socket(AF_INET, SOCK_STREAM, 0);
   if (fd == -1) {
@@ -249,40 +490,61 @@ static void do_client(const char *addr, uint16_t port)
   }
 
   set_rc3_options(fd);
+  set_congestion_control(fd);
 
-  memset(&serv_addr, 0, sizeof(serv_addr));
-  serv_addr.sin_family = AF_INET;
-  inet_aton(addr, &serv_addr.sin_addr);
-  //serv_addr.sin_addr.s_addr =
-  serv_addr.sin_port = port;
-
-  if (connect(fd, (struct sockaddr *)&serv_addr, sizeof(serv_addr))) {
+  if (connect(fd, (struct sockaddr *)serv_addr, sizeof(*serv_addr))) {
     fprintf(stderr, "[ERROR] couldn't connect.\n");
     exit(EXIT_FAILURE);
   }
 
-  char *buff = malloc(length);
-
   struct timespec time_start, time_finish;
 
   clock_gettime(CLOCK_MONOTONIC, &time_start);
 
-  write(fd, buff, length);
+  // The header and data go in one write, so Nagle's algorithm never
+  // holds the data back behind the header.
+  // A signal can cut a write short, so finish it off, and fail rather
+  // than wait forever for a token to data that was never sent.
+  // length is positive, checked in main().
+  size_t total = HEADER_LEN + (size_t)length;
+  size_t sent = 0;
+  while (sent < total) {
+    ssize_t wrote = write(fd, buff + sent, total - sent);
+    if (wrote < 0 && errno == EINTR) {
+      continue;
+    }
+    if (wrote <= 0) {
+      fprintf(stderr, "[ERROR] write failed after %zu bytes: %s\n", sent,
+              strerror(errno));
+      exit(EXIT_FAILURE);
+    }
+    sent += (size_t)wrote;
+  }
 
   vprintf("Sent via write syscall! Waiting for $ token.\n");
 
+  // Read the token separately, so the header in buff is kept.
+  char token = 0;
   int got;
-  got = read(fd, buff, 1);
+  got = read(fd, &token, 1);
 
   vprintf("Got a byte.\n");
 
   clock_gettime(CLOCK_MONOTONIC, &time_finish);
 
-  if (got != 1 || buff[0] != '$') {
-    fprintf(stderr, "[ERROR] read %d bytes, first is %c\n", got, *buff);
+  if (got != 1 || token != '$') {
+    fprintf(stderr, "[ERROR] read %d bytes, first is %c\n", got, token);
     exit(EXIT_FAILURE);
   }
 
+  // Read after the finish time, so it doesn't add to the FCT.
+  info[0] = '\0';
+  if (tcp_info_out) {
+    format_tcp_info(fd, info, info_len);
+  }
+
+  close(fd);
+
   uint64_t nanodiff
        = time_finish.tv_nsec + time_finish.tv_sec * (1000*1000*1000)
        - (time_start.tv_nsec + time_start.tv_sec * (1000*1000*1000));
@@ -295,11 +557,38 @@ static void do_client(const char *addr, uint16_t port)
     printf("Time difference: %d secs, %ld nsecs\n", secs, nsecs);
     printf("Time difference: %f msecs\n", f_msecs);
   }
-  else {
-    printf("%f\n", f_msecs);
-  }
+
+  return f_msecs;
 }
 
+// Format the TCP_INFO fields of fd as " name=value" pairs.
+static void format_tcp_info(int fd, char *info, size_t info_len)
+{
+  struct tcp_info_ext ti;
+  socklen_t len = sizeof(ti);
+
+  memset(&ti, 0, sizeof(ti));
+  if (getsockopt(fd, IPPROTO_TCP, TCP_INFO, &ti, &len)) {
+    len = 0;
+  }
+
+  long long delivery_rate = HAS_FIELD(len, tcpi_delivery_rate)
+                            ? (long long)ti.tcpi_delivery_rate : -1;
+  long long bytes_acked = HAS_FIELD(len, tcpi_bytes_acked)
+                          ? (long long)ti.tcpi_bytes_acked : -1;
+  if (len < sizeof(ti.base)) {
+    snprintf(info, info_len, " retransmits=-1 total_retrans=-1 rtt_us=-1"
+             " rttvar_us=-1 snd_cwnd=-1 snd_ssthresh=-1 delivery_rate=-1"
+             " bytes_acked=-1");
+    return;
+  }
+  snprintf(info, info_len,
+           " retransmits=%u total_retrans=%u rtt_us=%u rttvar_us=%u"
+           " snd_cwnd=%u snd_ssthresh=%u delivery_rate=%lld bytes_acked=%lld",
+           ti.base.tcpi_retransmits, ti.base.tcpi_total_retrans,
+           ti.base.tcpi_rtt, ti.base.tcpi_rttvar, ti.base.tcpi_snd_cwnd,
+           ti.base.tcpi_snd_ssthresh, delivery_rate, bytes_acked);
+}
 
 static void set_rc3_options(int sock_fd)
 {
@@ -332,3 +621,17 @@ static void set_rc3_options(int sock_fd)
   }
 }
 
+static void set_congestion_control(int sock_fd)
+{
+  if (congestion_control == NULL) {
+    return;
+  }
+
+  vprintf("Setting congestion control to %s.\n", congestion_control);
+  if (setsockopt(sock_fd, IPPROTO_TCP, TCP_CONGESTION, congestion_control,
+                 strlen(congestion_control))) {
+    fprintf(stderr, "[ERROR] setting congestion control to %s.\n",
+            congestion_control);
+    exit(EXIT_FAILURE);
+  }
+}
@@ -1,28 +1,6 @@
 #!/usr/bin/env python
 # a bar plot with errorbars
 import numpy as np
-import matplotlib.pyplot as plt
-
-def avg(s):
-    '''Compute average of list or string of values. From CS244 lab 2.'''
-    if ',' in s:
-        lst = [float(f) for f in s.split(',')]
-    elif type(s) == str:
-        lst = [float(s)]
-    elif type(s) == list:
-        lst = s
-    return sum(lst)/len(lst)
-
-def stddev(s):
-    '''Compute stddev of list or string of values. Adapted from avg().'''
-    if ',' in s:
-        lst = [float(f) for f in s.split(',')]
-    elif type(s) == str:
-        lst = [float(s)]
-    elif type(s) == list:
-        lst = s
-
-    return np.std(lst)
 
 def figure15a_paper_data():
     '''Populate data struct for plot, using data from figure 15a in paper.
@@ -186,13 +164,15 @@ def figure15b_paper_data():
 
 
 def plotBarClusers(plot_data, flow_types, flow_type_colors, title="",
-                   fig_file_name = None):
+                   fig_file_name = None, value='mean', error='stddev'):
     '''Make a bar chart plot of organized plot_data.
 
     Designed in the style of figure 15 of paper Mittal, et. al. "Recursively
     Cautious Congestion Control," 2014.
 
-    The bars are of height "mean" and error bars for "stddev".
+    By default the bars are of height "mean" and error bars for "stddev",
+    but any statistic present in the data can be plotted, see value and
+    error below, and fct_stats.py for the statistics the tests record.
     The x-axis is arranged by flow_length, and for each flow_length
     a group of bars is made, representing each flow type (Simulated TCP,
     Real RC3, etc.)
@@ -213,8 +193,17 @@ def plotBarClusers(plot_data, flow_types, flow_type_colors, title="",
         flow type and their legend entry.
     title: Title to print on the graph.
     fig_file_name: If not None, will save as file with this name.
+    value: The statistic to use for bar heights, e.g. 'mean' or 'p99'.
+    error: The statistic to use for error bars. Either one name, e.g.
+        'stddev', for symmetric error bars, or a (low, high) pair of names
+        giving the ends of the error bar, e.g. ('ci_low', 'ci_high').
+        Bars lacking the statistic (e.g. paper data) get no error bar, and
+        bars lacking the value statistic are left out.
     '''
 
+    # Imported here so measuring processes never load matplotlib.
+    import matplotlib.pyplot as plt
+
     flow_lens = sorted(plot_data.keys())
 
     fig, ax = plt.subplots()
@@ -227,25 +216,37 @@ def plotBarClusers(plot_data, flow_types, flow_type_colors, title="",
     for flow_type in flow_types:
         ind_count = 0
         ind = np.array([])
-        means = []
-        stddevs = []
+        values = []
+        err_lo = []
+        err_hi = []
         for flow_len in flow_lens:
             # Add bar if there is one of this type for this flow len
-            if flow_type in plot_data[flow_len]:
+            cell = plot_data[flow_len].get(flow_type, {})
+            if value in cell:
                 ind = np.append(ind, ind_count)
-                means.append(plot_data[flow_len][flow_type]['mean'])
-                stddevs.append(plot_data[flow_len][flow_type]['stddev'])
+                v = cell[value]
+                values.append(v)
+                if isinstance(error, basestring):
+                    e = cell.get(error, 0)
+                    err_lo.append(e)
+                    err_hi.append(e)
+                else:
+                    err_lo.append(v - cell.get(error[0], v))
+                    err_hi.append(cell.get(error[1], v) - v)
             ind_count += 1;
 
         # Draw bars for this flow type. Save rects/labels for legend.
-        rects += (ax.bar(ind+width*type_count, means, width,
-                         color=flow_type_colors[flow_type], yerr=stddevs),)
+        rects += (ax.bar(ind+width*type_count, values, width,
+                         color=flow_type_colors[flow_type],
+                         yerr=[err_lo, err_hi]),)
         rect_labels += (flow_type,)
 
         type_count += 1
 
     # add some text for labels, title and axes ticks
-    ax.set_ylabel('Average FCT (secs)')
+    ylabels = {'mean': 'Average', 'median': 'Median',
+               'p95': '95th Percentile', 'p99': '99th Percentile'}
+    ax.set_ylabel('%s FCT (secs)' % ylabels.get(value, value))
     ax.set_title(title)
     ind = np.array(range(len(flow_lens)))
     ax.set_xticks(ind+width*len(flow_types)/2)
@@ -258,6 +259,7 @@ def plotBarClusers(plot_data, flow_types, flow_type_colors, title="",
       plt.savefig(fig_file_name)
 
     #plt.show()
+    plt.close(fig)
 
 if __name__ == "__main__":
     '''Debug mode function to test code above.'''
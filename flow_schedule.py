@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''Run a schedule of iperf3 flows, launched at precise times.
+
+A schedule is a list of ScheduledFlows, each saying when (in seconds from
+the start of the scenario) a flow starts, between which hosts, with which
+ToS value and for how long. runSchedule() launches every flow against a
+monotonic clock, so the time spent spawning one flow doesn't delay the
+next, and records when each flow was actually launched.
+
+The launch records are saved next to the iperf3 output (see
+writeLaunches()) and used to line up the flows' throughput when plotting,
+instead of assuming each flow started exactly on schedule.
+'''
+
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import json
+import time
+import os
+import tracing
+
+# start: Seconds from the start of the scenario at which to launch the flow.
+# src, dst: Sending and receiving host names, without any node name prefix.
+# name: Name of the flow, e.g. 'hi' or 'lo'. Unique within a schedule.
+# tos: ToS value to send with, e.g. '0x04'.
+# length: Number of seconds the flow runs for.
+ScheduledFlow = namedtuple('ScheduledFlow', 'start src dst name tos length')
+
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _clockGettime():
+    '''clock_gettime() from the C library, or None if unavailable.'''
+    for name in [ctypes.util.find_library('rt'), ctypes.util.find_library('c')]:
+        if name is None:
+            continue
+        try:
+            func = getattr(ctypes.CDLL(name, use_errno=True), 'clock_gettime')
+        except (OSError, AttributeError):
+            continue
+        func.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        return func
+    return None
+
+_clock_gettime = _clockGettime()
+
+def monotonic():
+    '''Seconds from a monotonic clock, unaffected by system time changes.'''
+    if _clock_gettime is None:
+        return time.time()
+    t = _Timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        return time.time()
+    return t.tv_sec + t.tv_nsec * 1e-9
+
+def flowPorts(schedule, base=5001):
+    '''Assign each flow of schedule its own iperf3 port, in schedule order.'''
+    return dict((flow.name, base + i) for (i, flow) in enumerate(schedule))
+
+def runSchedule(net, schedule, ports, interval, ps, sleep=None, prefix=''):
+    '''Launch the iperf3 clients of schedule at their start times.
+
+    Their servers must already be running on the flows' dst hosts.
+
+    Args:
+        net: Mininet net object.
+        schedule: List of ScheduledFlows.
+        ports: Dictionary of flow name to iperf3 server port.
+        interval: Number of seconds between each iperf3 output.
+        ps: Dictionary of the run's processes. Each client is added as
+            ps[name + 'perf'].
+        sleep: Function sleeping for a number of seconds, returning False
+            if the scenario should be aborted. Defaults to time.sleep.
+        prefix: Name prefix of the nodes in net.
+
+    Returns a list of launch records, one dictionary per launched flow, with
+    the flow's fields plus 'planned' and 'launched' (seconds from the start
+    of the scenario) and 'wall' (Unix time of the launch). Flows after an
+    abort are not launched.
+    '''
+    launches = []
+    t0 = monotonic()
+    for flow in sorted(schedule, key=lambda f: f.start):
+        delay = t0 + flow.start - monotonic()
+        if delay > 0:
+            if sleep is None:
+                time.sleep(delay)
+            elif not sleep(delay):
+                break
+        src, dst = net.getNodeByName(prefix + flow.src, prefix + flow.dst)
+        print 'launching %s iperf from %s to %s' % (flow.name, flow.src,
+                                                   flow.dst)
+        wall = time.time()
+        launched = monotonic() - t0
+        # No shell in between, so killing the process kills iperf3. The
+        # server's output is the result; nothing reads the client's.
+        with open(os.devnull, 'w') as devnull:
+            ps[flow.name + 'perf'] = tracing.popen(
+                src, 'iperf3 -c %s -p %d -i %f -t %d -S %s -J'
+                % (dst.IP(), ports[flow.name], interval, flow.length,
+                   flow.tos), flow.name + 'perf', stdout=devnull)
+        record = flow._asdict()
+        record.update(planned=flow.start, launched=launched, wall=wall)
+        launches.append(record)
+    return launches
+
+def writeLaunches(filename, launches):
+    '''Save launch records from runSchedule() as JSON.'''
+    with open(filename, 'w') as f:
+        json.dump(launches, f, indent=1)
+
+def readLaunches(filename):
+    '''Load launch records saved by writeLaunches().'''
+    with open(filename) as f:
+        return json.load(f)
+
+def launchOffsets(launches):
+    '''Seconds from the first launch to each flow's launch, by flow name.'''
+    if not launches:
+        return {}
+    first = min(l['launched'] for l in launches)
+    return dict((l['name'], l['launched'] - first) for l in launches)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+'''Incremental parsing of iperf3 JSON output into NumPy arrays.
+
+Handles both the single JSON document written by iperf3 -J, and the line
+delimited events written by iperf3 --json-stream. Either way the input is
+read in chunks and each interval is decoded on its own, so memory use
+depends on the number of intervals kept (a few numbers each), not on the
+size of the file.
+'''
+
+import json
+import numpy as np
+
+CHUNK_SIZE = 64 * 1024
+
+# Per-interval fields kept by readIntervals(), taken from streams[n].
+INTERVAL_FIELDS = [('start', np.float64),
+                   ('end', np.float64),
+                   ('bytes', np.int64),
+                   ('bits_per_second', np.float64)]
+
+
+def _documentEvents(f, buf):
+    '''Events from a single iperf3 -J document, read incrementally.
+
+    Everything before the "intervals" array (which holds the "start"
+    object) is decoded at once. Then the array's items are decoded one by
+    one, reading more input only when an item is incomplete. Whatever
+    follows the array (the "end" object) is not parsed.
+    '''
+    decoder = json.JSONDecoder()
+
+    # Find the start of the intervals array.
+    key = '"intervals"'
+    while True:
+        k = buf.find(key)
+        if k != -1:
+            colon = buf.find(':', k + len(key))
+            bracket = buf.find('[', colon + 1) if colon != -1 else -1
+            if bracket != -1:
+                break
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        buf += chunk
+
+    head = buf[:k].rstrip().rstrip(',') + '}'
+    try:
+        start = json.loads(head).get('start')
+    except ValueError:
+        start = None
+    if start is not None:
+        yield ('start', start)
+
+    buf = buf[bracket + 1:]
+    pos = 0
+    while True:
+        # Skip to the next item, or the end of the array.
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            (item, end) = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # Item is incomplete, so read more and try again.
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield ('interval', item)
+        pos = end
+        if pos > CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+def _streamEvents(f, first_line):
+    '''Events from iperf3 --json-stream output, one JSON object per line.'''
+    line = first_line
+    while line:
+        line = line.strip()
+        if line:
+            event = json.loads(line)
+            yield (event.get('event'), event.get('data'))
+        line = f.readline()
+
+def iperfEvents(f):
+    '''Generate (event, data) pairs from iperf3 -J or --json-stream output.
+
+    The events used are 'start', with the iperf3 "start" object, and
+    'interval', with one entry of the "intervals" array. --json-stream
+    output also gives its other events, such as 'end'.
+
+    Args:
+        f: A file object, e.g. an open file or the stdout of a running
+            iperf3 process.
+    '''
+    first = f.readline()
+    while first and not first.strip():
+        first = f.readline()
+    # --json-stream events are whole objects on one line, each with an
+    # "event" key. A -J document's first line is just its opening brace.
+    stripped = first.strip()
+    if stripped.startswith('{') and stripped.endswith('}') and \
+            '"event"' in stripped:
+        return _streamEvents(f, first)
+    return _documentEvents(f, first)
+
+class IntervalArrays(object):
+    '''Growable NumPy arrays of interval fields, preallocated in blocks.'''
+
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.arrays = dict((name, np.empty(capacity, dtype=dtype))
+                           for (name, dtype) in INTERVAL_FIELDS)
+
+    def append(self, stream):
+        '''Add one interval, from an iperf3 stream (or sum) dictionary.'''
+        if self.count == len(self.arrays['start']):
+            for (name, a) in self.arrays.items():
+                self.arrays[name] = np.resize(a, 2 * len(a))
+        for (name, _) in INTERVAL_FIELDS:
+            self.arrays[name][self.count] = stream[name]
+        self.count += 1
+
+    def result(self):
+        '''The filled part of each array, as a dictionary.'''
+        return dict((name, a[:self.count]) for (name, a) in self.arrays.items())
+
+def readIntervals(source, stream=0, capacity=1024):
+    '''Read the intervals of iperf3 JSON output into NumPy arrays.
+
+    Args:
+        source: A file name or file object, with -J or --json-stream output.
+        stream: Index of the stream to use, or None for the interval sums.
+        capacity: Number of intervals to preallocate room for.
+
+    Returns a dictionary with an array for each of INTERVAL_FIELDS, and
+    'timesecs', the test start time (Unix seconds) or None if unknown.
+    '''
+    if isinstance(source, basestring):
+        with open(source) as f:
+            return readIntervals(f, stream, capacity)
+
+    arrays = IntervalArrays(capacity)
+    timesecs = None
+    for (event, data) in iperfEvents(source):
+        if event == 'start':
+            timesecs = data.get('timestamp', {}).get('timesecs')
+        elif event == 'interval':
+            arrays.append(data['sum'] if stream is None
+                          else data['streams'][stream])
+    result = arrays.result()
+    result['timesecs'] = timesecs
+    return result
+
+def throughputSeries(intervals, duration, offset):
+    '''Times and throughputs (Mbps) of intervals, shifted by offset.
+
+    Intervals ending after duration, once shifted, are dropped.
+
+    Returns (times, mbps) arrays.
+    '''
+    X = intervals['end'] + offset
+    keep = X <= duration
+    return (X[keep], intervals['bits_per_second'][keep] / 1000000.0)
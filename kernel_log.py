@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+'''Stream the RC3 kernel's per socket log records, flow by flow.
+
+fcttest -l sets SO_LOGME on its sockets (and -t SO_LOGTIME), so the RC3
+kernel logs their packets with printk. A KernelLog thread reads these
+records from /dev/kmsg as they are written, instead of scraping dmesg
+afterwards, so records aren't lost to the ring buffer wrapping during long
+flows, and nothing but the records themselves is parsed.
+
+Each flow is bracketed by marker records, which the harness writes to
+/dev/kmsg before and after it:
+
+    log = KernelLog()
+    log.start()
+    log.begin('flow 1')
+    ... run the flow ...
+    (records, lost) = log.end('flow 1')
+    log.stop()
+
+The kernel timestamps the markers like any other record, so a record's
+time in the flow needs no clock conversion. The kernel log is shared by
+every network namespace, so only one flow can be logged at a time. Writes
+to /dev/kmsg are rate limited by default (10 per 5 s), so the
+kernel.printk_devkmsg sysctl is set to 'on' until stop().
+
+records is a list of (t_ms, level, seq): the time since the begin marker,
+the RC3 priority level the packet went out at (0 is regular TCP), and its
+sequence number, or None if the record doesn't give one. Records are parsed
+with a pattern, RC3_LOG_PATTERN by default, and RC3_SEQ_PATTERN; lines not
+matching the first are ignored, so other kernel messages cost one regular
+expression search.
+
+The RC3 kernel's printk format string is not part of this tree, so
+RC3_LOG_PATTERN is not the kernel's format: it loosely matches any message
+naming RC3 and a priority level (e.g. 'rc3 ... level=2 seq=1234'). Give the
+kernel's own format as the pattern (rc3test.py --rc3-log-pattern), a
+regular expression with a 'level' group and optionally a 'seq' group. A
+flow with no matching records at all most likely means the pattern doesn't
+fit, so end() warns about it rather than report an empty timeline.
+
+The cost is bounded and reported: at most max_records are kept per flow,
+and lost counts the records over that, or overwritten in the kernel's ring
+buffer before they could be read (at least one per overrun, as the kernel
+doesn't say how many). stop() prints the totals read and the time the
+thread spent reading and parsing.
+'''
+
+import threading
+import select
+import errno
+import time
+import re
+import os
+
+# A packet record of the RC3 kernel: mentions RC3, and its priority level.
+# Not the kernel's format string, see the module docstring.
+RC3_LOG_PATTERN = re.compile(r'\brc3\b.*?\b(?:level|prio|priority)[=: ]+'
+                             r'(?P<level>\d+)', re.I)
+RC3_SEQ_PATTERN = re.compile(r'\bseq[=: ]+(?P<seq>\d+)', re.I)
+
+# Prefix of the marker records written by begin() and end().
+MARKER = 'rc3test: '
+
+# Records kept per flow, beyond which they are counted as lost.
+MAX_RECORDS = 100000
+
+DEVKMSG_SYSCTL = '/proc/sys/kernel/printk_devkmsg'
+
+
+class KernelLog(threading.Thread):
+    '''Background thread collecting RC3 log records between markers.'''
+
+    def __init__(self, max_records=MAX_RECORDS, path='/dev/kmsg',
+                 pattern=None):
+        '''
+        Args:
+            max_records: Records kept per flow.
+            path: The kernel log device.
+            pattern: Regular expression of an RC3 packet record, with a
+                'level' group and optionally a 'seq' group, or None for
+                RC3_LOG_PATTERN.
+        '''
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.max_records = max_records
+        self.pattern = RC3_LOG_PATTERN if pattern is None else \
+            re.compile(pattern, re.I)
+        self.read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Only records written from now on.
+        os.lseek(self.read_fd, 0, os.SEEK_END)
+        self.write_fd = os.open(path, os.O_WRONLY)
+        self.devkmsg = None
+        if os.path.exists(DEVKMSG_SYSCTL):
+            with open(DEVKMSG_SYSCTL) as f:
+                self.devkmsg = f.read().strip()
+            with open(DEVKMSG_SYSCTL, 'w') as f:
+                f.write('on\n')
+        self.stopping = threading.Event()
+        self.done = threading.Condition()
+        self.results = {}
+        self.label = None
+        self.records = []
+        self.lost = 0
+        self.start_us = 0
+        # Totals, for the cost report.
+        self.read_records = 0
+        self.read_bytes = 0
+        self.rc3_records = 0
+        self.overruns = 0
+        self.busy = 0.0
+
+    def begin(self, label):
+        '''Start collecting the records of the flow named label.'''
+        os.write(self.write_fd, '%sbegin %s\n' % (MARKER, label))
+
+    def end(self, label, timeout=5.0):
+        '''Stop collecting, returning (records, lost) of the flow.
+
+        Waits up to timeout seconds for the reader to catch up, and
+        returns what it has so far if it doesn't. Warns if the flow had no
+        RC3 records at all.
+        '''
+        os.write(self.write_fd, '%send %s\n' % (MARKER, label))
+        deadline = time.time() + timeout
+        with self.done:
+            while label not in self.results and time.time() < deadline:
+                self.done.wait(deadline - time.time())
+            if label in self.results:
+                (records, lost) = self.results.pop(label)
+            else:
+                print "[WARNING]: kernel log end marker of %s not seen" \
+                      % label
+                (records, lost) = (list(self.records), self.lost)
+        if not records and not lost:
+            print "[WARNING]: no RC3 kernel log records for %s; is this " \
+                  "the RC3 kernel, and does --rc3-log-pattern match its " \
+                  "records?" % label
+        return (records, lost)
+
+    def run(self):
+        while not self.stopping.is_set():
+            (ready, _, _) = select.select([self.read_fd], [], [], 0.1)
+            if ready:
+                start = time.time()
+                self._drain()
+                self.busy += time.time() - start
+
+    def _drain(self):
+        '''Read every record available. Each read returns one record.'''
+        while True:
+            try:
+                data = os.read(self.read_fd, 8192)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return
+                if e.errno == errno.EPIPE:
+                    # Overwritten before we read them; reading resumes
+                    # with the oldest record left.
+                    self.overruns += 1
+                    with self.done:
+                        self.lost += 1
+                    continue
+                raise
+            if not data:
+                return
+            self.read_records += 1
+            self.read_bytes += len(data)
+            self._record(data)
+
+    def _record(self, data):
+        '''Handle one record: 'prio,seq,usecs,flags;message\\n ...'.'''
+        (header, _, message) = data.partition(';')
+        message = message.split('\n', 1)[0]
+        usecs = int(header.split(',')[2])
+        if message.startswith(MARKER):
+            (kind, _, label) = message[len(MARKER):].partition(' ')
+            with self.done:
+                if kind == 'begin':
+                    (self.label, self.records, self.lost) = (label, [], 0)
+                    self.start_us = usecs
+                elif kind == 'end' and label == self.label:
+                    self.results[label] = (self.records, self.lost)
+                    (self.label, self.records, self.lost) = (None, [], 0)
+                    self.done.notify_all()
+            return
+        match = self.pattern.search(message)
+        if match is None:
+            return
+        self.rc3_records += 1
+        if self.label is None:
+            return
+        with self.done:
+            if len(self.records) >= self.max_records:
+                self.lost += 1
+                return
+            if 'seq' in self.pattern.groupindex:
+                seq = match
+            else:
+                seq = RC3_SEQ_PATTERN.search(message)
+            self.records.append(((usecs - self.start_us) / 1000.0,
+                                 int(match.group('level')),
+                                 int(seq.group('seq'))
+                                 if seq and seq.group('seq') else None))
+
+    def stop(self):
+        '''Stop the thread, and print what reading the log cost.'''
+        self.stopping.set()
+        self.join()
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+        if self.devkmsg is not None:
+            with open(DEVKMSG_SYSCTL, 'w') as f:
+                f.write(self.devkmsg + '\n')
+        print "kernel log: %d records (%d RC3), %.1f kB read, %d overruns, " \
+              "%.3f s reading" % (self.read_records, self.rc3_records,
+                                  self.read_bytes / 1000.0, self.overruns,
+                                  self.busy)
+
+def levelCounts(records):
+    '''Number of records at each priority level, as a dictionary.'''
+    counts = {}
+    for (t_ms, level, seq) in records:
+        counts[level] = counts.get(level, 0) + 1
+    return counts
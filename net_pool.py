@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''Keep configured Mininet networks alive between test runs.
+
+Bringing up a network (namespaces, links, switches and qdiscs) takes much
+longer than resetting one. A NetPool builds each network once, the first
+time its key is asked for, and between runs only resets the state a run
+leaves behind:
+
+  * processes of the previous run that are still running are killed,
+    as is any iperf3 or fcttest process left in a host's namespace, e.g.
+    a server whose client never came, so the next run gets its ports,
+  * the TCP metrics cache and conntrack table of every host are flushed,
+    so a run doesn't start with the previous run's cwnd or ssthresh, and
+  * the qdisc trees applied with tc_batch.applyTrees() are rebuilt, which
+    zeroes their counters.
+
+Usage:
+    pool = NetPool()
+    net = pool.get(key, build)   # build() returns a started, configured net
+    ... run a test, collecting its processes in ps ...
+    pool.release(key, ps.values())
+    ... more runs on the same or other keys ...
+    pool.stop()
+'''
+
+import time
+from tc_batch import resetTrees
+from tracing import span
+
+# Programs whose processes are killed in every host between runs.
+LEFTOVER_PROGRAMS = ['iperf3', 'fcttest']
+
+
+class NetPool(object):
+    '''Started networks, by key, reset between uses.'''
+
+    def __init__(self):
+        self.nets = {}
+
+    def get(self, key, build):
+        '''The network for key, calling build() to create it the first time.
+
+        Args:
+            key: Hashable description of the network, e.g. the topology
+                class and its parameters.
+            build: Function returning a started and configured network.
+        '''
+        if key not in self.nets:
+            start = time.time()
+            with span('net.build'):
+                self.nets[key] = build()
+            print "network up in %.2f s" % (time.time() - start)
+        return self.nets[key]
+
+    def release(self, key, procs=()):
+        '''Finish a run on key's network, and reset it for the next run.
+
+        Args:
+            key: The key the network was got with.
+            procs: The run's processes. Any still running are killed.
+        '''
+        start = time.time()
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        with span('net.reset'):
+            resetNet(self.nets[key])
+        print "network reset in %.2f s" % (time.time() - start)
+
+    def stop(self):
+        '''Stop every network in the pool.'''
+        for net in self.nets.values():
+            with span('net.stop'):
+                net.stop()
+        self.nets = {}
+
+def resetNet(net):
+    '''Reset the per-run state of a network. See the module docstring.'''
+    for host in net.hosts:
+        killLeftovers(host)
+        host.cmd('ip tcp_metrics flush all 2> /dev/null;'
+                 ' conntrack -F 2> /dev/null')
+    for node in net.hosts + net.switches:
+        resetTrees(node)
+
+def killLeftovers(host, programs=LEFTOVER_PROGRAMS):
+    '''Kill the processes of programs running in host's network namespace.
+
+    Hosts share the process namespace, so killall would also kill those of
+    other networks running in parallel. Instead, only processes whose
+    network namespace is the host's are killed.
+    '''
+    host.cmd('ns=$(readlink /proc/self/ns/net);'
+             ' for pid in $(pgrep -x "%s"); do'
+             ' [ "$(readlink /proc/$pid/ns/net)" = "$ns" ] &&'
+             ' kill -9 $pid; done 2> /dev/null' % '|'.join(programs))
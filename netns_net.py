@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+'''Lightweight networks of network namespaces, veth pairs and bridges.
+
+A Mininet network brings along Open vSwitch, a controller and a shell
+process per node. The FCT tests only need two hosts and one forwarding hop
+with qdiscs on them, which plain kernel objects provide:
+
+  * each host and switch is a network namespace,
+  * each link is a veth pair, named as Mininet names interfaces
+    (h1-eth0, s1-eth1, ...), and
+  * each switch is a Linux bridge over its ports, in its namespace.
+
+NsNet has the part of the Mininet net and node interface the tests use:
+net.start(), net.stop(), net.getNodeByName(), net.hosts, net.switches, and
+node.cmd(), node.popen(), node.IP() and node.name. It builds a network in
+milliseconds, needs only root and iproute2, and has no forwarding daemon
+to add jitter.
+
+Usage:
+    net = rc3Net()          # or NsNet(), then addHost/addSwitch/addLink
+    net.start()
+    h1, h2 = net.getNodeByName('h1', 'h2')
+    print h1.cmd('ping -c 1', h2.IP())
+    net.stop()
+'''
+
+from subprocess import Popen, PIPE, STDOUT
+import shlex
+import time
+import os
+from parallel_runner import pairPrefixes
+
+
+class NsNode(object):
+    '''A host or switch: a network namespace, with commands run in it.'''
+
+    def __init__(self, name, ns, ip=None):
+        '''
+        Args:
+            name: Node name, e.g. 'h1' or 'j3s1'.
+            ns: Name of the node's network namespace.
+            ip: IPv4 address of a host's first interface, None for switches.
+        '''
+        self.name = name
+        self.ns = ns
+        self.ip = ip
+        self.intfs = []
+
+    def IP(self):
+        '''The node's IPv4 address, as in Mininet.'''
+        return self.ip
+
+    def intfNames(self):
+        '''Names of the node's interfaces, in creation order.'''
+        return list(self.intfs)
+
+    def cmd(self, *args):
+        '''Run a shell command in the node, returning its combined output.
+
+        Arguments are joined with spaces, as in Mininet.
+        '''
+        p = Popen(['ip', 'netns', 'exec', self.ns, 'sh', '-c',
+                   ' '.join(str(a) for a in args)], stdout=PIPE,
+                  stderr=STDOUT)
+        (out, _) = p.communicate()
+        return out
+
+    def popen(self, cmd, **kwargs):
+        '''Start a process in the node, returning its Popen object.
+
+        As in Mininet, stdout and stderr are pipes unless given, and cmd is
+        split on whitespace unless shell=True.
+        '''
+        if kwargs.pop('shell', False):
+            argv = ['sh', '-c', cmd]
+        elif isinstance(cmd, basestring):
+            argv = shlex.split(cmd)
+        else:
+            argv = list(cmd)
+        kwargs.setdefault('stdout', PIPE)
+        kwargs.setdefault('stderr', PIPE)
+        return Popen(['ip', 'netns', 'exec', self.ns] + argv, **kwargs)
+
+    def batch(self, commands):
+        '''Run ip commands (without the leading 'ip') in the node at once.'''
+        run(['ip', '-n', self.ns, '-batch', '-'], commands)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.name)
+
+def run(argv, commands=()):
+    '''Run argv, feeding it commands one per line, raising on failure.'''
+    p = Popen(argv, stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+    (out, _) = p.communicate(''.join(c + '\n' for c in commands))
+    if p.returncode != 0:
+        raise RuntimeError('%s failed: %s' % (' '.join(argv), out.strip()))
+    return out
+
+class NsNet(object):
+    '''A network of NsNodes. See module docstring.'''
+
+    def __init__(self, prefix=''):
+        '''
+        Args:
+            prefix: Name prefix of the nodes, as in Mininet based tests
+                running at once. Namespace names also include the process
+                id, so separate runs never collide.
+        '''
+        self.prefix = prefix
+        self.hosts = []
+        self.switches = []
+        self.links = []
+        self.nodes = {}
+        self.stp = set()
+        self.started = False
+
+    def _addNode(self, name, ip=None):
+        ns = 'rc3-%d-%s' % (os.getpid(), name)
+        node = NsNode(name, ns, ip)
+        self.nodes[name] = node
+        return node
+
+    def addHost(self, name):
+        '''Add a host, addressed 10.0.0.<n> for the n-th host, as in Mininet.'''
+        host = self._addNode(name, '10.0.0.%d' % (len(self.hosts) + 1))
+        self.hosts.append(host)
+        return host
+
+    def addSwitch(self, name, stp=False):
+        '''Add a switch, bridging all of its ports.
+
+        Switches in a network with loops need stp=True, to run the spanning
+        tree protocol. Their ports then take a few seconds to forward.
+        '''
+        switch = self._addNode(name)
+        self.switches.append(switch)
+        if stp:
+            self.stp.add(switch)
+        return switch
+
+    def addLink(self, node1, node2):
+        '''Link two nodes, by name, with a veth pair.'''
+        self.links.append((self.nodes[node1], self.nodes[node2]))
+
+    def _newIntf(self, node):
+        '''The next interface name of node: host ports from 0, switch from 1.'''
+        base = 1 if node in self.switches else 0
+        intf = '%s-eth%d' % (node.name, base + len(node.intfs))
+        node.intfs.append(intf)
+        return intf
+
+    def getNodeByName(self, *names):
+        '''The named node, or a list of the named nodes.'''
+        if len(names) == 1:
+            return self.nodes[names[0]]
+        return [self.nodes[name] for name in names]
+
+    def start(self):
+        '''Create the namespaces, links and bridges, and bring them up.'''
+        nodes = self.hosts + self.switches
+        commands = ['netns add %s' % node.ns for node in nodes]
+        # Give the two ends of each veth different ifindexes. Otherwise both
+        # are 2, the first in their fresh namespaces, and the kernel then
+        # reports their carrier up to a second late.
+        for (i, (node1, node2)) in enumerate(self.links):
+            commands.append('link add %s netns %s index %d type veth'
+                            ' peer name %s netns %s index %d'
+                            % (self._newIntf(node1), node1.ns, 100 + 2 * i,
+                               self._newIntf(node2), node2.ns, 101 + 2 * i))
+        run(['ip', '-batch', '-'], commands)
+        self.started = True
+
+        for node in nodes:
+            # No IPv6 neighbor discovery or router solicitations to add
+            # traffic of their own.
+            node.cmd('sysctl -qw net.ipv6.conf.all.disable_ipv6=1'
+                     ' net.ipv6.conf.default.disable_ipv6=1')
+            commands = ['link set lo up']
+            if node in self.switches:
+                # The shortest forward delay STP allows, 2 s.
+                commands.append('link add name %s type bridge%s' % (
+                    node.name, ' stp_state 1 forward_delay 200'
+                    if node in self.stp else ''))
+                commands += ['link set %s master %s' % (intf, node.name)
+                             for intf in node.intfs]
+                commands.append('link set %s up' % node.name)
+            elif node.intfs:
+                commands.append('addr add %s/8 dev %s'
+                                % (node.ip, node.intfs[0]))
+            commands += ['link set %s up' % intf for intf in node.intfs]
+            node.batch(commands)
+        self.waitConnected()
+
+    def waitConnected(self, timeout=5.0):
+        '''Wait until every interface has carrier, and bridges forward.
+
+        The kernel can take up to a second to report carrier on a new veth,
+        and a bridge drops traffic on a port until then, or with STP, until
+        the port is done listening and learning. Returns whether everything
+        came up within timeout seconds.
+        '''
+        if self.stp:
+            timeout += 10.0
+        deadline = time.time() + timeout
+        waiting = [node for node in self.hosts + self.switches if node.intfs]
+        while waiting:
+            waiting = [node for node in waiting if not self._connected(node)]
+            if waiting and time.time() > deadline:
+                print "[WARNING]: no carrier on", \
+                    ', '.join(node.name for node in waiting)
+                return False
+            if waiting:
+                time.sleep(0.01)
+        return True
+
+    def _connected(self, node):
+        '''Whether all of node's interfaces are up and forwarding.'''
+        if 'NO-CARRIER' in run(['ip', '-n', node.ns, '-o', 'link', 'show']):
+            return False
+        if node in self.stp:
+            ports = run(['bridge', '-n', node.ns, 'link', 'show'])
+            return 'state listening' not in ports and \
+                'state learning' not in ports and \
+                'state disabled' not in ports
+        return True
+
+    def stop(self):
+        '''Kill every process in the network, and delete its namespaces.'''
+        if not self.started:
+            return
+        for node in self.hosts + self.switches:
+            pids = run(['ip', 'netns', 'pids', node.ns]).split()
+            if pids:
+                Popen(['kill', '-9'] + pids).wait()
+        run(['ip', '-force', '-batch', '-'],
+            ['netns del %s' % node.ns for node in self.hosts + self.switches])
+        for node in self.hosts + self.switches:
+            node.intfs = []
+        self.started = False
+
+def rc3Net(prefix='', pairs=1):
+    '''An NsNet with RC3Topo's layout: h1 - s1 - h2, for each host pair.'''
+    net = NsNet(prefix)
+    for p in pairPrefixes(prefix, pairs):
+        net.addHost(p + 'h1')
+        net.addHost(p + 'h2')
+        net.addSwitch(p + 's1')
+        net.addLink(p + 'h1', p + 's1')
+        net.addLink(p + 's1', p + 'h2')
+    return net
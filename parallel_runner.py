@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+'''Run independent experiment jobs in parallel, in separate processes.
+
+Each job is a (function, args, kwargs) tuple. Jobs are farmed out to a pool
+of worker processes, so each job can build and tear down its own Mininet
+network (and therefore its own set of network namespaces) without touching
+the others. Results come back in the same order as the jobs.
+
+The job functions must be defined at module level so they can be sent to
+the workers. Giving each job a distinct name prefix for its hosts, switches
+and interfaces is up to the caller, see jobPrefix().
+'''
+
+import multiprocessing
+import subprocess
+import traceback
+import os
+
+
+def jobPrefix(index):
+    '''Name prefix for the nodes of job number index, e.g. 'j3'.
+
+    Keep this short: Linux interface names are limited to 15 characters, and
+    Mininet names interfaces like '<prefix>s1-eth1'.
+    '''
+    return 'j%d' % index
+
+def pairPrefixes(prefix, pairs):
+    '''Name prefixes of the host pairs of a network, e.g. ['j3p0', 'j3p1'].
+
+    A network with one pair uses prefix itself, so its nodes are named as
+    before pairs existed.
+
+    Args:
+        prefix: Name prefix of the network, e.g. from jobPrefix().
+        pairs: Number of host pairs in the network.
+    '''
+    if pairs == 1:
+        return [prefix]
+    return [prefix + 'p%d' % i for i in range(pairs)]
+
+def pinToCpus(cpus, pid=None):
+    '''Pin a process (default: this one) to the given CPU list.
+
+    Processes started afterwards by the pinned process, e.g. the Mininet
+    host shells and everything they run, inherit the affinity.
+
+    Args:
+        cpus: A string in taskset list format, e.g. '3' or '0-1,4'.
+        pid: Process to pin, or None for the calling process.
+    '''
+    if pid is None:
+        pid = os.getpid()
+    subprocess.call('taskset -p -c %s %d > /dev/null' % (cpus, pid),
+                    shell=True)
+
+def _runJob(job, cpus):
+    '''Worker side wrapper: pin, run the job and report failures readably.'''
+    (func, args, kwargs) = job
+    if cpus is not None:
+        pinToCpus(cpus)
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        # Mininet exceptions don't always survive pickling back to the
+        # parent, so hand back the formatted traceback instead.
+        raise RuntimeError('job %s failed:\n%s'
+                           % (func.__name__, traceback.format_exc()))
+
+def runJobs(jobs, processes=None, cpus=None):
+    '''Run jobs in a process pool, returning their results in job order.
+
+    Args:
+        jobs: A list of (function, args, kwargs) tuples.
+        processes: Number of worker processes. Defaults to one per job.
+        cpus: Optional list of CPU lists (taskset format). Job i is pinned
+            to cpus[i % len(cpus)]. None disables pinning.
+    '''
+    if not jobs:
+        return []
+    if processes is None:
+        processes = len(jobs)
+
+    # A fresh worker per job, so no Mininet state leaks between jobs.
+    pool = multiprocessing.Pool(processes=processes, maxtasksperchild=1)
+    try:
+        pending = []
+        for (i, job) in enumerate(jobs):
+            job_cpus = cpus[i % len(cpus)] if cpus else None
+            pending.append(pool.apply_async(_runJob, (job, job_cpus)))
+        pool.close()
+        # get() with a timeout keeps the parent responsive to Ctrl-C.
+        results = [p.get(0xffffffff) for p in pending]
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+'''Per flow and per ToS statistics of header-only pcap captures.
+
+rc3test.py --capture runs tcpdump on the switch interfaces, keeping only
+the first CAPTURE_SNAPLEN bytes of each packet, enough for its Ethernet, IP
+and TCP headers. This reads such a capture back without loading it whole:
+
+    pcap_reader.py -i 0.01 results/capture_figure_15a_reno_s1-eth2.pcap
+
+The file is memory-mapped, and its TCP/IPv4 packets are parsed
+CHUNK_PACKETS at a time into NumPy arrays, which CaptureStats folds into
+its totals before the next chunk is read. Memory therefore grows with the
+number of flows and timeline bins, not with the size of the capture, so
+multi-gigabyte captures of long sweeps are fine.
+
+A flow is one direction of one TCP connection. A connection starts at its
+SYN, so a reused port number starts a new flow; flows whose SYN wasn't
+captured start at their first packet. For each flow, CaptureStats keeps:
+
+  * its packet and byte counts, and first and last packet times,
+  * retransmitted bytes: payload bytes sent beyond the flow's sequence
+    space. This counts RC3's low priority bands correctly, although they
+    send from the end of the flow backwards, as long as every byte of
+    the flow was seen once.
+  * its on-wire FCT: from its first payload packet to the last payload
+    packet of the connection in either direction, e.g. fcttest's token.
+    Only the direction that sent more payload has one.
+
+and the bytes on the wire (with headers) of every flow, ToS value and
+interval, from which tosTimeline() sums each ToS band over all flows.
+
+Times are Unix times, like the FCT sample timestamps in the sample store.
+The .npz written with -o, or by rc3test.py --capture, holds one array per
+FLOW_COLUMNS column (as 'flow_<name>'), the 'timeline_*' arrays of
+CaptureStats.timelineArrays(), and 'interval'.
+'''
+
+from argparse import ArgumentParser
+import struct
+import mmap
+import os
+import numpy as np
+
+# Packets parsed at once.
+CHUNK_PACKETS = 1 << 16
+
+# Default timeline interval, in seconds.
+DEFAULT_INTERVAL = 0.01
+
+# Magic number of a pcap file, to its timestamp fraction unit in seconds.
+PCAP_MAGICS = {0xa1b2c3d4: 1e-6, 0xa1b23c4d: 1e-9}
+
+# Link header length of the supported link types: Ethernet and Linux cooked
+# capture. Both end with the EtherType.
+LINK_HEADER_BYTES = {1: 14, 113: 16}
+
+ETHERTYPE_IP = 0x0800
+IPPROTO_TCP = 6
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+FLOW_COLUMNS = [('src',           np.int64),
+                ('sport',         np.int64),
+                ('dst',           np.int64),
+                ('dport',         np.int64),
+                # Sequence number of the first payload byte, the SYN's + 1.
+                ('base',          np.int64),
+                # Of the other direction, from the SYN-ACK's ack, or -1.
+                ('peer_base',     np.int64),
+                ('packets',       np.int64),
+                ('wire_bytes',    np.int64),
+                ('payload_bytes', np.int64),
+                # Highest payload byte, relative to base, plus one.
+                ('max_end',       np.int64),
+                ('first_ts',      np.float64),
+                ('last_ts',       np.float64),
+                ('first_data_ts', np.float64),
+                ('last_data_ts',  np.float64)]
+
+# Initial value of each column for a new flow, 0 if not listed.
+FLOW_INITIAL = {'base': -1, 'peer_base': -1,
+                'first_ts': np.inf, 'last_ts': -np.inf,
+                'first_data_ts': np.inf, 'last_data_ts': -np.inf}
+
+
+class PcapReader(object):
+    '''The TCP/IPv4 packets of a memory-mapped pcap file, in chunks.'''
+
+    def __init__(self, file_name, chunk_packets=CHUNK_PACKETS):
+        '''
+        Args:
+            file_name: The pcap file.
+            chunk_packets: Number of packets to parse at once.
+
+        Raises ValueError if the file isn't a pcap file of a supported link
+        type.
+        '''
+        self.file = open(file_name, 'rb')
+        if os.fstat(self.file.fileno()).st_size < 24:
+            raise ValueError('%s: not a pcap file' % file_name)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        for order in '<>':
+            (magic,) = struct.unpack_from(order + 'I', self.map, 0)
+            if magic in PCAP_MAGICS:
+                break
+        else:
+            raise ValueError('%s: not a pcap file' % file_name)
+        self.big_endian = order == '>'
+        self.record = struct.Struct(order + 'IIII')
+        self.ts_unit = PCAP_MAGICS[magic]
+        (self.snaplen, self.linktype) = struct.unpack_from(order + 'II',
+                                                           self.map, 16)
+        if self.linktype not in LINK_HEADER_BYTES:
+            raise ValueError('%s: unsupported link type %d'
+                             % (file_name, self.linktype))
+        self.data = np.frombuffer(self.map, dtype=np.uint8)
+        self.chunk_packets = chunk_packets
+        # Packets that weren't TCP/IPv4, or were cut short.
+        self.skipped = 0
+
+    def close(self):
+        del self.data
+        self.map.close()
+        self.file.close()
+
+    def chunks(self):
+        '''Yield the packets, as dictionaries of equal length arrays.
+
+        The arrays are 'ts' (float seconds), 'wire_len' (bytes on the wire),
+        and the header fields 'tos', 'src', 'dst', 'sport', 'dport', 'seq',
+        'ack', 'flags' and 'payload' (TCP payload bytes), all int64. A
+        record cut short at the end of the file, e.g. by tcpdump being
+        killed, ends the capture.
+        '''
+        end = len(self.map)
+        offset = 24
+        while offset + 16 <= end:
+            # Only the record lengths are read one by one, the rest is
+            # parsed for the whole chunk at once.
+            starts = []
+            while offset + 16 <= end and len(starts) < self.chunk_packets:
+                caplen = self.record.unpack_from(self.map, offset)[2]
+                if offset + 16 + caplen > end:
+                    end = offset
+                    break
+                starts.append(offset)
+                offset += 16 + caplen
+            if starts:
+                yield self._parse(np.array(starts, dtype=np.int64))
+
+    def _field(self, offsets, size, big_endian=True):
+        '''Unsigned integers of size bytes at each of offsets.'''
+        value = np.zeros(len(offsets), dtype=np.int64)
+        for i in range(size):
+            shift = 8 * (size - 1 - i) if big_endian else 8 * i
+            value |= self.data[offsets + i].astype(np.int64) << shift
+        return value
+
+    def _parse(self, starts):
+        '''Parse the TCP/IPv4 packets of the records at starts.'''
+        records = len(starts)
+        caplen = self._field(starts + 8, 4, self.big_endian)
+        wire_len = self._field(starts + 12, 4, self.big_endian)
+        link = LINK_HEADER_BYTES[self.linktype]
+        ip = starts + 16 + link
+
+        # Drop what isn't a complete TCP/IPv4 header, without reading past
+        # the end of any packet.
+        keep = caplen >= link + 20
+        keep[keep] = ((self._field(ip[keep] - 2, 2) == ETHERTYPE_IP) &
+                      (self.data[ip[keep]] >> 4 == 4) &
+                      (self.data[ip[keep] + 9] == IPPROTO_TCP))
+        (starts, caplen, wire_len, ip) = (starts[keep], caplen[keep],
+                                          wire_len[keep], ip[keep])
+        ihl = (self.data[ip].astype(np.int64) & 0xf) * 4
+        keep = caplen >= link + ihl + 20
+        (starts, wire_len, ip, ihl) = (starts[keep], wire_len[keep], ip[keep],
+                                       ihl[keep])
+        self.skipped += records - len(starts)
+        tcp = ip + ihl
+
+        sec = self._field(starts, 4, self.big_endian)
+        frac = self._field(starts + 4, 4, self.big_endian)
+        doff = (self.data[tcp + 12].astype(np.int64) >> 4) * 4
+        return {'ts': sec + frac * self.ts_unit,
+                'wire_len': wire_len,
+                'tos': self.data[ip + 1].astype(np.int64),
+                'src': self._field(ip + 12, 4),
+                'dst': self._field(ip + 16, 4),
+                'sport': self._field(tcp, 2),
+                'dport': self._field(tcp + 2, 2),
+                'seq': self._field(tcp + 4, 4),
+                'ack': self._field(tcp + 8, 4),
+                'flags': self.data[tcp + 13].astype(np.int64),
+                'payload': np.maximum(self._field(ip + 2, 2) - ihl - doff, 0)}
+
+def groupRows(columns):
+    '''Group equal rows of equal length integer arrays.
+
+    Returns (first, inverse): the index of the first row of each group, and
+    the group of each row.
+    '''
+    order = np.lexsort(columns[::-1])
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for column in columns:
+        c = column[order]
+        change[1:] |= c[1:] != c[:-1]
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(change) - 1
+    return (order[change], inverse)
+
+class CaptureStats(object):
+    '''Flow, ToS and timeline totals of a capture. See module docstring.'''
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        '''
+        Args:
+            interval: Width of the timeline bins, in seconds.
+        '''
+        self.interval = interval
+        self.t0 = None
+        self.count = 0
+        self.flows = dict((name, np.zeros(0, dtype))
+                          for (name, dtype) in FLOW_COLUMNS)
+        # (src, sport, dst, dport, generation) to flow index.
+        self.flow_ids = {}
+        # (src, sport, dst, dport) to (generation, seq of its SYN).
+        self.generations = {}
+        # (flow, tos, bin) to bytes on the wire.
+        self.timeline = {}
+
+    def _newFlow(self, key):
+        '''Add a flow, growing the columns as needed. Returns its index.'''
+        if self.count == len(self.flows['src']):
+            size = max(1024, 2 * self.count)
+            for (name, dtype) in FLOW_COLUMNS:
+                column = np.empty(size, dtype)
+                column[:self.count] = self.flows[name][:self.count]
+                column[self.count:] = FLOW_INITIAL.get(name, 0)
+                self.flows[name] = column
+        for (name, value) in zip(('src', 'sport', 'dst', 'dport'), key):
+            self.flows[name][self.count] = value
+        self.flow_ids[key] = self.count
+        self.count += 1
+        return self.count - 1
+
+    def _generations(self, p, conn, first, inverse):
+        '''The connection generation of each packet, see add().'''
+        n = len(p['ts'])
+        keys = [tuple(int(p[name][i]) for name in conn) for i in first]
+        start = np.array([self.generations.get(key, (-1, None))[0]
+                          for key in keys], dtype=np.int64)
+        # A SYN starts a new connection, unless it is a retransmission.
+        # There are few SYNs, so this loop is short.
+        new = np.zeros(n, dtype=bool)
+        for i in np.flatnonzero(p['flags'] & TCP_SYN):
+            key = keys[inverse[i]]
+            (generation, syn_seq) = self.generations.get(key, (-1, None))
+            if p['seq'][i] != syn_seq:
+                self.generations[key] = (generation + 1, p['seq'][i])
+                new[i] = True
+        for key in keys:
+            self.generations.setdefault(key, (-1, None))
+        # Count the new connections before each packet, within its key.
+        order = np.argsort(inverse, kind='mergesort')
+        counts = np.cumsum(new[order])
+        group_start = np.searchsorted(inverse[order], np.arange(len(first)))
+        before = counts[group_start] - new[order][group_start]
+        within = np.empty(n, dtype=np.int64)
+        within[order] = counts - before[inverse[order]]
+        return start[inverse] + within
+
+    def add(self, p):
+        '''Fold in a chunk of packets, as from PcapReader.chunks().'''
+        if len(p['ts']) == 0:
+            return
+        if self.t0 is None:
+            self.t0 = p['ts'][0]
+        conn = ('src', 'sport', 'dst', 'dport')
+        (first, inverse) = groupRows([p[name] for name in conn])
+        generation = self._generations(p, conn, first, inverse)
+
+        # Map packets to flow indexes.
+        (first, inverse) = groupRows([p[name] for name in conn] +
+                                     [generation])
+        ids = np.empty(len(first), dtype=np.int64)
+        # New flows are numbered in order of their first packet.
+        for g in np.argsort(first):
+            i = first[g]
+            key = tuple(int(p[name][i]) for name in conn) + \
+                (int(generation[i]),)
+            if key in self.flow_ids:
+                ids[g] = self.flow_ids[key]
+            else:
+                ids[g] = self._newFlow(key)
+        flow = ids[inverse]
+
+        f = self.flows
+        syn = (p['flags'] & TCP_SYN) != 0
+        f['base'][flow[syn]] = (p['seq'][syn] + 1) % (1 << 32)
+        synack = syn & ((p['flags'] & TCP_ACK) != 0)
+        f['peer_base'][flow[synack]] = p['ack'][synack]
+        unknown = f['base'][ids] < 0
+        f['base'][ids[unknown]] = p['seq'][first[unknown]]
+
+        np.add.at(f['packets'], flow, 1)
+        np.add.at(f['wire_bytes'], flow, p['wire_len'])
+        np.add.at(f['payload_bytes'], flow, p['payload'])
+        np.minimum.at(f['first_ts'], flow, p['ts'])
+        np.maximum.at(f['last_ts'], flow, p['ts'])
+        data = p['payload'] > 0
+        np.minimum.at(f['first_data_ts'], flow[data], p['ts'][data])
+        np.maximum.at(f['last_data_ts'], flow[data], p['ts'][data])
+        end = (p['seq'][data] - f['base'][flow[data]]) % (1 << 32) + \
+            p['payload'][data]
+        np.maximum.at(f['max_end'], flow[data], end)
+
+        bins = ((p['ts'] - self.t0) / self.interval).astype(np.int64)
+        (first, inverse) = groupRows([flow, p['tos'], bins])
+        sums = np.bincount(inverse, weights=p['wire_len'])
+        for (g, i) in enumerate(first):
+            key = (flow[i], p['tos'][i], bins[i])
+            self.timeline[key] = self.timeline.get(key, 0) + int(sums[g])
+
+    def flowArrays(self):
+        '''The FLOW_COLUMNS of every flow, plus:
+
+            'retrans_bytes': Payload bytes sent more than once.
+            'reverse': Index of the other direction's flow, or -1.
+            'fct_ms': On-wire FCT, NaN unless this direction sent more.
+        '''
+        flows = dict((name, column[:self.count])
+                     for (name, column) in self.flows.items())
+        flows['retrans_bytes'] = np.maximum(
+            flows['payload_bytes'] - flows['max_end'], 0)
+        peers = {}
+        for i in np.flatnonzero(flows['peer_base'] >= 0):
+            peers[(flows['src'][i], flows['sport'][i], flows['dst'][i],
+                   flows['dport'][i], flows['peer_base'][i])] = i
+        reverse = np.array([peers.get((flows['dst'][i], flows['dport'][i],
+                                       flows['src'][i], flows['sport'][i],
+                                       flows['base'][i]), -1)
+                            for i in range(self.count)], dtype=np.int64)
+        # A SYN-ACK's flow is found from its peer, above.
+        for i in np.flatnonzero(reverse >= 0):
+            reverse[reverse[i]] = i
+        flows['reverse'] = reverse
+
+        end = flows['last_data_ts'].copy()
+        other = reverse >= 0
+        end[other] = np.maximum(end[other],
+                                flows['last_data_ts'][reverse[other]])
+        sent_more = flows['payload_bytes'] > 0
+        sent_more[other] &= flows['payload_bytes'][other] > \
+            flows['payload_bytes'][reverse[other]]
+        flows['fct_ms'] = np.where(sent_more,
+                                   (end - flows['first_data_ts']) * 1e3,
+                                   np.nan)
+        return flows
+
+    def timelineArrays(self):
+        '''The timeline, as equal length arrays 'timeline_flow',
+        'timeline_tos', 'timeline_ts' (start of the bin) and
+        'timeline_bytes', sorted by flow, ToS and time.'''
+        keys = sorted(self.timeline)
+        timeline = np.array(keys, dtype=np.int64).reshape(-1, 3)
+        return {'timeline_flow': timeline[:, 0],
+                'timeline_tos': timeline[:, 1],
+                'timeline_ts': (self.t0 or 0.0) +
+                               timeline[:, 2] * self.interval,
+                'timeline_bytes': np.array([self.timeline[key]
+                                            for key in keys],
+                                           dtype=np.int64)}
+
+def captureStats(file_name, interval=DEFAULT_INTERVAL,
+                 chunk_packets=CHUNK_PACKETS):
+    '''Read a pcap file into a CaptureStats, a chunk at a time.
+
+    Returns (stats, number of packets that weren't TCP/IPv4).
+    '''
+    reader = PcapReader(file_name, chunk_packets)
+    stats = CaptureStats(interval)
+    try:
+        for chunk in reader.chunks():
+            stats.add(chunk)
+    finally:
+        reader.close()
+    return (stats, reader.skipped)
+
+def tosTimeline(timeline, interval):
+    '''Bytes on the wire per ToS value and interval, over all flows.
+
+    Args:
+        timeline: Arrays from CaptureStats.timelineArrays() (or the .npz).
+        interval: The timeline interval, in seconds.
+
+    Returns (tos values, start time of each bin, bytes[tos, bin]).
+    '''
+    if len(timeline['timeline_ts']) == 0:
+        return (np.zeros(0, np.int64), np.zeros(0), np.zeros((0, 0)))
+    t0 = timeline['timeline_ts'].min()
+    bins = np.round((timeline['timeline_ts'] - t0) / interval).astype(int)
+    (tos_values, tos_index) = np.unique(timeline['timeline_tos'],
+                                        return_inverse=True)
+    counts = np.zeros((len(tos_values), bins.max() + 1))
+    np.add.at(counts, (tos_index, bins), timeline['timeline_bytes'])
+    return (tos_values, t0 + np.arange(counts.shape[1]) * interval, counts)
+
+def saveCaptureStats(stats, npz_file):
+    '''Write a CaptureStats as a compressed .npz, see module docstring.'''
+    arrays = dict(('flow_' + name, values)
+                  for (name, values) in stats.flowArrays().items())
+    arrays.update(stats.timelineArrays())
+    np.savez_compressed(npz_file, interval=stats.interval, **arrays)
+
+def formatAddress(ip, port):
+    return '%d.%d.%d.%d:%d' % ((ip >> 24) & 0xff, (ip >> 16) & 0xff,
+                               (ip >> 8) & 0xff, ip & 0xff, port)
+
+def captureReport(stats):
+    '''Text report of a CaptureStats: each ToS band, then each flow with an
+    on-wire FCT.'''
+    flows = stats.flowArrays()
+    timeline = stats.timelineArrays()
+    lines = ['%-6s %10s %14s %10s %10s'
+             % ('tos', 'flows', 'wire_bytes', 'first_s', 'last_s')]
+    for tos in np.unique(timeline['timeline_tos']):
+        rows = timeline['timeline_tos'] == tos
+        ts = timeline['timeline_ts'][rows]
+        lines.append('0x%02x   %10d %14d %10.3f %10.3f'
+                     % (tos, len(np.unique(timeline['timeline_flow'][rows])),
+                        timeline['timeline_bytes'][rows].sum(),
+                        ts.min() - stats.t0, ts.max() - stats.t0))
+    lines.append('')
+    lines.append('%-21s %-21s %12s %12s %10s %10s'
+                 % ('src', 'dst', 'payload', 'retrans', 'start_s', 'fct_ms'))
+    for i in np.flatnonzero(~np.isnan(flows['fct_ms'])):
+        lines.append('%-21s %-21s %12d %12d %10.3f %10.3f'
+                     % (formatAddress(flows['src'][i], flows['sport'][i]),
+                        formatAddress(flows['dst'][i], flows['dport'][i]),
+                        flows['payload_bytes'][i], flows['retrans_bytes'][i],
+                        flows['first_data_ts'][i] - stats.t0,
+                        flows['fct_ms'][i]))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Summarize header-only pcap "
+                                        "captures per ToS band and flow.")
+    parser.add_argument('pcaps',
+                        nargs='+',
+                        help="pcap files, e.g. from rc3test.py --capture.")
+    parser.add_argument('--interval', '-i',
+                        dest="interval",
+                        type=float,
+                        help="Timeline interval, in seconds.",
+                        default=DEFAULT_INTERVAL)
+    parser.add_argument('--npz', '-o',
+                        dest="npz",
+                        action="store_true",
+                        help="Also save each capture's statistics next to "
+                             "it, as <capture>.npz.",
+                        default=False)
+    args = parser.parse_args()
+
+    for pcap in args.pcaps:
+        (stats, skipped) = captureStats(pcap, args.interval)
+        print "%s (%d packets skipped):" % (pcap, skipped)
+        print captureReport(stats)
+        if args.npz:
+            saveCaptureStats(stats, os.path.splitext(pcap)[0] + '.npz')
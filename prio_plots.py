@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+'''Plots of the priority queue tests, from their iperf3 JSON output.
+
+matplotlib is only imported when a plot is drawn, so measuring processes
+that import this module for iperfTestName() etc. never load it.
+'''
+
+import os
+from iperf_json import readIntervals, throughputSeries
+from flow_schedule import readLaunches, launchOffsets
+
+# Figure file and title of each priority test, by iperf3 output file stem:
+# <stem>lo1.json and <stem>hi1.json are the first run, and so on.
+PRIO_FIGURES = {
+    'serv': ('figure_16.png', 'Correctness of Priority Queueing in Linux'),
+    'sserv': ('figure_17.png',
+              'Correctness of Priority Queueing in the Switch'),
+}
+
+def iperfTestName(filename, flow):
+    '''Test name for an iperf3 output file, e.g. 'sservlo1.json' -> 'sserv1'.'''
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return name.replace(flow, '', 1)
+
+def iperfParseJSON(filename, duration, offset):
+    '''
+    Parse JSON output from iperf3 and return arrays of times and bandwidths.
+
+    The file is read incrementally, and may be iperf3 -J or --json-stream
+    output. See iperf_json.py.
+
+    Args:
+        filename: Input JSON file name.
+        duration: Number of seconds in the file.
+        offset: Offset to apply to time values, for flows started later.
+    '''
+    return throughputSeries(readIntervals(filename), duration, offset)
+
+def launchFileName(filename, flow):
+    '''File of the flow launch records of the run that wrote iperf3 output
+    file filename, e.g. 'results/serv1_launches.json' for
+    'results/servlo1.json'.
+    '''
+    return os.path.join(os.path.dirname(filename),
+                        iperfTestName(filename, flow) + '_launches.json')
+
+def flowOffset(filename, flow, default):
+    '''Seconds between the start of a priority test run and a flow's launch.
+
+    Read from the launch records of the run that wrote iperf3 output file
+    filename, or default if there are none (e.g. older results).
+    '''
+    launch_file = launchFileName(filename, flow)
+    if not os.path.exists(launch_file):
+        return default
+    return launchOffsets(readLaunches(launch_file)).get(flow, default)
+
+def iperfPlotJSON(lofile1, hifile1, lofile2, hifile2, outfile, duration,
+                  title):
+    '''
+    Plot four json files and output as outfile.
+
+    Each flow is shifted by its recorded launch time. See flowOffset().
+
+    Args:
+        lofile1, hifile1: Flow files for the first test (low priority starts
+            after high priority).
+        lofile2 hifile2: Flow files for the the second test (high priority
+            starts after low priority).
+        duration: Number of seconds in the test.
+        title: Title to use for the plot.
+    '''
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(13, 5))
+    plt.suptitle(title)
+
+    plt.subplot(121)
+    plt.xlabel('Time (s)')
+    plt.ylabel('Throughput (Mbps)')
+
+    loData = iperfParseJSON(lofile1, duration,
+                            flowOffset(lofile1, 'lo', duration/2))
+    loX = loData[0]
+    loY = loData[1]
+    print('loY: %d intervals, mean %f Mbps' % (len(loY), loY.mean()))
+
+    plt.plot(loX, loY, linewidth=2.0, label='Low Priority')
+
+    hiData = iperfParseJSON(hifile1, duration,
+                            flowOffset(hifile1, 'hi', 0))
+    hiX = hiData[0]
+    hiY = hiData[1]
+    print('hiY: %d intervals, mean %f Mbps' % (len(hiY), hiY.mean()))
+    plt.plot(hiX, hiY, linewidth=2.0, label='High Priority')
+
+    plt.legend(loc='lower left')
+
+
+    plt.subplot(122)
+    plt.xlabel('Time (s)')
+    plt.ylabel('Throughput (Mbps)')
+
+    loData = iperfParseJSON(lofile2, duration,
+                            flowOffset(lofile2, 'lo', 0))
+    loX = loData[0]
+    loY = loData[1]
+    plt.plot(loX, loY, linewidth=2.0, label='Low Priority')
+    print('loY: %d intervals, mean %f Mbps' % (len(loY), loY.mean()))
+
+    hiData = iperfParseJSON(hifile2, duration,
+                            flowOffset(hifile2, 'hi', duration/2))
+    hiX = hiData[0]
+    hiY = hiData[1]
+    plt.plot(hiX, hiY, linewidth=2.0, label='High Priority')
+    print('hiY: %d intervals, mean %f Mbps' % (len(hiY), hiY.mean()))
+
+    plt.legend(loc='lower left')
+
+
+    plt.savefig(outfile, bbox_inches='tight')
+    plt.close(fig)
+    print('plot saved to ', outfile)
+
+def prioFigureArgs(output_dir, stem, duration):
+    '''iperfPlotJSON() arguments for the priority test with output stem.'''
+    (figure, title) = PRIO_FIGURES[stem]
+    return ('%s/%slo1.json' % (output_dir, stem),
+            '%s/%shi1.json' % (output_dir, stem),
+            '%s/%slo2.json' % (output_dir, stem),
+            '%s/%shi2.json' % (output_dir, stem),
+            '%s/%s' % (output_dir, figure), duration, title)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+'''Sample qdisc and class statistics at millisecond intervals, via netlink.
+
+Run inside a node's network namespace (e.g. with node.popen()), for the
+devices whose prio qdisc trees should be watched:
+
+    qdisc_sampler.py -i 0.001 -o results/qdisc_h1.npz h1-eth0
+
+Each tick dumps the qdiscs and classes of the namespace straight from the
+kernel with RTM_GETQDISC / RTM_GETTCLASS netlink requests, instead of
+forking tc -s. A record is kept for an object (qdisc or class) only when one
+of its counters changed since its previous record, so idle queues cost
+nothing. Records are streamed to a raw file while sampling, and converted to
+a compressed .npz when the sampler is interrupted (SIGINT or SIGTERM).
+
+The .npz holds one array per RECORD_FIELDS column, plus:
+    'devs', 'ifindexes': The sampled device names and their ifindex.
+    'kind_ifindex', 'kind_type', 'kind_handle', 'kind': The qdisc or class
+        kind (e.g. 'htb', 'prio', 'netem') of each object seen.
+
+Times are Unix times, like the FCT sample timestamps in the sample store.
+Use loadQdiscStats() to read the file back.
+'''
+
+from argparse import ArgumentParser
+import signal
+import socket
+import struct
+import fcntl
+import errno
+import time
+import os
+
+NETLINK_ROUTE = 0
+RTM_GETQDISC = 38
+RTM_GETTCLASS = 42
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+TCA_KIND = 1
+TCA_STATS = 3
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+
+SIOCGIFINDEX = 0x8933
+
+NLMSGHDR = struct.Struct('=IHHII')
+TCMSG = struct.Struct('=BxxxiIII')
+RTATTR = struct.Struct('=HH')
+GNET_STATS_BASIC = struct.Struct('=QI')
+GNET_STATS_QUEUE = struct.Struct('=IIIII')
+TC_STATS = struct.Struct('=QIIIIIII')
+
+# Object types.
+QDISC = 0
+CLASS = 1
+
+# Columns of each record, in the raw file and the .npz.
+RECORD_FIELDS = [('time', 'd'), ('ifindex', 'i'), ('type', 'B'),
+                 ('handle', 'I'), ('parent', 'I'), ('bytes', 'Q'),
+                 ('packets', 'I'), ('drops', 'I'), ('overlimits', 'I'),
+                 ('backlog', 'I'), ('qlen', 'I')]
+RECORD = struct.Struct('=' + ''.join(f for (_, f) in RECORD_FIELDS))
+
+
+def ifIndex(dev):
+    '''The ifindex of dev, in this process's network namespace.'''
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        req = struct.pack('16si', dev, 0)
+        return struct.unpack('16si', fcntl.ioctl(s, SIOCGIFINDEX, req))[1]
+    finally:
+        s.close()
+
+def formatHandle(handle):
+    '''Format a tc handle as tc does, e.g. 0x20001 -> '2:1'.'''
+    return '%x:%x' % (handle >> 16, handle & 0xffff)
+
+def parseAttrs(data, offset, end):
+    '''Parse netlink attributes into a dict of type -> payload string.'''
+    attrs = {}
+    while offset + RTATTR.size <= end:
+        (length, atype) = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[atype & 0x7fff] = data[offset + RTATTR.size:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+def parseStats(attrs):
+    '''(bytes, packets, drops, overlimits, backlog, qlen) from attributes.'''
+    if TCA_STATS2 in attrs:
+        nested = parseAttrs(attrs[TCA_STATS2], 0, len(attrs[TCA_STATS2]))
+        (nbytes, packets) = (0, 0)
+        (qlen, backlog, drops, requeues, overlimits) = (0, 0, 0, 0, 0)
+        if TCA_STATS_BASIC in nested:
+            (nbytes, packets) = GNET_STATS_BASIC.unpack_from(
+                nested[TCA_STATS_BASIC])
+        if TCA_STATS_QUEUE in nested:
+            (qlen, backlog, drops, requeues, overlimits) = \
+                GNET_STATS_QUEUE.unpack_from(nested[TCA_STATS_QUEUE])
+        return (nbytes, packets, drops, overlimits, backlog, qlen)
+    if TCA_STATS in attrs:
+        (nbytes, packets, drops, overlimits, bps, pps, qlen, backlog) = \
+            TC_STATS.unpack_from(attrs[TCA_STATS])
+        return (nbytes, packets, drops, overlimits, backlog, qlen)
+    return (0, 0, 0, 0, 0, 0)
+
+class NetlinkTcReader(object):
+    '''Dumps qdisc and class statistics over a NETLINK_ROUTE socket.'''
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.seq = 0
+
+    def dump(self, msg_type, ifindex=0):
+        '''Dump qdiscs or classes, generating (ifindex, handle, parent, kind,
+        stats) tuples, with stats as from parseStats().'''
+        self.seq += 1
+        body = TCMSG.pack(socket.AF_UNSPEC, ifindex, 0, 0, 0)
+        retryOnEintr(self.sock.send,
+                     NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type,
+                                   NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+                     + body)
+        while True:
+            data = retryOnEintr(self.sock.recv, 1 << 16)
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                (length, mtype, flags, seq, pid) = \
+                    NLMSGHDR.unpack_from(data, offset)
+                if length < NLMSGHDR.size:
+                    return
+                if mtype == NLMSG_DONE:
+                    return
+                if mtype == NLMSG_ERROR:
+                    (err,) = struct.unpack_from('=i', data,
+                                                offset + NLMSGHDR.size)
+                    if err:
+                        raise OSError(-err, os.strerror(-err))
+                    return
+                if seq == self.seq:
+                    start = offset + NLMSGHDR.size
+                    (family, index, handle, parent, info) = \
+                        TCMSG.unpack_from(data, start)
+                    attrs = parseAttrs(data, start + TCMSG.size,
+                                       offset + length)
+                    kind = attrs.get(TCA_KIND, '').rstrip('\0')
+                    yield (index, handle, parent, kind, parseStats(attrs))
+                offset += (length + 3) & ~3
+
+    def close(self):
+        self.sock.close()
+
+def retryOnEintr(func, *args):
+    '''Call func(*args), again whenever a signal interrupts it.
+
+    Under Python 2 a system call cut short by the stop signal's handler
+    fails with EINTR, rather than being restarted.
+    '''
+    while True:
+        try:
+            return func(*args)
+        except (IOError, OSError) as e: # socket.error is an IOError
+            if e.args[0] != errno.EINTR:
+                raise
+
+def sleepUntil(when, stop):
+    '''Sleep until the Unix time when, or until stop() is true.
+
+    A signal can end the sleep early (or fail it with EINTR), so sleep again
+    for what's left unless the signal asked us to stop.
+    '''
+    while not stop():
+        delay = when - time.time()
+        if delay <= 0:
+            return
+        retryOnEintr(time.sleep, delay)
+
+class QdiscSampler(object):
+    '''Samples the tc objects of some devices, recording changes.'''
+
+    def __init__(self, devs, raw_file):
+        self.devs = devs
+        self.ifindexes = [ifIndex(dev) for dev in devs]
+        self.reader = NetlinkTcReader()
+        self.out = open(raw_file, 'wb')
+        self.last = {}
+        self.kinds = {}
+
+    def sample(self):
+        '''Take one sample of every object, writing the changed ones.'''
+        now = time.time()
+        wanted = set(self.ifindexes)
+        objs = [(QDISC, o) for o in self.reader.dump(RTM_GETQDISC)
+                if o[0] in wanted]
+        for ifindex in self.ifindexes:
+            objs += [(CLASS, o) for o in self.reader.dump(RTM_GETTCLASS,
+                                                          ifindex)]
+        for (otype, (ifindex, handle, parent, kind, stats)) in objs:
+            key = (ifindex, otype, handle)
+            if self.last.get(key) == stats:
+                continue
+            self.last[key] = stats
+            self.kinds[key] = kind
+            self.out.write(RECORD.pack(now, ifindex, otype, handle, parent,
+                                       *stats))
+
+    def run(self, interval, stop):
+        '''Sample every interval seconds until stop() is true.
+
+        Ticks are scheduled on absolute times, so a slow sample doesn't
+        shift the ones after it.
+        '''
+        next_tick = time.time()
+        while not stop():
+            self.sample()
+            next_tick += interval
+            if next_tick > time.time():
+                sleepUntil(next_tick, stop)
+            else:
+                # Fell behind; skip the missed ticks rather than bursting.
+                next_tick = time.time()
+
+    def close(self, raw_file, npz_file):
+        '''Stop sampling and convert the raw records to npz_file.'''
+        import numpy as np
+
+        self.reader.close()
+        self.out.close()
+        dtype = np.dtype([(name, '<' + f if f != 'B' else f)
+                          for (name, f) in RECORD_FIELDS])
+        records = np.fromfile(raw_file, dtype=dtype)
+        keys = sorted(self.kinds.keys())
+        np.savez_compressed(
+            npz_file,
+            devs=np.array(self.devs),
+            ifindexes=np.array(self.ifindexes),
+            kind_ifindex=np.array([k[0] for k in keys], dtype=np.int32),
+            kind_type=np.array([k[1] for k in keys], dtype=np.uint8),
+            kind_handle=np.array([k[2] for k in keys], dtype=np.uint32),
+            kind=np.array([self.kinds[k] for k in keys]),
+            **dict((name, records[name]) for (name, _) in RECORD_FIELDS))
+        os.remove(raw_file)
+
+def loadQdiscStats(npz_file, dev=None, handle=None, otype=None):
+    '''Load a sampler's .npz output as a dict of arrays, optionally filtered.
+
+    Args:
+        npz_file: File written by the sampler.
+        dev: Only records of this device name.
+        handle: Only records of this handle, e.g. '2:1'.
+        otype: Only records of this object type, QDISC or CLASS.
+    '''
+    import numpy as np
+
+    f = np.load(npz_file)
+    data = dict((name, f[name]) for (name, _) in RECORD_FIELDS)
+    keep = np.ones(len(data['time']), dtype=bool)
+    if dev is not None:
+        ifindex = f['ifindexes'][list(f['devs']).index(dev)]
+        keep &= data['ifindex'] == ifindex
+    if handle is not None:
+        (major, minor) = handle.split(':')
+        keep &= data['handle'] == (int(major or '0', 16) << 16 |
+                                   int(minor or '0', 16))
+    if otype is not None:
+        keep &= data['type'] == otype
+    return dict((name, a[keep]) for (name, a) in data.items())
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Sample qdisc/class statistics of "
+                                        "devices over netlink.")
+    parser.add_argument('devs', nargs='+', help="Devices to sample.")
+    parser.add_argument('--interval', '-i', type=float, default=0.001,
+                        help="Seconds between samples.")
+    parser.add_argument('--out', '-o', required=True,
+                        help="Output .npz file.")
+    args = parser.parse_args()
+
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    raw_file = args.out + '.raw'
+    sampler = QdiscSampler(args.devs, raw_file)
+    sampler.run(args.interval, lambda: stopping)
+    sampler.close(raw_file, args.out)
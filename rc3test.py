@@ -3,23 +3,54 @@
 
 Also includes tests to show priority queue implementation correctness.'''
 
-from mininet.topo import Topo
-from mininet.net import Mininet
-from mininet.util import dumpNodeConnections
-from mininet.log import lg
-from mininet.link import TCLink
-from mininet.util import pmonitor
-from mininet.cli import CLI
+try:
+    from mininet.topo import Topo
+    from mininet.net import Mininet
+    from mininet.util import dumpNodeConnections
+    from mininet.log import lg
+    from mininet.link import TCLink
+    from mininet.node import OVSBridge
+    from mininet.cli import CLI
+except ImportError:
+    # Without Mininet, only the FCT tests can run, with --backend netns.
+    Mininet = None
+    Topo = object
 from time import time
 from time import sleep
 from signal import SIGINT
 from argparse import ArgumentParser
 from subprocess import PIPE, Popen
 import subprocess
+import tempfile
 import json
 import os
-import matplotlib.pyplot as plt
 from figure15_helpers import *
+from parallel_runner import runJobs, jobPrefix, pairPrefixes
+from sample_store import SampleStore
+from telemetry import ThroughputMonitor
+from tc_batch import prioQdiscTree, applyTrees, RC3_TOS_VALUES
+from fct_stats import sampleMatrix, confidenceInterval
+from net_pool import NetPool, killLeftovers
+from netns_net import rc3Net
+from topologies import parseTopology, mininetNet, nsNet, applySpecQdiscs
+from pcap_reader import captureStats, saveCaptureStats, captureReport
+from kernel_log import KernelLog
+from supervisor import Supervisor, flowDeadline, DEADLINE_FACTOR
+from calibrate import calibrate, applyCalibration, calibrationTable, \
+    saveCalibration, loadCalibration, rateError, delayError, \
+    RATE_TEST_SECONDS
+import tracing
+from tracing import span
+from flow_schedule import ScheduledFlow, flowPorts, runSchedule, \
+    writeLaunches
+from prio_plots import iperfTestName, iperfPlotJSON, launchFileName, \
+    prioFigureArgs
+from analyze import fctChart, fctStatsTable
+from render_pool import RenderPool
+from experiment_configs import fctTestConfigs, FCT_FLOW_LENGTHS, \
+    FCT_FLOW_TYPES, PRIO_TEST_ARGS, WORKLOAD_SETTINGS, TOPOLOGY_SETTINGS
+from workload import loadFlows, bucketReport, formatReport, \
+    generateWorkload, loadCdf
 
 
 parser = ArgumentParser(description="CS244 Spring '15, RC3 Test")
@@ -39,80 +70,287 @@ parser.add_argument('--dir', '-d',
                     default="results",
                     required=False)
 
+parser.add_argument('--ci-target',
+                    dest="ci_target",
+                    type=float,
+                    action="store",
+                    help="Sample each flow size and protocol only until the "
+                         "95%% confidence interval of its mean FCT is this "
+                         "narrow, relative to the mean, e.g. 0.05. "
+                         "--num-flows becomes the maximum number of flows.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--min-flows',
+                    dest="min_flows",
+                    type=int,
+                    action="store",
+                    help="Minimum number of flows of each size to measure "
+                         "when using --ci-target.",
+                    default=3,
+                    required=False)
+
+parser.add_argument('--live',
+                    dest="live",
+                    action="store_true",
+                    help="Follow priority test throughput while the tests run "
+                         "(needs iperf3 --json-stream support), recording it "
+                         "to telemetry.csv, and abort runs whose flows stall.",
+                    default=False,
+                    required=False)
+
+parser.add_argument('--stall-intervals',
+                    dest="stall_intervals",
+                    type=int,
+                    action="store",
+                    help="With --live, abort a priority test run when all "
+                         "its started flows have this many zero throughput "
+                         "intervals in a row, from their first interval.",
+                    default=5,
+                    required=False)
+
+parser.add_argument('--retries',
+                    dest="retries",
+                    type=int,
+                    action="store",
+                    help="Number of times a failed FCT sample or priority "
+                         "test run is retried, after killing its processes. "
+                         "Failures are stored in samples.sqlite.",
+                    default=2,
+                    required=False)
+
+parser.add_argument('--deadline-factor',
+                    dest="deadline_factor",
+                    type=float,
+                    action="store",
+                    help="Multiple of a flow's expected completion time "
+                         "after which it counts as hung. See supervisor.py.",
+                    default=DEADLINE_FACTOR,
+                    required=False)
+
+parser.add_argument('--live-plot',
+                    dest="live_plot",
+                    action="store_true",
+                    help="With --live, keep a plot of each priority test "
+                         "run's throughput up to date while it runs.",
+                    default=False,
+                    required=False)
+
+parser.add_argument('--parallel', '-j',
+                    dest="parallel",
+                    type=int,
+                    action="store",
+                    help="Number of independent tests (priority test runs and "
+                         "flow completion time configurations) to run at "
+                         "once, each in its own Mininet network.",
+                    default=1,
+                    required=False)
+
+parser.add_argument('--cpus',
+                    dest="cpus",
+                    action="store",
+                    help="Comma separated CPUs to pin parallel tests to, one "
+                         "CPU per test, round robin. E.g. '0,1,2,3'.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--qdisc-stats',
+                    dest="qdisc_stats",
+                    type=float,
+                    action="store",
+                    help="Sample the qdisc and class counters of every "
+                         "priority qdisc device at this interval (seconds, "
+                         "e.g. 0.001) during the flow completion time tests, "
+                         "saving them as qdisc_<config>_<node>.npz. "
+                         "See qdisc_sampler.py.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--capture',
+                    dest="capture",
+                    action="store_true",
+                    help="Capture the packet headers on every switch "
+                         "interface (host interfaces, without a switch) "
+                         "during the FCT and priority tests, as "
+                         "capture_<test>_<intf>.pcap, and summarize each per "
+                         "ToS band and flow. See pcap_reader.py.",
+                    default=False)
+
+parser.add_argument('--rc3-log',
+                    dest="rc3_log",
+                    action="store_true",
+                    help="Turn on the RC3 kernel's per socket logging "
+                         "(fcttest -l) in the FCT tests, and store each "
+                         "flow's packet records with its sample, streamed "
+                         "from /dev/kmsg. Needs the RC3 kernel, --pairs 1 "
+                         "and --parallel 1. See kernel_log.py.",
+                    default=False)
+
+parser.add_argument('--rc3-log-time',
+                    dest="rc3_log_time",
+                    action="store_true",
+                    help="With --rc3-log, also turn on the RC3 kernel's "
+                         "logging time mode (fcttest -t).",
+                    default=False)
+
+parser.add_argument('--rc3-log-pattern',
+                    dest="rc3_log_pattern",
+                    action="store",
+                    help="With --rc3-log, regular expression of the RC3 "
+                         "kernel's packet records, with a 'level' group "
+                         "and optionally a 'seq' group. By default a loose "
+                         "match, see kernel_log.py.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--pairs',
+                    dest="pairs",
+                    type=int,
+                    action="store",
+                    help="Number of independent h1 - s1 - h2 host pairs in "
+                         "each FCT test network, each with its own links "
+                         "and qdiscs. Each round of flows runs on every pair "
+                         "at once, collecting this many samples. Check that "
+                         "this doesn't change the results with "
+                         "'analyze.py --check-pairs'.",
+                    default=1,
+                    required=False)
+
+parser.add_argument('--backend',
+                    dest="backend",
+                    choices=['mininet', 'netns'],
+                    help="How to build the FCT and workload test networks: "
+                         "with Mininet, or from plain network namespaces, "
+                         "veth pairs and a bridge (see netns_net.py). "
+                         "netns needs no Mininet or Open vSwitch, but can't "
+                         "run the priority queue tests, which are skipped.",
+                    default="mininet",
+                    required=False)
+
+parser.add_argument('--workload',
+                    dest="workload",
+                    action="store",
+                    help="Instead of the usual tests, run a concurrent "
+                         "workload with this flow size CDF (websearch, "
+                         "datamining, or a file) over regular TCP and RC3. "
+                         "See workload.py.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--topology',
+                    dest="topology",
+                    action="store",
+                    help="Instead of the usual tests, run the FCT tests on "
+                         "a multi-tier topology, e.g. 'incast:senders=16' or "
+                         "'leafspine:leaves=4,spines=2,hosts=4,"
+                         "oversubscription=2'. See topologies.py.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--calibrate',
+                    dest="calibrate",
+                    action="store_true",
+                    help="Before the FCT tests, measure how fast this "
+                         "machine emulates the links accurately, and scale "
+                         "each configuration's rate up and delay down as "
+                         "far as it can, for faster runs. Saved as "
+                         "calibration.json. See calibrate.py.",
+                    default=False)
+
+parser.add_argument('--calibration',
+                    dest="calibration",
+                    action="store",
+                    help="Scale the FCT test configurations as in this "
+                         "calibration.json from an earlier --calibrate run.",
+                    default=None,
+                    required=False)
+
+parser.add_argument('--error-budget',
+                    dest="error_budget",
+                    type=float,
+                    action="store",
+                    help="Largest relative rate or delay error --calibrate "
+                         "accepts.",
+                    default=0.05,
+                    required=False)
+
+parser.add_argument('--load',
+                    dest="load",
+                    type=float,
+                    action="store",
+                    help="Target bottleneck load of the --workload test.",
+                    default=0.5,
+                    required=False)
+
+parser.add_argument('--workload-flows',
+                    dest="workload_flows",
+                    type=int,
+                    action="store",
+                    help="Number of flows in the --workload test.",
+                    default=1000,
+                    required=False)
+
 # Expt parameters
 args = parser.parse_args()
 
+if args.backend == 'mininet' and Mininet is None:
+    parser.error("Mininet is not installed, use --backend netns")
+
+if args.rc3_log and (args.pairs != 1 or args.parallel != 1):
+    parser.error("--rc3-log logs one flow at a time, it needs --pairs 1 "
+                 "and --parallel 1")
+
+if args.ci_target is not None and args.min_flows > args.num_flows:
+    parser.error("--min-flows (%d) can't be more than --num-flows (%d)"
+                 % (args.min_flows, args.num_flows))
+
+topology_spec = None
+if args.topology is not None:
+    try:
+        topology_spec = parseTopology(args.topology)
+    except (ValueError, TypeError) as e:
+        parser.error("bad --topology %r: %s" % (args.topology, e))
+
 if not os.path.exists(args.output_dir):
     os.makedirs(args.output_dir)
 
+# Seconds a priority test run's processes may outlive its schedule, for
+# iperf3 to finish and write its results.
+PRIO_DEADLINE_SLACK = 30
+
+# Every raw FCT sample and iperf3 interval is appended here.
+sample_store = SampleStore(args.output_dir + '/samples.sqlite')
+
+# Figures are drawn here, in the background, while the tests carry on.
+render_pool = RenderPool()
+
+# Bytes of each packet captured with --capture: the Ethernet, IP and TCP
+# headers, with TCP options.
+CAPTURE_SNAPLEN = 96
+
+# RC3 kernel log reader, with --rc3-log. See kernel_log.py.
+kernel_log = None
+
+# Port of the long-lived fcttest server of each protocol.
+FCT_SERVER_PORTS = {'tcp': 5678, 'rc3': 5677}
+
 # Below are the settings used to produce Figures 15 (a) and (b)
-# from the paper, with original data and additional Mininet tests.
-# Actual experiment used 10Gbps and 1Gbps rates with an RTT of 20ms.
-# We reduce the link speed and increase the latency to maintain
-# the same Bandwidth-Delay Product
-RC3_fct_test_configs = [
-    # Figure 15(a)
-    # 10Gbps x 20us RTT test, scaled rate down by 100, delay up by 100
-    # TCP Reno
-    {
-        'tcp_type': 'reno',
-        'bandwidth': 100, # 100 Mbps
-        'delay': '1000ms', # Delay is only at the host.
-        'time_scale_factor': 1.0/100.0, # Rate by 1/100, delay by 100
-        'flows_per_test': args.num_flows,
-        'starter_data_function': figure15a_paper_data,
-        'fig_file_name': args.output_dir + '/figure_15a_reno.png',
-        'fct_offset': 0.010 # 1/2 RTT adjustment to match with paper method.
-    },
-    # TCP Cubic
-    {
-        'tcp_type': 'cubic',
-        'bandwidth': 100, # 100 Mbps
-        'delay': '1000ms', # Delay is only at the host.
-        'time_scale_factor': 1.0/100.0, # Rate by 1/100, delay by 100
-        'flows_per_test': args.num_flows,
-        'starter_data_function': figure15a_paper_data,
-        'fig_file_name': args.output_dir + '/figure_15a_cubic.png',
-        'fct_offset': 0.010 # 1/2 RTT adjustment to match with paper method.
-    },
-    # Figure 15(b)
-    # 1Gbps x 20us RTT test, scaled rate down by 10, delay up by 10
-    # TCP Reno
-    {
-        'tcp_type': 'reno',
-        'bandwidth': 100, # 10 Mbps
-        'delay': '100ms', # Delay is only at the host.
-        'time_scale_factor': 1.0/10.0, # Rate by 1/100, delay by 100
-        'flows_per_test': args.num_flows,
-        'starter_data_function': figure15b_paper_data,
-        'fig_file_name': args.output_dir + '/figure_15b_reno.png',
-        'fct_offset': 0.010 # 1/2 RTT adjustment to match with paper method.
-    },
-    # TCP Cubic
-    {
-        'tcp_type': 'cubic',
-        'bandwidth': 100, # 10 Mbps
-        'delay': '100ms', # Delay is only at the host.
-        'time_scale_factor': 1.0/10.0, # Rate by 1/100, delay by 100
-        'flows_per_test': args.num_flows,
-        'starter_data_function': figure15b_paper_data,
-        'fig_file_name': args.output_dir + '/figure_15b_cubic.png',
-        'fct_offset': 0.010 # 1/2 RTT adjustment to match with paper method.
-    }
-]
+# from the paper. See experiment_configs.py.
+RC3_fct_test_configs = fctTestConfigs(args.output_dir, args.num_flows,
+                                      args.min_flows, args.ci_target)
 
 class PrioSwitchTestTopo(Topo):
     '''Topology for testing priority queues on a switch.'''
-    def __init__(self, bandwidth, delay):
+    def __init__(self, bandwidth, delay, prefix=''):
 
         #Initialize Topology
         Topo.__init__(self)
 
         # Add hosts and switch
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
-        h3 = self.addHost('h3')
-        switch = self.addSwitch('s1')
+        h1 = self.addHost(prefix + 'h1')
+        h2 = self.addHost(prefix + 'h2')
+        h3 = self.addHost(prefix + 'h3')
+        switch = self.addSwitch(prefix + 's1')
 
         # Add links
         self.addLink(h1, switch, bw=bandwidth, delay=delay, use_htb=True)
@@ -122,33 +360,63 @@ class PrioSwitchTestTopo(Topo):
 
 class PrioTestTopo(Topo):
     '''Topology for testing priority queues on a host.'''
-    def __init__(self, bandwidth, delay):
+    def __init__(self, bandwidth, delay, prefix=''):
 
         #Initialize Topology
         Topo.__init__(self)
 
         # Add hosts and switch
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
+        h1 = self.addHost(prefix + 'h1')
+        h2 = self.addHost(prefix + 'h2')
 
         # Add links
         self.addLink(h1, h2, bw=bandwidth, delay=delay, use_htb=True)
 
 class RC3Topo(Topo):
-    '''Topology for testing RC3 flow completion times, including a switch.'''
-    def __init__(self, bandwidth):
+    '''Topology for testing RC3 flow completion times, including a switch.
+
+    With several pairs, each pair of hosts has its own switch and links,
+    named with the prefixes from pairPrefixes().
+    '''
+    def __init__(self, bandwidth, prefix='', pairs=1):
 
         #Initialize Topology
         Topo.__init__(self)
 
-        # Add hosts and switch
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
-        switch = self.addSwitch('s1')
+        for p in pairPrefixes(prefix, pairs):
+            # Add hosts and switch
+            h1 = self.addHost(p + 'h1')
+            h2 = self.addHost(p + 'h2')
+            switch = self.addSwitch(p + 's1')
 
-        # Add links. Note: Delay, etc, inserted by custom prio qdisc code
-        self.addLink(h1, switch, bw=bandwidth, use_htb=True)
-        self.addLink(switch, h2, bw=bandwidth, use_htb=True)
+            # Add links. Note: Delay, etc, inserted by custom prio qdisc code
+            self.addLink(h1, switch, bw=bandwidth, use_htb=True)
+            self.addLink(switch, h2, bw=bandwidth, use_htb=True)
+
+def makeNet(topo, prefix=''):
+    '''Create a Mininet network for topo.
+
+    A topology built with a name prefix is assumed to be one of several
+    running at once, so its switches run as standalone bridges rather than
+    sharing the default controller port with the other networks.
+    '''
+    if prefix:
+        return Mininet(topo, link=TCLink, switch=OVSBridge, controller=None)
+    return Mininet(topo, link=TCLink)
+
+def makeRC3Net(prefix=''):
+    '''Create the FCT test network, h1 - s1 - h2 for each of the --pairs,
+    with the --backend.'''
+    if args.backend == 'netns':
+        return rc3Net(prefix, args.pairs)
+    topo = RC3Topo(100, prefix, args.pairs) # Rate will be overridden by qdiscs
+    return makeNet(topo, prefix)
+
+def makeSpecNet(spec):
+    '''Create the network of a topologies.TopoSpec, with the --backend.'''
+    if args.backend == 'netns':
+        return nsNet(spec)
+    return mininetNet(spec)
 
 def addPrioQdisc(node, devStr, bandwidth, delay=None):
     '''Setup the HTB, prio qdisc, netem, etc.
@@ -158,42 +426,26 @@ def addPrioQdisc(node, devStr, bandwidth, delay=None):
     bandwidth: A number, representing bandwidth in Mbps.
     delay: A string, such as 10us, or None for no delay.
     '''
+    addPrioQdiscs(node, [devStr], bandwidth, delay)
+
+def addPrioQdiscs(node, devStrs, bandwidth, delay=None):
+    '''Setup the HTB, prio qdisc, netem, etc. on several devices of a node.
+
+    All devices are configured with one tc -batch command, and only the
+    parts that changed since the last call for a device are applied, e.g.
+    just the netem delay. See tc_batch.py.
+
+    node: Network node, e.g. h1, h2, s1.
+    devStrs: List of device name strings, e.g. ['s1-eth1', 's1-eth2'].
+    bandwidth: A number, representing bandwidth in Mbps.
+    delay: A string, such as 10us, or None for no delay.
+    '''
+    with span('addPrioQdiscs', node=node.name):
+        applyTrees(node, [prioQdiscTree(devStr, bandwidth, delay)
+                          for devStr in devStrs])
 
-    print devStr, "Initial tc Configuration ==========================="
-    node.cmdPrint('tc qdisc show dev', devStr)
-    node.cmdPrint('tc class show dev', devStr)
-
-    print devStr, "Setting tc Configuration ==========================="
-    node.cmdPrint('tc qdisc del dev', devStr, 'root');
-    node.cmdPrint('tc qdisc add dev', devStr, 'root handle 1: htb default 1')
-    # TODO
-    print "TODO: Set burst rates to match original?"
-    rate = "%fMbit" % bandwidth
-    node.cmdPrint('tc class add dev', devStr, 'classid 1:1 parent 1: htb rate',
-                  rate, 'ceil', rate)
-    # prio qdisc for priority queues. priomap mostly ignored, use filters below
-    node.cmdPrint('tc qdisc add dev', devStr,
-                  'parent 1:1 handle 2:0 prio bands 8 '
-                  'priomap 0 1 2 3 4 5 6 7 7 7 7 7 7 7 7 7')
-    # netem qdiscs at leaves if delay is wanted.
-    if delay is not None:
-        for i in range(1, 5+1):
-            node.cmdPrint('tc qdisc add dev %s parent 2:%d handle 15%d:'
-                          ' netem delay %s limit 1000' % (devStr, i, i, delay))
-    # filters to match the ToS bit settings used by RC3 and put in prio queues
-    for (i,tos) in zip(range(1, 5+1), ['0x00','0x04','0x08','0x0c','0x10']):
-        node.cmdPrint('tc filter add dev %s parent 2:0 protocol ip'
-                      ' prio 10 u32 match ip tos %s 0xff flowid 2:%d'
-                      % (devStr, tos, i))
-
-    print devStr, "Custom tc Configuration ============================"
-
-    node.cmdPrint('tc qdisc show dev', devStr)
-    node.cmdPrint('tc class show dev', devStr)
-    node.cmdPrint('tc filter show dev', devStr, 'parent 15:0')
-    #node.cmdPrint('tc -s class ls dev', devStr)
-
-def runPrioSwitchFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFirst):
+def runPrioSwitchFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFirst,
+                       prefix='', pool=None):
     '''Create a mininet simulation, and test priority queues on a switch.
 
     Starts a high or low priority flow from one host to a receiver, through
@@ -209,171 +461,267 @@ def runPrioSwitchFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFir
         loOut: Iperf3 output file name for low priority flow information.
         hiOut: Iperf3 output file name for high priority flow information.
         loFirst: Boolean, whether low priority flow starts first or not.
+        prefix: Name prefix for nodes, to run alongside other networks.
+        pool: NetPool to get the network from, or None to build one just for
+            this run.
     '''
-    topo = PrioSwitchTestTopo(bandwidth, delay)
-    net = Mininet(topo, link=TCLink)
-    net.start()
+    schedule = prioSchedule(duration, loFirst, loSrc='h1', hiSrc='h2',
+                            dst='h3')
+    runPrioScenario(PrioSwitchTestTopo, bandwidth, delay, interval, schedule,
+                    {'lo': loOut, 'hi': hiOut}, prefix, pool)
 
-    print "Dumping node connections"
-    dumpNodeConnections(net.hosts)
+def prioSchedule(duration, loFirst, loSrc, hiSrc, dst):
+    '''The two flow schedule of a priority test run.
 
-    h1, h2, h3, s1 = net.getNodeByName('h1', 'h2', 'h3', 's1')
+    One flow runs for the whole duration, and the other, with the other
+    priority, starts at half the duration.
 
-    print "Adding qdiscs"
-    addPrioQdisc(h1, 'h1-eth0', bandwidth=bandwidth)
-    addPrioQdisc(h2, 'h2-eth0', bandwidth=bandwidth)
-    addPrioQdisc(h3, 'h3-eth0', bandwidth=bandwidth)
-    addPrioQdisc(s1, 's1-eth1', bandwidth=bandwidth)
-    addPrioQdisc(s1, 's1-eth2', bandwidth=bandwidth)
-    addPrioQdisc(s1, 's1-eth3', bandwidth=bandwidth)
-
-    h1.cmd('killall iperf3')
-    h2.cmd('killall iperf3')
-    h3.cmd('killall iperf3')
-
-    ps = {} # ProcesseS
-
-    print "Testing bandwidth with high and low priority flows..."
-    ps['hiserv'] = h3.popen('iperf3 -s -p 5001 -1 -i %f -J > %s' \
-                % (interval, hiOut), shell=True)
-    ps['loserv'] = h3.popen('iperf3 -s -p 5002 -1 -i %f -J > %s' \
-                % (interval, loOut), shell=True)
-
-
-    if loFirst:
-        print 'launching low priority iperf'
-        ps['loperf'] = h1.popen('iperf3 -c %s -p 5002 -i %f -t %d -S 0x4 -J' \
-                % (h3.IP(), interval, duration+1), shell=True)
-    else:
-        print 'launching high priority iperf'
-        ps['hiperf'] = h2.popen('iperf3 -c %s -p 5001 -i %f -t %d -S 0x0 -J' \
-                % (h3.IP(), interval, duration+1), shell=True)
-
-    sleep(duration/ 2)
-
-    if loFirst:
-        print 'launching high priority iperf'
-        ps['hiperf'] = h2.popen('iperf3 -c %s -p 5001 -i %f -t %d -S 0x0 -J' \
-                % (h3.IP(), interval, (duration/2)+1), shell=True)
-    else:
-        print 'launching low priority iperf'
-        ps['loperf'] = h1.popen('iperf3 -c %s -p 5002 -i %f -t %d -S 0x4 -J' \
-                % (h3.IP(), interval, (duration/2)+1), shell=True)
-
-    ps['hiperf'].wait()
-    ps['loperf'].wait()
-    ps['hiserv'].wait()
-    ps['loserv'].wait()
-    print 'flows finished'
+    Args:
+        duration: Total duration of test, in seconds.
+        loFirst: Boolean, whether low priority flow starts first or not.
+        loSrc, hiSrc: Names of the hosts sending the low and high priority
+            flows.
+        dst: Name of the receiving host.
+    '''
+    lo = ScheduledFlow(0, loSrc, dst, 'lo', RC3_TOS_VALUES[1], duration + 1)
+    hi = ScheduledFlow(0, hiSrc, dst, 'hi', RC3_TOS_VALUES[0], duration + 1)
+    (first, second) = (lo, hi) if loFirst else (hi, lo)
+    return [first, second._replace(start=duration / 2,
+                                   length=(duration / 2) + 1)]
 
-    net.stop()
+def runPrioScenario(topo_class, bandwidth, delay, interval, schedule, outputs,
+                    prefix='', pool=None):
+    '''Run a schedule of flows across a priority qdisc network.
 
-def prioSwitchTest(bandwidth, delay, interval, duration):
-    '''Test priority queues on a switch topo, producing a pair of graphs.
+    Every interface of every host and switch gets the priority qdisc tree,
+    so the flows' ToS values select their priority wherever they queue. The
+    actual launch times of the flows are saved as <test>_launches.json in
+    the output folder, for lining up the flows when plotting.
 
-    Starts a high or low priority flow from one host to a receiver, through
-    the switch. At half the duration, the other host starts another flow
-    through the switch to the same receiver, but with the other priority level.
+    A run whose processes outlive the schedule by PRIO_DEADLINE_SLACK, or
+    whose flow stalls (see --live), is stored in sample_store as a failure,
+    its processes killed, and the run repeated, up to --retries times.
 
     Args:
+        topo_class: The topology class, e.g. PrioTestTopo, constructed with
+            (bandwidth, delay, prefix).
         bandwidth: A number, representing bandwidth of each link in Mbps.
         delay: A string, such as 10us, or None for no delay.
         interval: Number of seconds between each iperf3 output.
-        duration: Total duration of test, in seconds.
-    '''
-    odir = args.output_dir
-    runPrioSwitchFlows(bandwidth, delay, interval, duration,
-                       odir + '/sservlo1.json', odir + '/sservhi1.json', False)
-    runPrioSwitchFlows(bandwidth, delay, interval, duration,
-                       odir + '/sservlo2.json', odir + '/sservhi2.json', True)
-    iperfPlotJSON(odir + '/sservlo1.json',odir + '/sservhi1.json',
-                  odir + '/sservlo2.json', odir + '/sservhi2.json',
-                  odir + '/figure_17.png', duration,
-                  'Correctness of Priority Queueing in the Switch')
-
-def iperfParseJSON(filename, duration, offset):
+        schedule: List of ScheduledFlows. See flow_schedule.py.
+        outputs: Dictionary of flow name to iperf3 output file name.
+        prefix: Name prefix for nodes, to run alongside other networks.
+        pool: NetPool to get the network from, which is left running and
+            reset for the next run. If None, a network is built and stopped
+            just for this run.
     '''
-    Parse JSON output from iperf3 and return arrays of times and bandwidths.
+    own_pool = pool is None
+    if own_pool:
+        pool = NetPool()
+    key = (topo_class.__name__, bandwidth, delay, prefix)
+    ports = flowPorts(schedule)
+    test = iperfTestName(outputs[schedule[0].name], schedule[0].name)
+    length = max(flow.start + flow.length for flow in schedule)
+
+    try:
+        for attempt in range(1, args.retries + 2):
+            net = pool.get(key, lambda: startPrioNet(
+                topo_class(bandwidth, delay, prefix), bandwidth, prefix))
+            ps = {} # ProcesseS
+            print "Testing bandwidth with high and low priority flows..."
+            captures = startCaptures(net, test)
+            deadline = time() + length + PRIO_DEADLINE_SLACK
+            try:
+                monitor = startPrioServers(net, schedule, ports, interval,
+                                           outputs, ps, test, prefix)
+                launches = runSchedule(net, schedule, ports, interval, ps,
+                                       sleep=lambda seconds:
+                                           prioSleep(monitor, seconds),
+                                       prefix=prefix)
+                writeLaunches(launchFileName(outputs[schedule[0].name],
+                                             schedule[0].name), launches)
+                done = finishPrioRun(ps, monitor, outputs, deadline, test,
+                                     attempt)
+            finally:
+                stopCaptures(captures)
+                pool.release(key, ps.values())
+            if done:
+                break
+        else:
+            print "[ERROR]: %s failed %d times, giving up" % (test, attempt)
+    finally:
+        if own_pool:
+            pool.stop()
 
-    Args:
-        filename: Input JSON file name.
-        duration: Number of seconds in the file.
-        offset: Offset to apply to time values, for flows started later.
-    '''
-    X = []
-    Y = []
-    with open(filename) as f:
-        a = json.load(f)
-    for interval in a['intervals']:
-        stream = interval['streams'][0]
-        if stream['end'] + offset <= duration:
-            X.append(stream['end'] + offset)
-            Y.append(stream['bits_per_second'] / 1000000.0)
-
-    return (X, Y)
-
-def iperfPlotJSON(lofile1, hifile1, lofile2, hifile2, outfile, duration,
-                  title):
-    '''
-    Plot four json files and output as outfile.
+def startPrioNet(topo, bandwidth, prefix=''):
+    '''Start a network for priority tests, with qdiscs on every interface.'''
+    net = makeNet(topo, prefix)
+    with span('net.start'):
+        net.start()
 
-    Args:
-        lofile1, hifile1: Flow files for the first test (low priority starts
-            after high priority).
-        lofile2 hifile2: Flow files for the the second test (high priority
-            starts after low priority).
-        duration: Number of seconds in the test.
-        title: Title to use for the plot.
-    '''
-    plt.clf()
-    plt.cla()
+    print "Dumping node connections"
+    dumpNodeConnections(net.hosts)
 
-    plt.figure(figsize=(13, 5))
-    plt.suptitle(title)
+    print "Adding qdiscs"
+    for node in net.hosts + net.switches:
+        addPrioQdiscs(node, [intf for intf in node.intfNames()
+                             if intf != 'lo'], bandwidth=bandwidth)
 
-    plt.subplot(121)
-    plt.xlabel('Time (s)')
-    plt.ylabel('Throughput (Mbps)')
+    for host in net.hosts:
+        killLeftovers(host, ['iperf3'])
+    return net
 
-    loData = iperfParseJSON(lofile1, duration, duration/2)
-    loX = loData[0]
-    loY = loData[1]
-    print('loY: ', loY)
+def startPrioServers(net, schedule, ports, interval, outputs, ps, test,
+                     prefix=''):
+    '''Start the iperf3 servers of a priority test run, one per flow.
 
-    plt.plot(loX, loY, linewidth=2.0, label='Low Priority')
+    With --live, the servers stream their results to a ThroughputMonitor,
+    which is started and returned. Otherwise the servers write their JSON
+    results straight to their output files, and None is returned.
 
-    hiData = iperfParseJSON(hifile1, duration, 0)
-    hiX = hiData[0]
-    hiY = hiData[1]
-    print('hiY: ', hiY)
-    plt.plot(hiX, hiY, linewidth=2.0, label='High Priority')
+    Args:
+        net: Mininet net object.
+        schedule: List of ScheduledFlows. Each flow's server runs on its dst.
+        ports: Dictionary of flow name to iperf3 server port.
+        interval: Number of seconds between each iperf3 output.
+        outputs: Dictionary of flow name to iperf3 output file name.
+        ps: Dictionary of the run's processes, to add the servers to.
+        test: Name of the test run, e.g. 'serv1'.
+        prefix: Name prefix of the nodes in net.
+    '''
+    if not args.live:
+        for flow in schedule:
+            host = net.getNodeByName(prefix + flow.dst)
+            # No shell in between, so killing the process kills iperf3.
+            with open(outputs[flow.name], 'w') as out:
+                ps[flow.name + 'serv'] = tracing.popen(
+                    host, 'iperf3 -s -p %d -1 -i %f -J'
+                    % (ports[flow.name], interval), flow.name + 'serv',
+                    stdout=out)
+        return None
+
+    plot_file = None
+    if args.live_plot:
+        plot_file = '%s/%s_live.png' % (args.output_dir, test)
+    monitor = ThroughputMonitor(test, args.output_dir + '/telemetry.csv', ps,
+                                stall_intervals=args.stall_intervals,
+                                plot_file=plot_file)
+    for flow in schedule:
+        host = net.getNodeByName(prefix + flow.dst)
+        ps[flow.name + 'serv'] = tracing.popen(host,
+                                               'iperf3 -s -p %d -1 -i %f -J '
+                                               '--json-stream'
+                                               % (ports[flow.name], interval),
+                                               flow.name + 'serv',
+                                               stdout=subprocess.PIPE)
+        monitor.addFlow(flow.name, ps[flow.name + 'serv'],
+                        outputs[flow.name])
+    monitor.start()
+    return monitor
+
+def prioSleep(monitor, seconds):
+    '''Sleep between flow launches. False if the run was aborted instead.'''
+    with span('schedule_wait'):
+        if monitor is None:
+            sleep(seconds)
+            return True
+        return monitor.sleep(seconds)
+
+def finishPrioRun(ps, monitor, outputs, deadline, test, attempt):
+    '''Wait for a priority test run's processes and store the results.
+
+    The results of a run aborted by its monitor, or with processes still
+    running at the deadline, are not stored. The failure is, instead.
 
-    plt.legend(loc='lower left')
+    Args:
+        ps: Dictionary of the run's processes.
+        monitor: The run's ThroughputMonitor, or None.
+        outputs: Dictionary of flow name to iperf3 output file name.
+        deadline: Unix time by which every process should have exited.
+        test: Name of the test run, e.g. 'serv1'.
+        attempt: Number of the attempt at the run, from 1.
+
+    Returns whether the run succeeded.
+    '''
+    supervisor = Supervisor()
+    with span('iperf_wait'):
+        late = supervisor.waitAll(ps.values(), deadline - time())
+        failures = [supervisor.failure(ps[name], process=name)
+                    for name in sorted(ps) if ps[name] in late]
+        for p in late:
+            supervisor.kill(p)
+        for p in ps.values():
+            tracing.procDone(p)
+        if monitor is not None:
+            monitor.join()
+    print 'flows finished'
 
+    if monitor is not None and monitor.stalled is not None:
+        print "[ERROR]: run aborted, %s stalled" % monitor.stalled
+        failures.append({'kind': 'stall', 'process': monitor.stalled})
+    for failure in failures:
+        print "[WARNING]: %s %s: %s" % (test, failure['process'],
+                                       failure['kind'])
+        sample_store.addFailure(test='prio', config=test, attempt=attempt,
+                                **failure)
+    if failures:
+        return False
+    storeIperfResults(outputs)
+    return True
 
-    plt.subplot(122)
-    plt.xlabel('Time (s)')
-    plt.ylabel('Throughput (Mbps)')
+def prioSwitchTest(bandwidth, delay, interval, duration):
+    '''Test priority queues on a switch topo, producing a pair of graphs.
 
-    loData = iperfParseJSON(lofile2, duration, 0)
-    loX = loData[0]
-    loY = loData[1]
-    plt.plot(loX, loY, linewidth=2.0, label='Low Priority')
-    print('loY: ', loY)
+    Starts a high or low priority flow from one host to a receiver, through
+    the switch. At half the duration, the other host starts another flow
+    through the switch to the same receiver, but with the other priority level.
 
-    hiData = iperfParseJSON(hifile2, duration, duration/2)
-    hiX = hiData[0]
-    hiY = hiData[1]
-    plt.plot(hiX, hiY, linewidth=2.0, label='High Priority')
-    print('hiY: ', hiY)
+    Args:
+        bandwidth: A number, representing bandwidth of each link in Mbps.
+        delay: A string, such as 10us, or None for no delay.
+        interval: Number of seconds between each iperf3 output.
+        duration: Total duration of test, in seconds.
+    '''
+    # Both runs use the same network, reset in between.
+    pool = NetPool()
+    try:
+        jobs = prioSwitchTestJobs(bandwidth, delay, interval, duration)
+        for (func, fargs, kwargs) in jobs:
+            func(*fargs, **dict(kwargs, pool=pool))
+    finally:
+        pool.stop()
+    prioSwitchTestPlot(duration)
+
+def prioSwitchTestJobs(bandwidth, delay, interval, duration):
+    '''The runs making up prioSwitchTest(), as jobs for runJobs().'''
+    odir = args.output_dir
+    return [(runPrioSwitchFlows,
+             (bandwidth, delay, interval, duration,
+              odir + '/sservlo1.json', odir + '/sservhi1.json', False), {}),
+            (runPrioSwitchFlows,
+             (bandwidth, delay, interval, duration,
+              odir + '/sservlo2.json', odir + '/sservhi2.json', True), {})]
+
+def prioSwitchTestPlot(duration):
+    '''Plot the results of the runs from prioSwitchTestJobs().'''
+    render_pool.submit(iperfPlotJSON,
+                       *prioFigureArgs(args.output_dir, 'sserv', duration))
 
-    plt.legend(loc='lower left')
+def storeIperfResults(outputs):
+    '''Append the intervals of a priority run's iperf3 outputs to the store.
 
+    The test is named after the output file, e.g. 'sservlo1' gives test
+    'sserv1', with flows 'lo' and 'hi'.
 
-    plt.savefig(outfile, bbox_inches='tight')
-    print('plot saved to ', outfile)
+    Args:
+        outputs: Dictionary of flow name to iperf3 output file name.
+    '''
+    for (flow, filename) in sorted(outputs.items()):
+        sample_store.addIperfFile(iperfTestName(filename, flow), flow,
+                                  filename)
 
-def runPrioFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFirst):
+def runPrioFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFirst,
+                 prefix='', pool=None):
     '''Create a mininet simulation, and test priority queues on a host.
 
     Starts a high or low priority flow from one host to a receiver. At half
@@ -388,58 +736,14 @@ def runPrioFlows(bandwidth, delay, interval, duration, loOut, hiOut, loFirst):
         loOut: Iperf3 output file name for low priority flow information.
         hiOut: Iperf3 output file name for high priority flow information.
         loFirst: Boolean, whether low priority flow starts first or not.
+        prefix: Name prefix for nodes, to run alongside other networks.
+        pool: NetPool to get the network from, or None to build one just for
+            this run.
     '''
-    topo = PrioTestTopo(bandwidth, delay)
-    net = Mininet(topo, link=TCLink)
-    net.start()
-
-    print "Dumping node connections"
-    dumpNodeConnections(net.hosts)
-
-    h1, h2 = net.getNodeByName('h1', 'h2')
-
-    print "Adding qdiscs"
-    addPrioQdisc(h1, 'h1-eth0', bandwidth=bandwidth)
-    addPrioQdisc(h2, 'h2-eth0', bandwidth=bandwidth)
-
-    h1.cmd('killall iperf3')
-    h2.cmd('killall iperf3')
-
-    ps = {} # ProcesseS
-
-    print "Testing bandwidth with high and low priority flows..."
-    ps['hiserv'] = h2.popen('iperf3 -s -p 5001 -1 -i %f -J > %s' \
-                % (interval, hiOut), shell=True)
-    ps['loserv'] = h2.popen('iperf3 -s -p 5002 -1 -i %f -J > %s' \
-                % (interval, loOut), shell=True)
-
-    if loFirst:
-        print 'launching low priority iperf'
-        ps['loperf'] = h1.popen('iperf3 -c %s -p 5002 -i %f -t %d -S 0x4 -J' \
-                % (h2.IP(), interval, duration+1), shell=True)
-    else:
-        print 'launching high priority iperf'
-        ps['hiperf'] = h1.popen('iperf3 -c %s -p 5001 -i %f -t %d -S 0x0 -J' \
-                % (h2.IP(), interval, duration+1), shell=True)
-
-    sleep(duration/ 2)
-
-    if loFirst:
-        print 'launching high priority iperf'
-        ps['hiperf'] = h1.popen('iperf3 -c %s -p 5001 -i %f -t %d -S 0x0 -J' \
-                % (h2.IP(), interval, (duration/2)+1), shell=True)
-    else:
-        print 'launching low priority iperf'
-        ps['loperf'] = h1.popen('iperf3 -c %s -p 5002 -i %f -t %d -S 0x4 -J' \
-                % (h2.IP(), interval, (duration/2)+1), shell=True)
-
-    ps['hiperf'].wait()
-    ps['loperf'].wait()
-    ps['hiserv'].wait()
-    ps['loserv'].wait()
-    print 'flows finished'
-
-    net.stop()
+    schedule = prioSchedule(duration, loFirst, loSrc='h1', hiSrc='h1',
+                            dst='h2')
+    runPrioScenario(PrioTestTopo, bandwidth, delay, interval, schedule,
+                    {'lo': loOut, 'hi': hiOut}, prefix, pool)
 
 def prioTest(bandwidth, delay, interval, duration):
     '''Test priority queues on a host (no switchs), producing a pair of graphs.
@@ -454,19 +758,39 @@ def prioTest(bandwidth, delay, interval, duration):
         interval: Number of seconds between each iperf3 output.
         duration: Total duration of test, in seconds.
     '''
+    # Both runs use the same network, reset in between.
+    pool = NetPool()
+    try:
+        for (func, fargs, kwargs) in prioTestJobs(bandwidth, delay, interval,
+                                                  duration):
+            func(*fargs, **dict(kwargs, pool=pool))
+    finally:
+        pool.stop()
+    prioTestPlot(duration)
+
+def prioTestJobs(bandwidth, delay, interval, duration):
+    '''The runs making up prioTest(), as jobs for runJobs().'''
     odir = args.output_dir
-    runPrioFlows(bandwidth, delay, interval, duration,
-                 odir + '/servlo1.json', odir + '/servhi1.json', False)
-    runPrioFlows(bandwidth, delay, interval, duration,
-                 odir + '/servlo2.json', odir + '/servhi2.json', True)
-    iperfPlotJSON(odir + '/servlo1.json', odir + '/servhi1.json',
-                  odir + '/servlo2.json', odir + '/servhi2.json',
-                  odir + '/figure_16.png', duration,
-                  'Correctness of Priority Queueing in Linux')
+    return [(runPrioFlows,
+             (bandwidth, delay, interval, duration,
+              odir + '/servlo1.json', odir + '/servhi1.json', False), {}),
+            (runPrioFlows,
+             (bandwidth, delay, interval, duration,
+              odir + '/servlo2.json', odir + '/servhi2.json', True), {})]
+
+def prioTestPlot(duration):
+    '''Plot the results of the runs from prioTestJobs().'''
+    render_pool.submit(iperfPlotJSON,
+                       *prioFigureArgs(args.output_dir, 'serv', duration))
 
 def do_fct_tests(net, iterations, time_scale_factor, starter_data_function,
-                 fig_file_name, fct_offset):
-    '''Run a series of flow completion time tests, and make a bar chart.
+                 fig_file_name, fct_offset, tcp_type=None, prefix='',
+                 sample_tags=None, min_iterations=None, ci_target=None):
+    '''Run a series of flow completion time tests, for a bar chart.
+
+    Returns the chart as (plotBarClusers, args), to be drawn with
+    render_pool.submit(plotBarClusers, *args), so the caller can carry on
+    testing while it renders.
 
     Args:
         net: Mininet net object.
@@ -481,77 +805,301 @@ def do_fct_tests(net, iterations, time_scale_factor, starter_data_function,
         fig_file_name: If specified, where to save the resulting plot.
         fct_offset: Offset time (in post-scaling units) to adjust for
             difference in measuring technique.
+        tcp_type: If not None, the congestion control algorithm to set on
+            each test socket, rather than relying on the system default.
+        prefix: Name prefix of the nodes in net.
+        sample_tags: Extra columns to store with every raw sample, e.g.
+            the config name and tcp_type. See configSampleTags().
+        min_iterations, ci_target: If ci_target is given, iterations is the
+            maximum number of tests, and each flow length and protocol is
+            sampled until its confidence interval is tight enough. See
+            fct_test().
     '''
 
-    # Flow lengths for the flow completion times.
-    flow_lengths = [1460, 7300, 14600, 73000, 146000, 730000, 1460000]
-    # For debug:
-    #flow_lengths = [730000]
-
-    # Start with the bar-graph data from the paper
-    (data, flow_types, flow_type_colors, title) = starter_data_function()
+    # One server per protocol serves every flow length.
+    servers = startFctServers(net, tcp_type, prefix)
 
     # Do flow-completion-time tests for each flow length,
-    # using regular TCP and rc3, and add to graph data structure
-    for flow_length in flow_lengths:
-        for (rc3, flow_type) in [(False, 'Mininet Regular TCP'),
-                                 (True,  'Mininet RC3')]:
-            results = fct_test(net, iterations=iterations, size=flow_length,
-                               use_rc3=rc3)
-            print "results", results
-            o = fct_offset
-            s = time_scale_factor * 0.001 # external scale and msecs to secs
-            data[flow_length][flow_type] = {'mean'  : o + s * avg(results),
-                                            'stddev': s * stddev(results)}
-
-    plotBarClusers(data, flow_types, flow_type_colors, title, fig_file_name)
-
-def fct_test(net, skip = 2, size = 1024*1024, iterations = 10, use_rc3=False):
+    # using regular TCP and rc3, collecting samples[flow_length][protocol]
+    samples = []
+    try:
+        for flow_length in FCT_FLOW_LENGTHS:
+            samples.append([])
+            for (protocol, flow_type) in FCT_FLOW_TYPES:
+                rc3 = protocol == 'rc3'
+                results = fct_test(net, iterations=iterations,
+                                   size=flow_length, use_rc3=rc3,
+                                   tcp_type=tcp_type, prefix=prefix,
+                                   sample_tags=sample_tags,
+                                   min_iterations=min_iterations,
+                                   ci_target=ci_target)
+                print "results", results
+                samples[-1].append(results)
+    finally:
+        stopFctServers(servers)
+
+    return fctChart(sampleMatrix(samples), time_scale_factor,
+                    starter_data_function, fig_file_name, fct_offset)
+
+def hostPairs(prefix=''):
+    '''(sender, receiver) names of the h1 - s1 - h2 host pair of each of
+    the --pairs.'''
+    return [(p + 'h1', p + 'h2') for p in pairPrefixes(prefix, args.pairs)]
+
+def startFctServers(net, tcp_type=None, prefix='', host_pairs=None):
+    '''Start a long-lived fcttest server on each receiver for each protocol.
+
+    fcttest servers read each flow's size from its header, and serve any
+    number of flows at once, so these serve every flow length, and every
+    sender, until stopped. They listen on FCT_SERVER_PORTS.
+
+    Args:
+        host_pairs: (sender, receiver) names, hostPairs(prefix) by default.
+
+    Returns a dictionary of (receiver, protocol) to server process.
+    '''
+    if host_pairs is None:
+        host_pairs = hostPairs(prefix)
+    servers = {}
+    for receiver in sorted(set(dst for (src, dst) in host_pairs)):
+        h2 = net.getNodeByName(receiver)
+        for (protocol, flow_type) in FCT_FLOW_TYPES:
+            opts = "-r" if protocol == 'rc3' else ""
+            if tcp_type is not None:
+                opts += " -C %s" % tcp_type
+            servers[(receiver, protocol)] = popenServer(
+                h2, './fcttest -s -p %d %s'
+                % (FCT_SERVER_PORTS[protocol], opts), 'fcttest_server')
+    return servers
+
+def stopFctServers(servers):
+    '''Stop servers from startFctServers(), reporting any that died.'''
+    for server in servers.values():
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+            serverOutput(server)
+        else:
+            print "[ERROR]: fcttest error: %s" % serverOutput(server)
+        tracing.procDone(server)
+
+def popenServer(node, cmd, name):
+    '''Start a long-lived server, with its output to a temporary file.
+
+    Nothing reads a server's output while it runs, so a pipe could fill up
+    and block it. Read the output with serverOutput() once it's stopped.
+    '''
+    log = tempfile.TemporaryFile()
+    server = tracing.popen(node, cmd, name, stdout=log,
+                           stderr=subprocess.STDOUT)
+    server.log = log
+    return server
+
+def serverOutput(server):
+    '''The output of a server from popenServer(), closing its file.'''
+    server.log.seek(0)
+    output = server.log.read()
+    server.log.close()
+    return output
+
+def fct_test(net, skip = 2, size = 1024*1024, iterations = 10, use_rc3=False,
+             tcp_type=None, prefix='', sample_tags=None, min_iterations=None,
+             ci_target=None, host_pairs=None):
     '''Run the fcttest multiple times, return list of times in milliseconds.
 
+    The protocol's servers must already be running, see startFctServers().
+
+    Flows run in rounds, one flow on each host pair at once, so each round
+    gives one sample per pair. The first skip rounds are
+    skipped, and the last round only uses as many pairs as there are
+    samples left to collect.
+
+    If ci_target is given, sampling is sequential: stop after the first
+    round that leaves at least min_iterations results with a confidence
+    interval of the mean narrower than ci_target, relative to the mean, or
+    once iterations results have been collected.
+
     Args:
         net: Mininet net object.
-        skip: The number of initial tests to run without including in results.
+        skip: The number of initial rounds to run without including in
+            results.
         size: Size of the flow, in bytes.
-        iterations: Number of tests to do / results to attempt to return.
+        iterations: Number of tests to do / results to attempt to return. The
+            maximum number, if ci_target is given.
         use_rc3: If True, use RC3 instead of normal TCP.
+        tcp_type: If not None, the congestion control algorithm to use.
+        prefix: Name prefix of the nodes in net.
+        sample_tags: Extra columns to store with every raw sample.
+        host_pairs: (sender, receiver) names of the host pairs, by default
+            those of the --pairs, from hostPairs(prefix).
+        min_iterations: Minimum number of results before stopping early.
+            Defaults to 3, which is the fewest that gives a usable interval.
+        ci_target: Target relative width of the 95% confidence interval,
+            e.g. 0.05 for +/-2.5% of the mean, or None to always run
+            iterations tests.
+
+    Every sample, including skipped ones, is also appended to sample_store,
+    with the TCP_INFO fields of its sending socket. With --rc3-log and one
+    host pair, so is every RC3 kernel log record of its flow.
+
+    If sample_tags give the bandwidth and delay, each round has a deadline
+    from supervisor.flowDeadline(). A pair whose client misses it, or
+    exits, has the failure stored in sample_store, and its client killed
+    and restarted, so the sample is taken again in a later round. Like the
+    skip rounds, the first flow of a restarted client is a warm-up, stored
+    as skipped and not in results. After --retries failures in a row on one
+    pair, the test stops.
     '''
 
     results = []
 
-    h1, h2 = net.getNodeByName('h1', 'h2')
-
     rc3_arg_setting = "-r" if use_rc3 else ""
-
-    # Start server
-    p_srv = h2.popen('./fcttest -s -p 5678 -g %d %s' % (size, rc3_arg_setting),
-                     stdout = subprocess.PIPE, stderr = subprocess.PIPE)
-
-    # Run the client iterations + skip times
-    for i in range(0,iterations + skip):
-        p_clt = h1.popen('./fcttest -c -a %s -p 5678 -g %d %s'
-                         % (h2.IP(), size, rc3_arg_setting),
-                         stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    if tcp_type is not None:
+        rc3_arg_setting += " -C %s" % tcp_type
+    if kernel_log is not None:
+        rc3_arg_setting += " -l"
+        if args.rc3_log_time:
+            rc3_arg_setting += " -t"
+
+    port = FCT_SERVER_PORTS['rc3' if use_rc3 else 'tcp']
+    protocol = 'rc3' if use_rc3 else 'tcp'
+
+    if min_iterations is None:
+        min_iterations = 3
+
+    # Run all flows of each pair from one client process, which runs one
+    # flow for each line written to its stdin, and prints one result per
+    # line.
+    if host_pairs is None:
+        host_pairs = hostPairs(prefix)
+    supervisor = Supervisor()
+    def startClient(src, dst):
+        h1, h2 = net.getNodeByName(src, dst)
+        client = tracing.popen(
+            h1, './fcttest -c -a %s -p %d -g %d -n 0 -i %s'
+            % (h2.IP(), port, size, rc3_arg_setting), 'fcttest_client',
+            stdin = subprocess.PIPE,
+            stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        supervisor.watch(client)
+        return client
+    clients = [startClient(src, dst) for (src, dst) in host_pairs]
+    tags = sample_tags or {}
+    deadline = None
+    if tags.get('bandwidth') is not None:
+        deadline = flowDeadline(size, tags['bandwidth'], tags.get('delay'),
+                                flows=len(clients),
+                                factor=args.deadline_factor)
+    # Failures in a row of each pair.
+    failures = [0] * len(clients)
+    # Pairs whose client was restarted, and hasn't run a warm-up flow yet.
+    restarted = [False] * len(clients)
+    # The kernel log can't tell flows of different pairs apart.
+    log = kernel_log if len(clients) == 1 else None
+    i = 0
+    failed = False
+    while not failed and len(results) < iterations:
+        skip_this = i < skip
+        active = clients if skip_this else \
+            clients[:iterations - len(results)]
+        label = '%s %d %d' % (protocol, size, i)
+        with span('fct_flow', size=size, rc3=use_rc3, iteration=i,
+                  pairs=len(active)):
+            if log is not None:
+                log.begin(label)
+            for p_clt in active:
+                try:
+                    p_clt.stdin.write('\n')
+                    p_clt.stdin.flush()
+                except IOError:
+                    pass # Exited, which readLines() reports.
+            lines = supervisor.readLines(active, deadline)
+        log_fields = {}
+        if log is not None:
+            with span('rc3_log', size=size, iteration=i):
+                (records, lost) = log.end(label)
+            # No records at all means nothing was logged, or parsed,
+            # rather than a flow without packets.
+            if records or lost:
+                log_fields = {'log_records': len(records), 'log_lost': lost}
+            sample_store.addRc3Log(records, flow_length=size,
+                                   protocol=protocol, iteration=i, pair=0,
+                                   **(sample_tags or {}))
+        for (pair, line) in enumerate(lines):
+            if line is None:
+                failures[pair] += 1
+                failure = supervisor.failure(
+                    clients[pair], test='fct', process='fcttest_client',
+                    flow_length=size, protocol=protocol, iteration=i,
+                    pair=pair, attempt=failures[pair], **tags)
+                sample_store.addFailure(**failure)
+                print "[WARNING]: fcttest client %s on pair %d, " \
+                      "size = %d, use_rc3 = %s, round %d: %s" \
+                      % (failure['kind'], pair, size, str(use_rc3), i,
+                         failure['detail'])
+                supervisor.kill(clients[pair])
+                clients[pair].communicate()
+                tracing.procDone(clients[pair])
+                if failures[pair] > args.retries:
+                    clients[pair] = None
+                    failed = True
+                else:
+                    clients[pair] = startClient(*host_pairs[pair])
+                    restarted[pair] = skip > 0
+                continue
+            failures[pair] = 0
+            skipped = skip_this or restarted[pair]
+            restarted[pair] = False
+            (time, tcp_info) = parseFctResult(line)
+            print "skip_this = %s, use_rc3 = %s, size = %d, pair = %d, " \
+                  "time (ms) = %f" % (skipped, str(use_rc3), size, pair,
+                                      time)
+            columns = dict(tcp_info, **log_fields)
+            columns.update(sample_tags or {})
+            sample_store.addFctSample(flow_length=size, protocol=protocol,
+                                      iteration=i, skipped=int(skipped),
+                                      pair=pair, pairs=len(clients),
+                                      fct_ms=time, **columns)
+            if not skipped:
+               results.append(time)
+        i += 1
+        if (ci_target is not None and len(results) >= min_iterations and
+                relativeCIWidth(results) <= ci_target):
+            print "converged after %d results, use_rc3 = %s, size = %d" \
+                   % (len(results), str(use_rc3), size)
+            break
+    for (pair, p_clt) in enumerate(clients):
+        if p_clt is None:
+            print "[ERROR]: fcttest client on pair %d gave up after %d " \
+                  "failures, in round %d of %d" % (pair, failures[pair], i,
+                                                   iterations + skip)
+            continue
         (out, err) = p_clt.communicate()
+        tracing.procDone(p_clt)
         if err or p_clt.returncode != 0:
-            print "[ERROR]: fcttest client error:", err
-        else:
-            skip_this = i < skip
-            time = float(out)
-            print "skip_this = %s, use_rc3 = %s, size = %d, time (ms) = %f" \
-                   % (skip_this, str(use_rc3), size, time)
-            if not skip_this:
-               results.append(time)
-
-    # Kill the server
-    if p_srv.poll() is None:
-      p_srv.kill()
-    else:
-      (out, err) = p_srv.communicate()
-      print "[ERROR]: fcttest error: %s" % err
+            print "[ERROR]: fcttest client error on pair %d after %d of %d" \
+                  " rounds:" % (pair, i, iterations + skip), err
 
     return results
 
+def parseFctResult(line):
+    '''Parse an fcttest -i result line.
+
+    Returns (fct_ms, tcp_info), where tcp_info is a dictionary of the
+    TCP_INFO fields, None where the kernel didn't report them.
+    '''
+    fields = line.split()
+    tcp_info = {}
+    for field in fields[1:]:
+        (name, value) = field.split('=', 1)
+        value = float(value)
+        tcp_info[name] = None if value < 0 else value
+    return (float(fields[0]), tcp_info)
+
+def relativeCIWidth(results):
+    '''Width of the 95% confidence interval of the mean, over the mean.'''
+    (low, high) = confidenceInterval(sampleMatrix(results))
+    return (high - low) / abs(float(sum(results)) / len(results))
+
 def setupNetVariables():
     '''Setup Linux networking variables.
 
@@ -565,14 +1113,16 @@ def setupNetVariables():
                 "net.ipv4.tcp_wmem='10240 2048000000 2048000000'",
                 'net.core.rmem_max=2048000000',
                 "net.ipv4.tcp_rmem='10240 2048000000 2048000000'"];
-    for setting in settings:
-        subprocess.call("sysctl -w %s" % (setting,), shell=True)
+    with span('setupNetVariables'):
+        for setting in settings:
+            subprocess.call("sysctl -w %s" % (setting,), shell=True)
 
 def rc3Test(configs):
     ''' Run a test of flow completion times according to config.
 
     Args:
       configs: A dictionary with the following keys:
+        'name': Name identifying the config's samples in sample_store.
         'tcp_type': The tcp algorithm to use, i.e. 'reno' or 'cubic'.
         'bandwidth': The speed of the links in Mbps.
         'delay': The delay to use at each host egress, such as '100ms'
@@ -580,7 +1130,12 @@ def rc3Test(configs):
              to delay/rate scaling. E.g. if rate is scaled down by 100, and
              delay is scaled up by 100, then time_scale_factor = 1.0/100.0
         'flows_per_test': Number of times to do a flow completion test
-             for each flow length.
+             for each flow length. The maximum, if ci_target is not None.
+        'min_flows_per_test': Minimum number of flow completion tests per
+             flow length and protocol, if ci_target is not None.
+        'ci_target': Relative confidence interval width at which to stop
+             testing a flow length and protocol, or None to always do
+             flows_per_test tests. See fct_test().
         'starter_data_function': A function which returns plot data to augment
              with the test results. See figure15_helpers.py
         'fig_file_name': Name to use for plot output file.
@@ -589,14 +1144,13 @@ def rc3Test(configs):
     '''
     setupNetVariables()
 
-    topo = RC3Topo(100) # Rate will be overridden by qdiscs
-    net = Mininet(topo, link=TCLink)
-    net.start()
+    net = makeRC3Net()
+    with span('net.start'):
+        net.start()
 
-    print "Dumping node connections"
-    dumpNodeConnections(net.hosts)
-
-    h1, h2, s1 = net.getNodeByName('h1', 'h2', 's1')
+    if args.backend == 'mininet':
+        print "Dumping node connections"
+        dumpNodeConnections(net.hosts)
 
     # Do test under each configuration.
     for config in configs:
@@ -622,33 +1176,516 @@ def rc3Test(configs):
         else:
             print out
 
-        print "Configuring qdiscs"
-        addPrioQdisc(h1, 'h1-eth0', bandwidth=bandwidth, delay=delay)
-        addPrioQdisc(h2, 'h2-eth0', bandwidth=bandwidth, delay=delay)
-        addPrioQdisc(s1, 's1-eth1', bandwidth=bandwidth) # No delay
-        addPrioQdisc(s1, 's1-eth2', bandwidth=bandwidth) # No delay
+        configureRC3Qdiscs(net, bandwidth, delay)
+
+        samplers = startQdiscSamplers(net, config['name'])
+        captures = startCaptures(net, config['name'])
+        try:
+            (plot, plot_args) = do_fct_tests(net, flows_per_test,
+                time_scale_factor=time_scale_factor,
+                starter_data_function = starter_data_function,
+                fig_file_name = fig_file_name, fct_offset=fct_offset,
+                sample_tags=configSampleTags(config),
+                min_iterations=config['min_flows_per_test'],
+                ci_target=config['ci_target'])
+        finally:
+            stopQdiscSamplers(samplers)
+            stopCaptures(captures)
+        render_pool.submit(plot, *plot_args)
+    with span('net.stop'):
+        net.stop()
+
+def configSampleTags(config):
+    '''Columns identifying an rc3Test() config, for the sample store.'''
+    return {'config': config['name'],
+            'tcp_type': config['tcp_type'],
+            'bandwidth': config['bandwidth'],
+            'delay': config['delay']}
+
+def configureRC3Qdiscs(net, bandwidth, delay, prefix=''):
+    '''Setup the qdiscs of an RC3Topo network for one test configuration.'''
+    print "Configuring qdiscs"
+    for p in pairPrefixes(prefix, args.pairs):
+        h1, h2, s1 = net.getNodeByName(p + 'h1', p + 'h2', p + 's1')
+        addPrioQdisc(h1, p + 'h1-eth0', bandwidth=bandwidth, delay=delay)
+        addPrioQdisc(h2, p + 'h2-eth0', bandwidth=bandwidth, delay=delay)
+        addPrioQdiscs(s1, [p + 's1-eth1', p + 's1-eth2'],
+                      bandwidth=bandwidth) # No delay
+
+def startQdiscSamplers(net, name, prefix=''):
+    '''Start sampling the qdiscs set up by configureRC3Qdiscs(), if enabled.
+
+    Each node gets a qdisc_sampler.py process in its own network namespace,
+    which writes args.output_dir/qdisc_<name>_<node>.npz when stopped. With
+    several --pairs, <node> includes the pair, e.g. p1h2.
+
+    Returns the list of sampler processes, empty if --qdisc-stats is not set.
+    '''
+    if args.qdisc_stats is None:
+        return []
+    node_devs = [('h1', ['h1-eth0']),
+                 ('h2', ['h2-eth0']),
+                 ('s1', ['s1-eth1', 's1-eth2'])]
+    samplers = []
+    for p in pairPrefixes(prefix, args.pairs):
+        pair = p[len(prefix):]
+        for (name_in_topo, devs) in node_devs:
+            node = net.getNodeByName(p + name_in_topo)
+            out = '%s/qdisc_%s_%s.npz' % (args.output_dir, name,
+                                          pair + name_in_topo)
+            samplers.append(tracing.popen(
+                node, 'python qdisc_sampler.py -i %f -o %s %s'
+                % (args.qdisc_stats, out, ' '.join(p + d for d in devs)),
+                'qdisc_sampler'))
+    return samplers
+
+def stopQdiscSamplers(samplers):
+    '''Stop samplers from startQdiscSamplers(), waiting for their output.'''
+    for sampler in samplers:
+        if sampler.poll() is None:
+            sampler.send_signal(SIGINT)
+    for sampler in samplers:
+        sampler.wait()
+        tracing.procDone(sampler)
+        if sampler.returncode != 0:
+            print "[ERROR]: qdisc sampler exited with", sampler.returncode
+
+def startCaptures(net, name):
+    '''Start capturing packet headers in net, if --capture is set.
+
+    Every switch interface gets a tcpdump, or every host interface if net
+    has no switch, writing args.output_dir/capture_<name>_<intf>.pcap.
+
+    Returns a list of (process, pcap file), empty if --capture is not set.
+    '''
+    if not args.capture:
+        return []
+    captures = []
+    for node in net.switches or net.hosts:
+        for intf in node.intfNames():
+            if intf == 'lo':
+                continue
+            pcap = '%s/capture_%s_%s.pcap' % (args.output_dir, name, intf)
+            captures.append((tracing.popen(
+                node, 'tcpdump -i %s -s %d -n -B 8192 -Z root -w %s tcp'
+                % (intf, CAPTURE_SNAPLEN, pcap), 'tcpdump'), pcap))
+    return captures
+
+def stopCaptures(captures):
+    '''Stop captures from startCaptures(), and summarize each capture.
+
+    The statistics of capture_<name>_<intf>.pcap are saved next to it, as
+    capture_<name>_<intf>.npz and .txt. See pcap_reader.py.
+    '''
+    for (capture, pcap) in captures:
+        if capture.poll() is None:
+            capture.send_signal(SIGINT)
+    for (capture, pcap) in captures:
+        (out, err) = capture.communicate()
+        tracing.procDone(capture)
+        if not os.path.exists(pcap):
+            print "[ERROR]: tcpdump wrote no %s: %s" % (pcap, err)
+            continue
+        with span('captureStats', pcap=os.path.basename(pcap)):
+            (stats, skipped) = captureStats(pcap)
+        stem = os.path.splitext(pcap)[0]
+        saveCaptureStats(stats, stem + '.npz')
+        with open(stem + '.txt', 'w') as f:
+            f.write(captureReport(stats) + '\n')
+
+def rc3ConfigJob(config, prefix):
+    '''Run one rc3Test() configuration on its own network, for runJobs().
+
+    The congestion control algorithm is set per socket instead of through
+    the system-wide sysctl, so configurations can run at the same time.
+    setupNetVariables() must already have been called.
+
+    Returns the configuration's chart, as from do_fct_tests(), for the
+    parent process to render.
+
+    Args:
+      config: One configuration dictionary, as described in rc3Test().
+      prefix: Name prefix for this network's nodes, e.g. from jobPrefix().
+    '''
+    net = makeRC3Net(prefix)
+    with span('net.start'):
+        net.start()
+    samplers = []
+    captures = []
+    try:
+        configureRC3Qdiscs(net, config['bandwidth'], config['delay'], prefix)
+        samplers = startQdiscSamplers(net, config['name'], prefix)
+        captures = startCaptures(net, config['name'])
+        return do_fct_tests(net, config['flows_per_test'],
+                            time_scale_factor=config['time_scale_factor'],
+                            starter_data_function=config['starter_data_function'],
+                            fig_file_name=config['fig_file_name'],
+                            fct_offset=config['fct_offset'],
+                            tcp_type=config['tcp_type'], prefix=prefix,
+                            sample_tags=configSampleTags(config),
+                            min_iterations=config['min_flows_per_test'],
+                            ci_target=config['ci_target'])
+    finally:
+        stopQdiscSamplers(samplers)
+        stopCaptures(captures)
+        with span('net.stop'):
+            net.stop()
+
+def parallelTest(prio_args, configs, processes, cpus=None):
+    '''Run the priority queue tests and rc3Test(configs) in parallel.
+
+    Each priority test run and each FCT configuration is an independent job
+    with its own Mininet network, and the figures are produced just as in
+    the serial tests.
+
+    Args:
+      prio_args: (bandwidth, delay, interval, duration) for prioTest() and
+           prioSwitchTest(), or None to skip them.
+      configs: FCT test configurations, as described in rc3Test().
+      processes: Number of jobs to run at once.
+      cpus: Optional list of CPUs to pin the jobs to, round robin.
+    '''
+    setupNetVariables()
+
+    jobs = [(rc3ConfigJob, (config,), {}) for config in configs]
+    if prio_args is not None:
+        jobs = (prioTestJobs(*prio_args) +
+                prioSwitchTestJobs(*prio_args) + jobs)
+    # Give every job its own node names, so interfaces never collide.
+    jobs = [(func, fargs, dict(kwargs, prefix=jobPrefix(i)))
+            for (i, (func, fargs, kwargs)) in enumerate(jobs)]
+
+    results = runJobs(jobs, processes=processes, cpus=cpus)
+    for result in results:
+        if result is not None:
+            (plot, plot_args) = result
+            render_pool.submit(plot, *plot_args)
+
+    if prio_args is not None:
+        duration = prio_args[3]
+        prioTestPlot(duration)
+        prioSwitchTestPlot(duration)
+
+def workloadTest(cdf, load, num_flows):
+    '''Run a concurrent workload over regular TCP and RC3, and compare.
+
+    Each protocol gets the same flows (arrival times and sizes), between
+    one fcttest server on h2 and one workload.py client on h1, over the RC3Topo
+    network with the qdiscs of the FCT tests. Every flow is saved to
+    sample_store, and the per flow size bucket FCTs and slowdowns are
+    written to args.output_dir/workload_<cdf>.txt. A client still running
+    once all of the workload's bytes could have crossed the link after its
+    last arrival (see supervisor.flowDeadline()), or failing, is killed
+    and stored in sample_store as a failure.
+
+    Args:
+      cdf: Flow size CDF name, e.g. 'websearch', or CDF file. See
+           workload.loadCdf().
+      load: Target load of the bottleneck link, e.g. 0.5.
+      num_flows: Number of flows per protocol.
+    '''
+    settings = WORKLOAD_SETTINGS
+    bandwidth = settings['bandwidth']
+    setupNetVariables()
+
+    net = makeRC3Net()
+    with span('net.start'):
+        net.start()
+    # Only the first host pair is used, if there are several.
+    p = pairPrefixes('', args.pairs)[0]
+    h1, h2 = net.getNodeByName(p + 'h1', p + 'h2')
+    configureRC3Qdiscs(net, bandwidth, settings['delay'])
+
+    name = os.path.splitext(os.path.basename(cdf))[0]
+    reports = []
+    # Until every byte of the workload could have crossed the link after
+    # the last arrival.
+    (arrivals, sizes) = generateWorkload(loadCdf(cdf), load, bandwidth,
+                                         num_flows, settings['seed'])
+    deadline = arrivals[-1] + flowDeadline(int(sizes.sum()), bandwidth,
+                                           settings['delay'],
+                                           factor=args.deadline_factor)
+    supervisor = Supervisor()
+    try:
+        for (protocol, flow_type) in FCT_FLOW_TYPES:
+            opts = '-C %s' % settings['tcp_type']
+            if protocol == 'rc3':
+                opts += ' -r'
+            server = popenServer(h2, './fcttest -s -p %d %s'
+                                 % (settings['port'], opts),
+                                 'fcttest_server')
+            sleep(1)
+            out = '%s/workload_%s_%s.npz' % (args.output_dir, name, protocol)
+            print "Running %d %s flows over %s at load %.2f" \
+                % (num_flows, name, flow_type, load)
+            with span('workload', protocol=protocol):
+                client = tracing.popen(
+                    h1, 'python workload.py -a %s -p %d %s --cdf %s '
+                        '--load %f --bandwidth %f -n %d --seed %d -o %s'
+                    % (h2.IP(), settings['port'], opts, cdf, load, bandwidth,
+                       num_flows, settings['seed'], out), 'workload_client')
+                supervisor.watch(client)
+                late = supervisor.waitAll([client], deadline)
+            failure = None
+            if late or client.returncode != 0:
+                failure = supervisor.failure(
+                    client, test='workload', process='workload_client',
+                    config=name, tcp_type=settings['tcp_type'],
+                    bandwidth=bandwidth, delay=settings['delay'],
+                    protocol=protocol)
+                sample_store.addFailure(**failure)
+                supervisor.kill(client)
+            (stdout, stderr) = client.communicate()
+            tracing.procDone(client)
+            server.terminate()
+            server.wait()
+            serverOutput(server)
+            tracing.procDone(server)
+            print stdout
+            if failure is not None:
+                print "[ERROR]: workload client failed (%s):" \
+                    % failure['kind'], failure['detail'] or stderr
+                continue
+
+            flows = loadFlows(out, bandwidth)
+            sample_store.addWorkloadFlows(flows, workload=name,
+                                          protocol=protocol,
+                                          tcp_type=settings['tcp_type'],
+                                          load=load, bandwidth=bandwidth,
+                                          delay=settings['delay'])
+            reports.append((protocol, bucketReport(flows['size'],
+                                                   flows['fct_ms'],
+                                                   flows['slowdown'])))
+    finally:
+        with span('net.stop'):
+            net.stop()
+
+    report = formatReport(reports)
+    with open('%s/workload_%s.txt' % (args.output_dir, name), 'w') as f:
+        f.write(report + '\n')
+    print report
+
+def topologyTest(spec):
+    '''Run the FCT tests on a multi-tier topology, over TCP and RC3.
+
+    Each round runs one flow on every pair of spec.flow_pairs at once, e.g.
+    all senders to the receiver of an incast, so the flows of a round
+    compete in the fabric. Every link gets the priority qdiscs at its own
+    rate. Samples are stored with config spec.name, and the statistics
+    written to args.output_dir/<spec.name>.txt.
+
+    Args:
+      spec: A topologies.TopoSpec, e.g. from parseTopology().
+    '''
+    settings = TOPOLOGY_SETTINGS
+    tags = {'config': spec.name,
+            'tcp_type': settings['tcp_type'],
+            'bandwidth': settings['bandwidth'],
+            'delay': settings['delay']}
+    setupNetVariables()
+
+    net = makeSpecNet(spec)
+    with span('net.start'):
+        net.start()
+    samples = []
+    try:
+        applySpecQdiscs(net, spec, settings['delay'])
+        servers = startFctServers(net, settings['tcp_type'],
+                                  host_pairs=spec.flow_pairs)
+        try:
+            # Every round is complete, num_flows samples per host pair.
+            iterations = args.num_flows * len(spec.flow_pairs)
+            for flow_length in FCT_FLOW_LENGTHS:
+                samples.append([])
+                for (protocol, flow_type) in FCT_FLOW_TYPES:
+                    samples[-1].append(fct_test(
+                        net, iterations=iterations, size=flow_length,
+                        use_rc3=protocol == 'rc3',
+                        tcp_type=settings['tcp_type'], sample_tags=tags,
+                        host_pairs=spec.flow_pairs))
+        finally:
+            stopFctServers(servers)
+    finally:
+        with span('net.stop'):
+            net.stop()
+
+    table = fctStatsTable(sampleMatrix(samples), 1.0, 0.0)
+    with open('%s/%s.txt' % (args.output_dir, spec.name), 'w') as f:
+        f.write(table + '\n')
+    print "%s, %d flows per round:" % (spec.name, len(spec.flow_pairs))
+    print table
+
+def calibrationFlows(net, size, count, bandwidth, delay=None):
+    '''Run count flows of size bytes on the first host pair, one at a time.
+
+    The tcp server of startFctServers() must be running. A client that
+    exits with an error, or doesn't finish within the flows' deadlines
+    (see supervisor.flowDeadline()), is stored in sample_store as a
+    failure, and killed. Returns a list of (fct_ms, tcp_info) of the flows
+    that completed, as from parseFctResult().
+
+    Args:
+        bandwidth, delay: Rate (Mbps) and delay of the links, for the
+            deadline.
+    '''
+    (src, dst) = hostPairs()[0]
+    h1, h2 = net.getNodeByName(src, dst)
+    supervisor = Supervisor()
+    client = tracing.popen(h1, './fcttest -c -a %s -p %d -g %d -n %d -i'
+                           % (h2.IP(), FCT_SERVER_PORTS['tcp'], size, count),
+                           'fcttest_client')
+    supervisor.watch(client)
+    deadline = count * flowDeadline(size, bandwidth, delay,
+                                    factor=args.deadline_factor)
+    if supervisor.waitAll([client], deadline) or client.returncode != 0:
+        failure = supervisor.failure(client, test='calibration',
+                                     process='fcttest_client',
+                                     bandwidth=bandwidth, delay=delay,
+                                     flow_length=size, protocol='tcp')
+        sample_store.addFailure(**failure)
+        print "[ERROR]: fcttest client %s: %s" % (failure['kind'],
+                                                 failure['detail'])
+        supervisor.kill(client)
+    (out, err) = client.communicate()
+    tracing.procDone(client)
+    return [parseFctResult(line) for line in out.splitlines() if line]
+
+def calibrationTest(configs, budget):
+    '''Calibrate the scale of each FCT test configuration on this machine.
+
+    Benchmarks run on the RC3Topo network with the qdiscs of the FCT tests,
+    see calibrate.py. The result is saved as
+    args.output_dir/calibration.json, and printed.
+
+    Args:
+      configs: FCT test configurations, as described in rc3Test().
+      budget: Largest relative rate or delay error to accept.
 
-        do_fct_tests(net, flows_per_test, time_scale_factor=time_scale_factor,
-                     starter_data_function = starter_data_function,
-                     fig_file_name = fig_file_name, fct_offset=fct_offset)
-    net.stop()
+    Returns the calibration, for applyCalibration().
+    '''
+    setupNetVariables()
+    net = makeRC3Net()
+    with span('net.start'):
+        net.start()
+
+    def measureRate(bandwidth):
+        configureRC3Qdiscs(net, bandwidth, None)
+        size = int(bandwidth * 1e6 / 8 * RATE_TEST_SECONDS)
+        with span('calibrateRate', bandwidth=bandwidth):
+            results = calibrationFlows(net, size, 3, bandwidth)
+        if not results:
+            return float('inf')
+        return min(rateError(bandwidth, size, fct_ms)
+                   for (fct_ms, tcp_info) in results)
+
+    def measureDelay(bandwidth, delay):
+        configureRC3Qdiscs(net, bandwidth, delay)
+        with span('calibrateDelay', bandwidth=bandwidth, delay=delay):
+            results = calibrationFlows(net, 1, 5, bandwidth, delay)
+        rtts = [tcp_info['rtt_us'] for (fct_ms, tcp_info) in results
+                if tcp_info.get('rtt_us') is not None]
+        if not rtts:
+            return float('inf')
+        return delayError(bandwidth, delay, min(rtts))
+
+    servers = startFctServers(net)
+    try:
+        calibration = calibrate(configs, measureRate, measureDelay, budget)
+    finally:
+        stopFctServers(servers)
+        with span('net.stop'):
+            net.stop()
+
+    saveCalibration(calibration, args.output_dir + '/calibration.json')
+    print calibrationTable(calibration)
+    return calibration
+
+def writeTraceReport():
+    '''Export the spans recorded so far as trace.json and trace_summary.txt.
+
+    Open trace.json in chrome://tracing or https://ui.perfetto.dev. See
+    tracing.py.
+    '''
+    events_file = args.output_dir + '/trace_events.jsonl'
+    if not os.path.exists(events_file):
+        return
+    tracing.exportTrace(events_file, args.output_dir + '/trace.json')
+    summary = tracing.summaryTable(events_file)
+    with open(args.output_dir + '/trace_summary.txt', 'w') as f:
+        f.write(summary)
+    print summary
 
 if __name__ == '__main__':
     '''Run prioirty queue correctness tests, and flow completion time tests.'''
-    lg.setLogLevel('info')
+    if Mininet is not None:
+        lg.setLogLevel('info')
+
+    # Time the phases of this run. Parallel workers inherit the events file.
+    events_file = args.output_dir + '/trace_events.jsonl'
+    if os.path.exists(events_file):
+        os.remove(events_file)
+    tracing.setEventsFile(events_file)
+
+    if args.topology is not None:
+        with span('topologyTest'):
+            topologyTest(topology_spec)
+        writeTraceReport()
+        exit(0)
+
+    if args.workload is not None:
+        with span('workloadTest'):
+            workloadTest(args.workload, args.load, args.workload_flows)
+        writeTraceReport()
+        exit(0)
+
+    if args.calibrate:
+        with span('calibrationTest'):
+            calibration = calibrationTest(RC3_fct_test_configs,
+                                          args.error_budget)
+        RC3_fct_test_configs = applyCalibration(RC3_fct_test_configs,
+                                                calibration)
+    elif args.calibration is not None:
+        RC3_fct_test_configs = applyCalibration(
+            RC3_fct_test_configs, loadCalibration(args.calibration))
+
+    # Fork the figure renderer before any networks or threads exist.
+    render_pool.start()
+
+    if args.parallel > 1:
+        cpus = args.cpus.split(',') if args.cpus else None
+        # Same priority queue test settings as the serial tests below.
+        prio_args = PRIO_TEST_ARGS if args.backend == 'mininet' else None
+        with span('parallelTest'):
+            parallelTest(prio_args, RC3_fct_test_configs,
+                         args.parallel, cpus)
+        render_pool.join()
+        writeTraceReport()
+        exit(0)
+
+    # The priority queue tests need Mininet's shaped links.
+    if args.backend == 'mininet':
+        # Priority Queue Test - With direct host connections.
+        # See PRIO_TEST_ARGS for the rate and delay used.
+        with span('prioTest'):
+            prioTest(*PRIO_TEST_ARGS)
+
+        # Priority Queue Test - With switch.
+        # See PRIO_TEST_ARGS for the rate and delay used.
+        with span('prioSwitchTest'):
+            prioSwitchTest(*PRIO_TEST_ARGS)
+
+    if args.rc3_log:
+        kernel_log = KernelLog(pattern=args.rc3_log_pattern)
+        kernel_log.start()
 
-    # Priority Queue Test - With direct host connections.
-    # Run at 100Mbps with 2ms link delay because that appears to be stable
-    # and reasonably fast, and use 2ms link delay for faster completion
-    # of slow start.
-    prioTest(100, '2ms', 1, 60)
+    # Flow Completion Time Tests
+    with span('rc3Test'):
+        rc3Test(RC3_fct_test_configs)
 
-    # Priority Queue Test - With switch.
-    # Run at 100Mbps with 2ms link delay because that appears to be stable
-    # and reasonably fast, and use 2ms link delay for faster completion
-    # of slow start.
-    prioSwitchTest(100, '2ms', 1, 60)
+    if kernel_log is not None:
+        kernel_log.stop()
 
-    # Flow Completion Time Tests
-    rc3Test(RC3_fct_test_configs)
+    with span('render_wait'):
+        render_pool.join()
+    writeTraceReport()
 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''Render figures in a background process, off the experiment's critical path.
+
+Plotting functions are submitted with the data they need, and run in a
+worker process using matplotlib's headless Agg backend, while the caller
+carries on measuring. The measuring process itself never imports
+matplotlib.
+
+Processes that can't start children (such as runJobs() workers, which are
+daemonic) render inline instead.
+
+Usage:
+    renderer = RenderPool()
+    renderer.start()    # Before starting networks and threads, ideally.
+    renderer.submit(plotBarClusers, data, flow_types, colors, title, name)
+    ...
+    renderer.join()     # Wait for every figure.
+'''
+
+import multiprocessing
+import traceback
+from tracing import span
+
+
+def useAgg():
+    '''Select the headless Agg backend, before pyplot is imported.'''
+    try:
+        import matplotlib
+    except ImportError:
+        return # Reported when something is actually plotted.
+    matplotlib.use('Agg')
+
+def _render(func, fargs, kwargs):
+    '''Run one plotting function in a worker, returning errors as text.'''
+    with span('render', func=func.__name__):
+        try:
+            func(*fargs, **kwargs)
+        except Exception:
+            # Tracebacks don't survive pickling, so send back the text.
+            raise RuntimeError(traceback.format_exc())
+
+class RenderPool(object):
+    '''A pool of rendering worker processes. See module docstring.'''
+
+    def __init__(self, processes=1):
+        self.processes = processes
+        self.pool = None
+        self.pending = []
+
+    def start(self):
+        '''Start the workers, unless this process can't have children.'''
+        if self.pool is None and \
+                not multiprocessing.current_process().daemon:
+            self.pool = multiprocessing.Pool(self.processes,
+                                             initializer=useAgg)
+
+    def submit(self, func, *fargs, **kwargs):
+        '''Render func(*fargs, **kwargs) in the background.
+
+        func must be defined at module level, and its arguments picklable.
+        '''
+        self.start()
+        if self.pool is None:
+            useAgg()
+            _render(func, fargs, kwargs)
+            return
+        self.pending.append((func.__name__,
+                             self.pool.apply_async(_render,
+                                                   (func, fargs, kwargs))))
+
+    def join(self):
+        '''Wait for all submitted figures, and stop the workers.
+
+        Rendering errors are printed rather than raised, so one bad figure
+        doesn't lose the rest.
+        '''
+        for (name, result) in self.pending:
+            try:
+                result.get()
+            except Exception as e:
+                print "[ERROR]: rendering %s failed:" % name, e
+        self.pending = []
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
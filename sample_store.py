@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+'''Append-only store for raw FCT and iperf3 samples.
+
+Every flow completion time sample, every iperf3 interval, every flow of
+a concurrent workload and every RC3 kernel log record is kept as one row of
+an SQLite database with typed columns, so results can be reanalyzed later
+without rerunning the experiments. So is every failed attempt at a sample,
+e.g. a hung flow. Rows are only ever inserted.
+
+Each process that writes to the store belongs to a run. The runs table
+records where and when the run happened (host name, kernel, command line),
+and every sample row carries its run_id. A run is recorded with its first
+row, so only reading a store (e.g. to analyze it) adds no run.
+
+Loads return columns, as a dictionary mapping column name to a NumPy array,
+and can be filtered on any column, e.g.:
+
+    store = SampleStore('results/samples.sqlite')
+    cols = store.loadFct(config='figure_15a_reno', flow_length=[1460, 7300],
+                         protocol='rc3', skipped=0)
+    cols['fct_ms'].mean()
+'''
+
+import sqlite3
+import platform
+import socket
+import time
+import sys
+import os
+import numpy as np
+from iperf_json import readIntervals
+
+# (name, SQL type, NumPy dtype) for each column of each table.
+RUN_COLUMNS = [('run_id',    'TEXT',    object),
+               ('started',   'REAL',    np.float64),
+               ('hostname',  'TEXT',    object),
+               ('kernel',    'TEXT',    object),
+               ('argv',      'TEXT',    object)]
+
+# TCP_INFO fields of the sending socket at the end of each flow, as
+# reported by fcttest -i. NULL (NaN) where the kernel doesn't report them.
+TCP_INFO_COLUMNS = [('retransmits',   'REAL', np.float64),
+                    ('total_retrans', 'REAL', np.float64),
+                    ('rtt_us',        'REAL', np.float64),
+                    ('rttvar_us',     'REAL', np.float64),
+                    ('snd_cwnd',      'REAL', np.float64),
+                    ('snd_ssthresh',  'REAL', np.float64),
+                    ('delivery_rate', 'REAL', np.float64),
+                    ('bytes_acked',   'REAL', np.float64)]
+
+# RC3 kernel log records of each flow, and records lost, with rc3test.py
+# --rc3-log. NULL otherwise. See kernel_log.py.
+LOG_COLUMNS = [('log_records', 'REAL', np.float64),
+               ('log_lost',    'REAL', np.float64)]
+
+FCT_COLUMNS = [('run_id',      'TEXT',    object),
+               ('config',      'TEXT',    object),
+               ('tcp_type',    'TEXT',    object),
+               ('bandwidth',   'REAL',    np.float64),
+               ('delay',       'TEXT',    object),
+               ('flow_length', 'INTEGER', np.int64),
+               ('protocol',    'TEXT',    object),
+               ('iteration',   'INTEGER', np.int64),
+               ('skipped',     'INTEGER', np.int8),
+               # Host pair the sample ran on, of the pairs sampled at once.
+               ('pair',        'INTEGER DEFAULT 0', np.int64),
+               ('pairs',       'INTEGER DEFAULT 1', np.int64),
+               ('timestamp',   'REAL',    np.float64),
+               ('fct_ms',      'REAL',    np.float64)] + TCP_INFO_COLUMNS + \
+    LOG_COLUMNS
+
+IPERF_COLUMNS = [('run_id',          'TEXT',    object),
+                 ('test',            'TEXT',    object),
+                 ('flow',            'TEXT',    object),
+                 ('timestamp',       'REAL',    np.float64),
+                 ('start',           'REAL',    np.float64),
+                 ('end',             'REAL',    np.float64),
+                 ('bytes',           'INTEGER', np.int64),
+                 ('bits_per_second', 'REAL',    np.float64)]
+
+WORKLOAD_COLUMNS = [('run_id',    'TEXT',    object),
+                    ('workload',  'TEXT',    object),
+                    ('protocol',  'TEXT',    object),
+                    ('tcp_type',  'TEXT',    object),
+                    ('load',      'REAL',    np.float64),
+                    ('bandwidth', 'REAL',    np.float64),
+                    ('delay',     'TEXT',    object),
+                    ('flow_id',   'INTEGER', np.int64),
+                    ('size',      'INTEGER', np.int64),
+                    ('arrival',   'REAL',    np.float64),
+                    ('ok',        'INTEGER', np.int8),
+                    ('fct_ms',    'REAL',    np.float64),
+                    ('slowdown',  'REAL',    np.float64)]
+
+# One row per packet of an FCT sample's flow in the RC3 kernel log, joined
+# to the sample on run_id, config, flow_length, protocol, iteration and pair.
+RC3_LOG_COLUMNS = [('run_id',      'TEXT',    object),
+                   ('config',      'TEXT',    object),
+                   ('flow_length', 'INTEGER', np.int64),
+                   ('protocol',    'TEXT',    object),
+                   ('iteration',   'INTEGER', np.int64),
+                   ('pair',        'INTEGER', np.int64),
+                   ('level',       'INTEGER', np.int64),
+                   ('t_ms',        'REAL',    np.float64),
+                   ('seq',         'REAL',    np.float64)]
+
+# One row per failed attempt at a sample or a run, see supervisor.py. test
+# is 'fct', 'prio', 'calibration' or 'workload'; columns that don't apply
+# to the test are NULL.
+FAILURE_COLUMNS = [('run_id',      'TEXT', object),
+                   ('timestamp',   'REAL', np.float64),
+                   ('test',        'TEXT', object),
+                   # The process that failed, or the flow that stalled.
+                   ('process',     'TEXT', object),
+                   ('config',      'TEXT', object),
+                   ('tcp_type',    'TEXT', object),
+                   ('bandwidth',   'REAL', np.float64),
+                   ('delay',       'TEXT', object),
+                   ('flow_length', 'REAL', np.float64),
+                   ('protocol',    'TEXT', object),
+                   ('iteration',   'REAL', np.float64),
+                   ('pair',        'REAL', np.float64),
+                   ('attempt',     'REAL', np.float64),
+                   # 'timeout', 'exit' or 'stall'
+                   ('kind',        'TEXT', object),
+                   ('returncode',  'REAL', np.float64),
+                   ('elapsed',     'REAL', np.float64),
+                   ('detail',      'TEXT', object)]
+
+TABLES = {'runs': RUN_COLUMNS,
+          'fct_samples': FCT_COLUMNS,
+          'iperf_intervals': IPERF_COLUMNS,
+          'workload_flows': WORKLOAD_COLUMNS,
+          'rc3_log': RC3_LOG_COLUMNS,
+          'failures': FAILURE_COLUMNS}
+
+INDEXES = ['CREATE INDEX IF NOT EXISTS fct_cell ON fct_samples'
+           ' (config, flow_length, protocol)',
+           'CREATE INDEX IF NOT EXISTS iperf_test ON iperf_intervals'
+           ' (test, flow)',
+           'CREATE INDEX IF NOT EXISTS workload_cell ON workload_flows'
+           ' (workload, protocol)',
+           'CREATE INDEX IF NOT EXISTS rc3_log_flow ON rc3_log'
+           ' (config, flow_length, protocol, iteration)']
+
+
+def newRunId():
+    '''A run id, unique across hosts and processes, sortable by time.'''
+    return '%s-%s-%d' % (time.strftime('%Y%m%d-%H%M%S'),
+                         socket.gethostname(), os.getpid())
+
+def addMissingColumns(conn, table, columns):
+    '''Add columns a store written by an older version lacks.
+
+    Their values are their SQL default in the existing rows, else NULL.
+    '''
+    have = set(row[1] for row in conn.execute('PRAGMA table_info(%s)' % table))
+    for (name, sqltype, _) in columns:
+        if name in have:
+            continue
+        try:
+            conn.execute('ALTER TABLE %s ADD COLUMN %s %s'
+                         % (table, name, sqltype))
+        except sqlite3.OperationalError:
+            pass # Added by a parallel process in the meantime.
+
+class SampleStore(object):
+    '''An append-only SQLite store of raw samples. See module docstring.
+
+    The database connection is opened lazily, and reopened in a forked
+    child, so one SampleStore can be shared with parallel worker processes.
+    Samples from all of them are recorded under the same run_id.
+    '''
+
+    def __init__(self, path, run_id=None):
+        self.path = path
+        self.run_id = run_id if run_id is not None else newRunId()
+        self.started = time.time()
+        self._conn = None
+        self._pid = None
+        self._run_recorded = False
+
+    def _db(self):
+        '''Return a connection for this process, creating tables if needed.'''
+        if self._conn is None or self._pid != os.getpid():
+            # Parallel jobs write at the same time, so wait on locks.
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for (table, columns) in TABLES.items():
+                conn.execute('CREATE TABLE IF NOT EXISTS %s (%s)'
+                             % (table, ', '.join('%s %s' % (name, sqltype)
+                                for (name, sqltype, _) in columns)))
+                addMissingColumns(conn, table, columns)
+            for index in INDEXES:
+                conn.execute(index)
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            self._run_recorded = False
+        return self._conn
+
+    def _recordRun(self, conn):
+        '''Insert this run's runs row, unless a process already did.'''
+        if self._run_recorded:
+            return
+        conn.execute('INSERT INTO runs SELECT ?, ?, ?, ?, ?'
+                     ' WHERE NOT EXISTS'
+                     ' (SELECT 1 FROM runs WHERE run_id = ?)',
+                     (self.run_id, self.started, socket.gethostname(),
+                      platform.release(), ' '.join(sys.argv),
+                      self.run_id))
+        self._run_recorded = True
+
+    def _insert(self, table, rows):
+        '''Insert rows (dictionaries of column values) and commit.
+
+        Only the columns a row gives are inserted, so the others get their
+        SQL default (e.g. pair and pairs), else NULL.
+        '''
+        names = [name for (name, _, _) in TABLES[table]]
+        groups = {}
+        for row in rows:
+            columns = tuple(c for c in names if c in row)
+            groups.setdefault(columns, []).append([row[c] for c in columns])
+        conn = self._db()
+        self._recordRun(conn)
+        for (columns, values) in groups.items():
+            conn.executemany('INSERT INTO %s (%s) VALUES (%s)'
+                             % (table, ', '.join(columns),
+                                ', '.join('?' * len(columns))), values)
+        conn.commit()
+
+    def addFctSample(self, **row):
+        '''Append one FCT sample. Keywords are FCT_COLUMNS names.
+
+        run_id and timestamp are filled in if not given.
+        '''
+        row.setdefault('run_id', self.run_id)
+        row.setdefault('timestamp', time.time())
+        self._insert('fct_samples', [row])
+
+    def addFailure(self, **row):
+        '''Append one failure. Keywords are FAILURE_COLUMNS names.
+
+        run_id and timestamp are filled in if not given.
+        '''
+        row.setdefault('run_id', self.run_id)
+        row.setdefault('timestamp', time.time())
+        self._insert('failures', [row])
+
+    def addIperfFile(self, test, flow, filename):
+        '''Append every interval of an iperf3 -J or --json-stream file.
+
+        Args:
+            test: Name of the test, e.g. 'serv1'.
+            flow: Name of the flow within the test, e.g. 'lo' or 'hi'.
+            filename: The iperf3 JSON output file.
+        '''
+        a = readIntervals(filename)
+        started = a['timesecs'] or 0
+        timestamps = started + a['start']
+        rows = [{'run_id': self.run_id, 'test': test, 'flow': flow,
+                 'timestamp': t, 'start': start, 'end': end, 'bytes': nbytes,
+                 'bits_per_second': bps}
+                for (t, start, end, nbytes, bps)
+                in zip(timestamps.tolist(), a['start'].tolist(),
+                       a['end'].tolist(), a['bytes'].tolist(),
+                       a['bits_per_second'].tolist())]
+        self._insert('iperf_intervals', rows)
+
+    def addWorkloadFlows(self, flows, **tags):
+        '''Append every flow of a workload run.
+
+        Args:
+            flows: Dictionary of per-flow arrays, e.g. from
+                workload.loadFlows(), holding the 'size', 'arrival', 'ok',
+                'fct_ms' and 'slowdown' columns.
+            tags: Values of the other WORKLOAD_COLUMNS, the same for every
+                flow, e.g. workload='websearch', protocol='rc3'.
+        '''
+        rows = []
+        for (i, (size, arrival, ok, fct_ms, slowdown)) in enumerate(
+                zip(flows['size'].tolist(), flows['arrival'].tolist(),
+                    flows['ok'].tolist(), flows['fct_ms'].tolist(),
+                    flows['slowdown'].tolist())):
+            row = dict(tags, run_id=self.run_id, flow_id=i, size=size,
+                       arrival=arrival, ok=int(ok))
+            # Store failed flows' NaN times as NULL.
+            if ok:
+                row.update(fct_ms=fct_ms, slowdown=slowdown)
+            rows.append(row)
+        self._insert('workload_flows', rows)
+
+    def addRc3Log(self, records, **tags):
+        '''Append the RC3 kernel log records of one FCT sample's flow.
+
+        Args:
+            records: List of (t_ms, level, seq), as from
+                kernel_log.KernelLog.end().
+            tags: Values of the other RC3_LOG_COLUMNS, the same as the
+                sample's, e.g. config='figure_15a_reno', iteration=3.
+        '''
+        self._insert('rc3_log', [dict(tags, run_id=self.run_id, t_ms=t_ms,
+                                      level=level, seq=seq)
+                                 for (t_ms, level, seq) in records])
+
+    def _load(self, table, filters):
+        '''Load the filtered rows of table, as a dict of column arrays.'''
+        columns = TABLES[table]
+        names = [name for (name, _, _) in columns]
+        where = []
+        params = []
+        for (name, value) in sorted(filters.items()):
+            if name not in names:
+                raise ValueError('%s has no column %s' % (table, name))
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                where.append('%s IN (%s)' % (name, ', '.join('?' * len(value))))
+                params += value
+            else:
+                where.append('%s = ?' % name)
+                params.append(value)
+        query = 'SELECT %s FROM %s' % (', '.join(names), table)
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        rows = self._db().execute(query, params).fetchall()
+
+        # Transpose to columns, with each column's own type.
+        values = zip(*rows) if rows else [()] * len(columns)
+        return dict((name, np.array(col, dtype=dtype))
+                    for ((name, _, dtype), col) in zip(columns, values))
+
+    def loadFct(self, **filters):
+        '''Load FCT samples, e.g. loadFct(config='x', protocol='rc3').
+
+        Each keyword filters on the column of that name. A list value
+        matches any of its items.
+        '''
+        return self._load('fct_samples', filters)
+
+    def loadIperf(self, **filters):
+        '''Load iperf3 intervals, filtered as in loadFct().'''
+        return self._load('iperf_intervals', filters)
+
+    def loadWorkload(self, **filters):
+        '''Load workload flows, filtered as in loadFct().'''
+        return self._load('workload_flows', filters)
+
+    def loadRc3Log(self, **filters):
+        '''Load RC3 kernel log records, filtered as in loadFct().'''
+        return self._load('rc3_log', filters)
+
+    def loadFailures(self, **filters):
+        '''Load failures, filtered as in loadFct().'''
+        return self._load('failures', filters)
+
+    def loadRuns(self, **filters):
+        '''Load run metadata, filtered as in loadFct().'''
+        return self._load('runs', filters)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+'''Deadlines for the harness's processes, so nothing can hang a run.
+
+A Supervisor follows the output of processes on any number of hosts with
+one select() call, as Mininet's pmonitor() does, but for processes of
+either backend, and with a deadline on every wait:
+
+    supervisor = Supervisor()
+    lines = supervisor.readLines(clients, timeout=10.0)
+    for (client, line) in zip(clients, lines):
+        if line is None:
+            failure = supervisor.failure(client) # timed out, or exited
+            supervisor.kill(client)
+
+    late = supervisor.waitAll(servers, timeout=30.0)
+
+Deadlines come from what the process has to do: flowDeadline() bounds an
+FCT flow by the time its data takes at the link rate, plus the round trips
+of slow start, with a generous factor and some slack. What failed, and why,
+is returned by failure() as a dictionary of the SampleStore FAILURE_COLUMNS,
+for the caller to store and retry.
+'''
+
+import select
+import errno
+import time
+import math
+import os
+from calibrate import parseDelay
+
+# A flow's deadline is this many times its expected FCT, plus the slack.
+DEADLINE_FACTOR = 4.0
+DEADLINE_SLACK = 5.0 # seconds
+
+# Initial congestion window, in bytes, for the slow start estimate.
+INITIAL_WINDOW = 10 * 1460
+
+# Most bytes of a failed process's stderr kept.
+DETAIL_BYTES = 1000
+
+
+def flowDeadline(size, bandwidth, delay, flows=1, factor=DEADLINE_FACTOR,
+                 slack=DEADLINE_SLACK):
+    '''Seconds a flow may take before it counts as hung.
+
+    Args:
+        size: Bytes in the flow.
+        bandwidth: Rate of the links, in Mbps.
+        delay: tc delay string at each host's egress, e.g. '1000ms', or None.
+        flows: Number of flows sharing the bottleneck at once.
+        factor: Multiple of the expected FCT allowed.
+        slack: Seconds added, for process and connection start up.
+    '''
+    rtt = 2 * parseDelay(delay) if delay else 0.0
+    # The handshake, the token, and the rounds of slow start.
+    rounds = 2 + math.ceil(math.log(size / float(INITIAL_WINDOW) + 1, 2))
+    transfer = flows * size * 8.0 / (bandwidth * 1e6)
+    return factor * (rounds * rtt + transfer) + slack
+
+class Supervisor(object):
+    '''Reads and waits on processes with deadlines. See module docstring.'''
+
+    def __init__(self):
+        # stdout file descriptor to the partial line read from it.
+        self.partial = {}
+        # stdout file descriptors read to end of file.
+        self.closed = set()
+        self.started = {}
+
+    def watch(self, proc):
+        '''Start timing proc, for the elapsed time of its failures.'''
+        self.started[id(proc)] = time.time()
+
+    def readLines(self, procs, timeout=None):
+        '''Read one line from the stdout pipe of each of procs.
+
+        Reads from all of them at once, so a slow process doesn't hold up
+        reading the others.
+
+        Args:
+            procs: Processes, with stdout=PIPE.
+            timeout: Seconds to wait for all the lines, None for no limit.
+
+        Returns a list of each process's line, without the newline, or None
+        if it exited or didn't finish a line within timeout.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        lines = [None] * len(procs)
+        waiting = dict((p.stdout.fileno(), i) for (i, p) in enumerate(procs))
+        for fd in waiting.keys():
+            line = self._line(fd)
+            if line is not None:
+                lines[waiting.pop(fd)] = line
+        while waiting:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
+            try:
+                (ready, _, _) = select.select(list(waiting), [], [], wait)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                data = os.read(fd, 64 * 1024)
+                if not data:
+                    del waiting[fd] # Exited, or closed its stdout.
+                    self.closed.add(fd)
+                    continue
+                self.partial[fd] = self.partial.get(fd, '') + data
+                line = self._line(fd)
+                if line is not None:
+                    lines[waiting.pop(fd)] = line
+        return lines
+
+    def _line(self, fd):
+        '''Take the first complete line read from fd, if any.'''
+        (line, newline, rest) = self.partial.get(fd, '').partition('\n')
+        if not newline:
+            return None
+        self.partial[fd] = rest
+        return line
+
+    def waitAll(self, procs, timeout=None):
+        '''Wait for procs to exit, for at most timeout seconds.
+
+        Returns the list of those still running at the deadline, which are
+        left running.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        running = list(procs)
+        while running:
+            running = [p for p in running if p.poll() is None]
+            if running and deadline is not None and time.time() > deadline:
+                break
+            if running:
+                time.sleep(0.05)
+        return running
+
+    def failure(self, proc, **tags):
+        '''Why proc failed, as a dictionary of FAILURE_COLUMNS.
+
+        kind is 'timeout' if proc is still running, else 'exit'. The start
+        of its stderr (if a pipe) is kept as the detail. Keywords are added
+        as they are, e.g. the flow the process was running.
+        '''
+        if proc.stdout is not None and proc.stdout.fileno() in self.closed:
+            # Exiting, give it a moment to be reaped.
+            self.waitAll([proc], 1.0)
+        running = proc.poll() is None
+        detail = ''
+        if not running and proc.stderr is not None:
+            detail = self._available(proc.stderr.fileno())
+        started = self.started.get(id(proc))
+        return dict(tags, kind='timeout' if running else 'exit',
+                    returncode=proc.returncode,
+                    elapsed=None if started is None else time.time() - started,
+                    detail=detail.strip()[:DETAIL_BYTES])
+
+    def _available(self, fd):
+        '''Whatever can be read from fd without blocking.'''
+        data = ''
+        while select.select([fd], [], [], 0)[0]:
+            chunk = os.read(fd, 64 * 1024)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > DETAIL_BYTES:
+                break
+        return data
+
+    def kill(self, proc):
+        '''Kill proc if it's still running, and forget its output.'''
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if proc.stdout is not None:
+            self.partial.pop(proc.stdout.fileno(), None)
+            self.closed.discard(proc.stdout.fileno())
+        self.started.pop(id(proc), None)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+'''Build the priority qdisc tree as data, and apply it with one tc -batch.
+
+The tree set up by addPrioQdisc() in rc3test.py (HTB rate limit, 8 band prio
+qdisc, netem delay at the leaves and ToS filters) is described as a list of
+TcObjects. Applying a tree renders it into tc batch commands, and all the
+devices of a node are configured with a single tc invocation.
+
+The tree last applied to each device is remembered on the node, so changing
+configuration only issues the commands needed, e.g. a netem "change" when
+only the delay differs, or an HTB class "change" for a new rate. Anything
+that can't be changed in place causes the device's tree to be rebuilt.
+'''
+
+from collections import namedtuple
+import tempfile
+import re
+import os
+
+# The ToS values used by RC3 for its priority levels, highest priority first.
+RC3_TOS_VALUES = ['0x00', '0x04', '0x08', '0x0c', '0x10']
+
+# kind: 'qdisc', 'class' or 'filter'.
+# parent: Parent handle, e.g. '2:1', or 'root'.
+# handle: Qdisc handle or class id. Filters use their match, to tell them
+#     apart.
+# spec: The rest of the tc arguments, e.g. 'netem delay 10ms limit 1000'.
+TcObject = namedtuple('TcObject', 'kind dev parent handle spec')
+
+
+def prioQdiscTree(dev, bandwidth, delay=None):
+    '''The TcObjects of the priority qdisc tree for one device.
+
+    Args:
+        dev: Device name string, e.g. 'h1-eth0'.
+        bandwidth: A number, representing bandwidth in Mbps.
+        delay: A string, such as 10us, or None for no delay.
+    '''
+    rate = "%fMbit" % bandwidth
+    # The 15k burst of Mininet's own HTB links (TCIntf), so a prio tree
+    # shapes like the links it replaces.
+    tree = [TcObject('qdisc', dev, 'root', '1:', 'htb default 1'),
+            TcObject('class', dev, '1:', '1:1',
+                     'htb rate %s ceil %s burst 15k cburst 15k'
+                     % (rate, rate)),
+            # prio qdisc for priority queues. priomap mostly ignored, use
+            # filters below
+            TcObject('qdisc', dev, '1:1', '2:0',
+                     'prio bands 8 priomap 0 1 2 3 4 5 6 7 7 7 7 7 7 7 7 7')]
+    # netem qdiscs at leaves if delay is wanted.
+    if delay is not None:
+        for i in range(1, len(RC3_TOS_VALUES) + 1):
+            tree.append(TcObject('qdisc', dev, '2:%d' % i, '15%d:' % i,
+                                 'netem delay %s limit 1000' % delay))
+    # filters to match the ToS bit settings used by RC3 and put in prio queues
+    for (i, tos) in enumerate(RC3_TOS_VALUES, 1):
+        tree.append(TcObject('filter', dev, '2:0', 'tos %s' % tos,
+                             'protocol ip prio 10 u32 match ip tos %s 0xff'
+                             ' flowid 2:%d' % (tos, i)))
+    return tree
+
+def renderCommand(action, obj):
+    '''One tc batch line (without the leading "tc") for an action on obj.
+
+    action is one of 'add', 'change' or 'del'.
+    '''
+    if obj.parent == 'root':
+        where = 'root'
+    else:
+        where = 'parent %s' % obj.parent
+    if obj.kind == 'filter':
+        return 'filter %s dev %s %s %s' % (action, obj.dev, where, obj.spec)
+    handle = 'classid' if obj.kind == 'class' else 'handle'
+    line = '%s %s dev %s %s %s %s' % (obj.kind, action, obj.dev, where,
+                                      handle, obj.handle)
+    if action != 'del':
+        line += ' ' + obj.spec
+    return line
+
+def rebuildCommands(tree):
+    '''Commands that replace whatever is on the device with tree.'''
+    dev = tree[0].dev
+    return (['qdisc del dev %s root' % dev] +
+            [renderCommand('add', obj) for obj in tree])
+
+def diffCommands(old, new):
+    '''Commands that turn device tree old into new.
+
+    Args:
+        old: The tree currently applied, or None if unknown.
+        new: The wanted tree.
+    '''
+    if old is None:
+        return rebuildCommands(new)
+
+    key = lambda obj: (obj.kind, obj.parent, obj.handle)
+    old_objs = dict((key(obj), obj) for obj in old)
+    new_objs = dict((key(obj), obj) for obj in new)
+
+    # Removed leaf qdiscs go first, so their handles are free again.
+    deletes = []
+    for obj in old:
+        if key(obj) not in new_objs:
+            if obj.kind != 'qdisc' or obj.parent == 'root':
+                return rebuildCommands(new)
+            deletes.append(renderCommand('del', obj))
+
+    # Then additions and changes, parents before children.
+    updates = []
+    for obj in new:
+        prev = old_objs.get(key(obj))
+        if prev is None:
+            if obj.kind == 'filter' or obj.parent == 'root':
+                return rebuildCommands(new)
+            updates.append(renderCommand('add', obj))
+        elif prev.spec != obj.spec:
+            # Only parameters of the same kind of qdisc/class can change.
+            if obj.kind == 'filter' or \
+                    prev.spec.split()[0] != obj.spec.split()[0]:
+                return rebuildCommands(new)
+            updates.append(renderCommand('change', obj))
+    return deletes + updates
+
+def applyTrees(node, trees, verbose=True):
+    '''Apply trees to node's devices, with a single tc -batch invocation.
+
+    Only the differences from the trees last applied by this function are
+    sent to tc.
+
+    Args:
+        node: Network node, e.g. h1, h2, s1.
+        trees: List of trees, e.g. from prioQdiscTree(), one per device.
+        verbose: If True, print the commands sent to tc.
+
+    Returns the list of tc batch commands run.
+    '''
+    applied = node.__dict__.setdefault('_applied_tc_trees', {})
+    commands = []
+    command_devs = []
+    for tree in trees:
+        dev_commands = diffCommands(applied.get(tree[0].dev), tree)
+        commands += dev_commands
+        command_devs += [tree[0].dev] * len(dev_commands)
+    if not commands:
+        return commands
+
+    if verbose:
+        print node.name, "tc batch ========================================"
+        for line in commands:
+            print '  tc', line
+
+    # -force keeps going after errors, e.g. deleting a missing root qdisc.
+    (fd, batch_file) = tempfile.mkstemp(prefix='tc-batch-')
+    try:
+        os.write(fd, '\n'.join(commands) + '\n')
+        os.close(fd)
+        out = node.cmd('tc -force -batch', batch_file)
+    finally:
+        os.remove(batch_file)
+    if out.strip():
+        print node.name, "tc batch output:", out.strip()
+
+    # tc reports failures by batch line number. Deleting a root qdisc that
+    # isn't there is expected, but after any other failure the device's
+    # state is unknown, so it will be rebuilt next time.
+    failed_devs = set()
+    for line_num in re.findall(r'Command failed \S+:(\d+)', out):
+        i = int(line_num) - 1
+        if 0 <= i < len(commands) and not \
+                re.match(r'qdisc del dev \S+ root$', commands[i]):
+            failed_devs.add(command_devs[i])
+    for tree in trees:
+        if tree[0].dev in failed_devs:
+            applied.pop(tree[0].dev, None)
+        else:
+            applied[tree[0].dev] = tree
+    return commands
+
+def resetTrees(node, verbose=False):
+    '''Rebuild every tree applied to node's devices, zeroing their counters.
+
+    tc can't clear qdisc statistics, but deleting and re-adding a tree
+    starts it afresh. Returns the list of tc batch commands run.
+    '''
+    applied = node.__dict__.get('_applied_tc_trees', {})
+    trees = [tree for (dev, tree) in sorted(applied.items())]
+    applied.clear()
+    return applyTrees(node, trees, verbose)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+'''Live throughput telemetry for iperf3 flows.
+
+A ThroughputMonitor follows iperf3 servers started with --json-stream while
+the test runs. For every interval it:
+
+  * copies the raw event line to the flow's output file, which can be
+    parsed later just like -J output (see iperf_json.py),
+  * appends a row to a CSV time series: wall clock time, test, flow,
+    interval end (seconds into the flow) and throughput (Mbps),
+  * optionally redraws a live plot image, and
+  * checks whether the run has stalled: every flow that has started, and
+    not yet finished, at zero throughput, counted from its first interval
+    so a run that never gets going is caught too. It then kills the test's
+    processes so the run ends early. A single flow at zero is not a stall
+    while another moves, as a low priority flow is starved by a high
+    priority one by design.
+'''
+
+import threading
+import select
+import json
+import time
+import os
+
+
+class ThroughputMonitor(threading.Thread):
+    '''Background thread following the output of iperf3 servers.
+
+    Usage:
+        monitor = ThroughputMonitor('prio1', 'telemetry.csv', procs)
+        monitor.addFlow('hi', hiserv, 'hi.json')
+        monitor.addFlow('lo', loserv, 'lo.json')
+        monitor.start()
+        ... start clients, using monitor.sleep() to wait between them ...
+        monitor.join()
+        if monitor.stalled: ...
+    '''
+
+    def __init__(self, test, sink_file, procs, stall_intervals=5,
+                 plot_file=None):
+        '''
+        Args:
+            test: Name of the test, recorded in the time series.
+            sink_file: CSV file to append the time series to.
+            procs: Dictionary of the test's processes (e.g. servers and
+                clients), all killed if a flow stalls. May be added to
+                after the monitor is started.
+            stall_intervals: Number of consecutive zero throughput intervals
+                of every active flow, with no flow moving in between, that
+                count as a stall. Counted from a flow's first interval.
+                None disables stall detection.
+            plot_file: If not None, an image file redrawn with the
+                throughput of every flow after each interval.
+        '''
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.test = test
+        self.sink_file = sink_file
+        self.procs = procs
+        self.stall_intervals = stall_intervals
+        self.plot_file = plot_file
+        self.flows = {}
+        self.stalled = None
+        self.aborted = threading.Event()
+
+    def addFlow(self, name, proc, out_file):
+        '''Follow the --json-stream stdout of proc, copying it to out_file.'''
+        self.flows[proc.stdout.fileno()] = {
+            'name': name,
+            'out': open(out_file, 'w'),
+            'partial': '',
+            'times': [],
+            'mbps': [],
+            'zeros': 0,
+            'done': False,
+        }
+
+    def sleep(self, seconds):
+        '''Sleep, but return early if the test is aborted.'''
+        self.aborted.wait(seconds)
+        return not self.aborted.is_set()
+
+    def run(self):
+        sink = open(self.sink_file, 'a')
+        try:
+            fds = list(self.flows.keys())
+            while fds:
+                (ready, _, _) = select.select(fds, [], [], 1.0)
+                for fd in ready:
+                    data = os.read(fd, 64 * 1024)
+                    if not data:
+                        fds.remove(fd)
+                        self._flowDone(self.flows[fd])
+                        continue
+                    self._flowData(self.flows[fd], data, sink)
+        finally:
+            sink.close()
+            for flow in self.flows.values():
+                flow['out'].close()
+
+    def _flowData(self, flow, data, sink):
+        '''Handle newly read output of a flow, line by line.'''
+        lines = (flow['partial'] + data).split('\n')
+        flow['partial'] = lines.pop()
+        for line in lines:
+            flow['out'].write(line + '\n')
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('event') != 'interval':
+                continue
+            stream = event['data']['sum']
+            mbps = stream['bits_per_second'] / 1000000.0
+            sink.write('%f,%s,%s,%f,%f\n' % (time.time(), self.test,
+                                             flow['name'], stream['end'], mbps))
+            sink.flush()
+            flow['times'].append(stream['end'])
+            flow['mbps'].append(mbps)
+            self._checkStall(flow, mbps)
+            if self.plot_file is not None:
+                self._plot()
+
+    def _flowDone(self, flow):
+        flow['done'] = True
+        if flow['partial']:
+            flow['out'].write(flow['partial'])
+            flow['partial'] = ''
+        flow['out'].flush()
+
+    def _checkStall(self, flow, mbps):
+        '''Abort the test if all its active flows have been stuck at zero
+        for too long.'''
+        if self.stall_intervals is None or self.stalled is not None:
+            return
+        if mbps > 0:
+            # The run is moving, so no flow is stalled, however starved.
+            for f in self.flows.values():
+                f['zeros'] = 0
+            return
+        flow['zeros'] += 1
+        # Flows that have started (reported an interval) and not finished.
+        active = [f for f in self.flows.values()
+                  if not f['done'] and f['mbps']]
+        if all(f['zeros'] >= self.stall_intervals for f in active):
+            self.stalled = ', '.join(sorted(f['name'] for f in active))
+            print "[ERROR]: %s flows %s stalled, aborting test" \
+                   % (self.test, self.stalled)
+            self.aborted.set()
+            for p in list(self.procs.values()):
+                if p.poll() is None:
+                    p.kill()
+
+    def _plot(self):
+        '''Redraw the live plot, without pyplot so it is safe in a thread.'''
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=(6.5, 5))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.set_title('%s (live)' % self.test)
+        ax.set_xlabel('Time into flow (s)')
+        ax.set_ylabel('Throughput (Mbps)')
+        for flow in sorted(self.flows.values(), key=lambda f: f['name']):
+            ax.plot(flow['times'], flow['mbps'], linewidth=2.0,
+                    label=flow['name'])
+        ax.legend(loc='lower left')
+        fig.savefig(self.plot_file)
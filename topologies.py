@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+'''Parameterized topologies: leaf-spine fabrics and N-to-1 incast.
+
+A TopoSpec describes hosts, switches and links, with each link's rate,
+independently of the network backend. From it, mininetNet() or nsNet()
+builds the network, and applySpecQdiscs() puts the priority qdisc tree of
+tc_batch.prioQdiscTree() on every interface of every node, at the rate of
+its link. Each node gets one tc -batch invocation for all its interfaces,
+and the netns backend creates all links with one ip -batch invocation, so
+setup grows linearly with the number of links, not with the number of
+commands.
+
+Interfaces are named as Mininet names them: host ports from eth0, switch
+ports from eth1, in the order links are added.
+
+Builders:
+    incast(senders, bandwidth)
+        senders hosts and one receiver on one switch. The receiver's link
+        is the bottleneck when they all send at once.
+    leafSpine(leaves, spines, hosts, bandwidth, oversubscription)
+        Every leaf switch links to every spine switch, and has hosts
+        hosts.
+
+parseTopology() builds one from a string, e.g. 'incast:senders=16' or
+'leafspine:leaves=4,spines=2,hosts=4,oversubscription=2'.
+
+Switches are Ethernet bridges. A fabric with more than one spine has loops,
+so its bridges run the spanning tree protocol, which leaves one path
+between any two leaves: the extra spines are redundancy, not extra
+capacity. Oversubscription is therefore applied to each uplink, so it holds
+on whichever tree is active: each leaf-spine link runs at
+hosts * bandwidth / oversubscription.
+'''
+
+from tc_batch import prioQdiscTree, applyTrees
+from tracing import span
+
+TOPOLOGY_BUILDERS = {}
+
+
+class TopoSpec(object):
+    '''Hosts, switches and rated links of a topology, and the flows to test
+    on it. See module docstring.'''
+
+    def __init__(self, name, prefix=''):
+        '''
+        Args:
+            name: Name of the topology, e.g. 'incast16', used to label its
+                results.
+            prefix: Name prefix of the nodes.
+        '''
+        self.name = name
+        self.prefix = prefix
+        self.hosts = []
+        self.switches = []
+        # (node1, node2, bandwidth in Mbps, intf1, intf2)
+        self.links = []
+        # (sender, receiver) host names of the flows of one test round.
+        self.flow_pairs = []
+        self.stp = False
+        self._ports = {}
+
+    def addHost(self, name):
+        '''Add a host, named with the prefix. Returns its full name.'''
+        name = self.prefix + name
+        self.hosts.append(name)
+        self._ports[name] = 0
+        return name
+
+    def addSwitch(self, name):
+        '''Add a switch, named with the prefix. Returns its full name.'''
+        name = self.prefix + name
+        self.switches.append(name)
+        self._ports[name] = 1
+        return name
+
+    def addLink(self, node1, node2, bandwidth):
+        '''Link two nodes, by full name, at bandwidth Mbps each way.'''
+        intfs = []
+        for node in (node1, node2):
+            intfs.append('%s-eth%d' % (node, self._ports[node]))
+            self._ports[node] += 1
+        self.links.append((node1, node2, bandwidth, intfs[0], intfs[1]))
+
+    def nodeIntfs(self, node):
+        '''List of (interface, bandwidth) of a node, in port order.'''
+        intfs = []
+        for (node1, node2, bandwidth, intf1, intf2) in self.links:
+            if node1 == node:
+                intfs.append((intf1, bandwidth))
+            if node2 == node:
+                intfs.append((intf2, bandwidth))
+        return intfs
+
+def builder(name):
+    '''Register a function building a TopoSpec, for parseTopology().'''
+    def register(func):
+        TOPOLOGY_BUILDERS[name] = func
+        return func
+    return register
+
+@builder('incast')
+def incast(senders, bandwidth=100, prefix=''):
+    '''senders hosts, h1 to h<senders>, and receiver h0, on switch s1.'''
+    spec = TopoSpec('incast%d' % senders, prefix)
+    switch = spec.addSwitch('s1')
+    receiver = spec.addHost('h0')
+    spec.addLink(receiver, switch, bandwidth)
+    for i in range(1, senders + 1):
+        sender = spec.addHost('h%d' % i)
+        spec.addLink(sender, switch, bandwidth)
+        spec.flow_pairs.append((sender, receiver))
+    return spec
+
+@builder('leafspine')
+def leafSpine(leaves, spines, hosts, bandwidth=100, oversubscription=1.0,
+              prefix=''):
+    '''A two tier leaf-spine fabric.
+
+    Args:
+        leaves: Number of leaf switches, leaf1 to leaf<leaves>.
+        spines: Number of spine switches, spine1 to spine<spines>.
+        hosts: Number of hosts per leaf. Hosts are numbered from h1, leaf
+            by leaf. Each sends to the host in its place on the next leaf,
+            so every flow crosses the spines (with one leaf, to the next
+            host on the leaf).
+        bandwidth: Rate of the host links, in Mbps.
+        oversubscription: Ratio of a leaf's host capacity to its active
+            uplink capacity.
+        prefix: Name prefix of the nodes.
+    '''
+    spec = TopoSpec('leafspine%dx%dx%d' % (leaves, spines, hosts), prefix)
+    spec.stp = spines > 1
+    uplink = hosts * bandwidth / float(oversubscription)
+    spine_names = [spec.addSwitch('spine%d' % i)
+                   for i in range(1, spines + 1)]
+    for l in range(1, leaves + 1):
+        leaf = spec.addSwitch('leaf%d' % l)
+        for spine in spine_names:
+            spec.addLink(leaf, spine, uplink)
+        for h in range(1, hosts + 1):
+            host = spec.addHost('h%d' % ((l - 1) * hosts + h))
+            spec.addLink(host, leaf, bandwidth)
+    if leaves > 1:
+        step = hosts
+    else:
+        step = 1
+    for (i, host) in enumerate(spec.hosts):
+        receiver = spec.hosts[(i + step) % len(spec.hosts)]
+        if receiver != host:
+            spec.flow_pairs.append((host, receiver))
+    return spec
+
+def parseTopology(text, prefix=''):
+    '''Build a TopoSpec from 'builder:name=value,...', e.g. 'incast:senders=8'.
+
+    Values are numbers. Raises ValueError for an unknown builder or a
+    malformed string.
+    '''
+    (name, _, params) = text.partition(':')
+    if name not in TOPOLOGY_BUILDERS:
+        raise ValueError('unknown topology %r, expected one of %s'
+                         % (name, ', '.join(sorted(TOPOLOGY_BUILDERS))))
+    kwargs = {}
+    for param in filter(None, params.split(',')):
+        (key, _, value) = param.partition('=')
+        try:
+            kwargs[key.strip()] = int(value)
+        except ValueError:
+            kwargs[key.strip()] = float(value)
+    return TOPOLOGY_BUILDERS[name](prefix=prefix, **kwargs)
+
+def mininetNet(spec):
+    '''A Mininet network of spec, with bridging switches (STP if needed).'''
+    from mininet.net import Mininet
+    from mininet.topo import Topo
+    from mininet.link import TCLink
+    from mininet.node import OVSBridge
+
+    topo = Topo()
+    for name in spec.hosts:
+        topo.addHost(name)
+    for (i, name) in enumerate(spec.switches):
+        # Explicit datapath ids, as names like 'leaf1' and 'spine1' would
+        # otherwise both get id 1.
+        topo.addSwitch(name, dpid='%016x' % (i + 1), stp=spec.stp)
+    for (node1, node2, bandwidth, intf1, intf2) in spec.links:
+        topo.addLink(node1, node2, bw=bandwidth, use_htb=True)
+    return Mininet(topo, link=TCLink, switch=OVSBridge, controller=None,
+                   waitConnected=spec.stp)
+
+def nsNet(spec):
+    '''A netns_net.NsNet of spec.'''
+    from netns_net import NsNet
+    net = NsNet(spec.prefix)
+    for name in spec.hosts:
+        net.addHost(name)
+    for name in spec.switches:
+        net.addSwitch(name, stp=spec.stp)
+    for (node1, node2, bandwidth, intf1, intf2) in spec.links:
+        net.addLink(node1, node2)
+    return net
+
+def applySpecQdiscs(net, spec, delay=None):
+    '''Put a priority qdisc tree on every interface of spec's network.
+
+    Each tree is rated at its link's bandwidth. delay, e.g. '1ms', is added
+    at host egress only, as in the FCT tests. Only what changed since the
+    last call is applied, see tc_batch.applyTrees().
+    '''
+    for name in spec.hosts + spec.switches:
+        node = net.getNodeByName(name)
+        node_delay = delay if name in spec.hosts else None
+        with span('addPrioQdiscs', node=name):
+            applyTrees(node, [prioQdiscTree(intf, bandwidth, node_delay)
+                              for (intf, bandwidth) in spec.nodeIntfs(name)],
+                       verbose=False)
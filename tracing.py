@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+'''Lightweight timing spans for the test harness, with trace export.
+
+Code marks the phases it wants timed with span():
+
+    with span('net.start'):
+        net.start()
+
+or by decorating a function with @traced(). Processes started with popen()
+get a span for the spawn itself, and another for their whole lifetime once
+procDone() is called after they exit.
+
+Finished spans are appended, one JSON object per line, to the events file
+given to setEventsFile(). Small appends are atomic, so parallel worker
+processes can share one file. Until an events file is set, spans cost
+almost nothing and are dropped.
+
+exportTrace() turns the events file into a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev), and summaryTable() into a
+table of the time spent in each kind of span.
+'''
+
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+_events_file = None
+_procs = {}
+
+
+def setEventsFile(filename):
+    '''Record spans to filename (appending), or None to stop recording.'''
+    global _events_file
+    _events_file = filename
+
+def _record(name, cat, start, end, args):
+    if _events_file is None:
+        return
+    event = {'name': name, 'cat': cat, 'ph': 'X',
+             'ts': start * 1e6, 'dur': (end - start) * 1e6,
+             'pid': os.getpid(),
+             'tid': threading.current_thread().ident % 1000000,
+             'args': args}
+    line = json.dumps(event) + '\n'
+    fd = os.open(_events_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+@contextmanager
+def span(name, cat='phase', **args):
+    '''Time the enclosed block as a span. Keywords are recorded with it.'''
+    start = time.time()
+    try:
+        yield
+    finally:
+        _record(name, cat, start, time.time(), args)
+
+def traced(name=None, cat='phase'):
+    '''Decorator timing every call of a function as a span.'''
+    def decorate(func):
+        span_name = name or func.__name__
+        def wrapper(*fargs, **kwargs):
+            with span(span_name, cat):
+                return func(*fargs, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorate
+
+def popen(node, cmd, name, **kwargs):
+    '''node.popen(cmd, **kwargs), timed as a 'popen' span.
+
+    The process's lifetime is recorded as a span named name when
+    procDone() is called for it.
+    '''
+    start = time.time()
+    proc = node.popen(cmd, **kwargs)
+    _record('popen', 'popen', start, time.time(),
+            {'node': getattr(node, 'name', ''), 'cmd': cmd})
+    _procs[id(proc)] = (name, start, cmd)
+    return proc
+
+def procDone(proc):
+    '''Record the lifetime of a process started by popen(), once it's over.'''
+    info = _procs.pop(id(proc), None)
+    if info is not None:
+        (name, start, cmd) = info
+        _record(name, 'process', start, time.time(),
+                {'cmd': cmd, 'returncode': proc.returncode})
+
+def readEvents(events_file):
+    '''The span events recorded in events_file.'''
+    events = []
+    with open(events_file) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass # A partial line from a killed process.
+    return events
+
+def exportTrace(events_file, trace_file):
+    '''Write the spans in events_file as a Chrome trace event JSON file.'''
+    events = readEvents(events_file)
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def summaryTable(events_file):
+    '''A text table of the count and time of each kind of span.
+
+    Rows are sorted by total time. '% wall' is the total time over the
+    wall clock time from the first span's start to the last span's end, so
+    spans running in parallel, or nested in each other, add up to more
+    than 100%.
+    '''
+    events = readEvents(events_file)
+    if not events:
+        return 'No spans recorded.\n'
+    wall = (max(e['ts'] + e['dur'] for e in events) -
+            min(e['ts'] for e in events))
+    rows = {}
+    for e in events:
+        key = (e['cat'], e['name'])
+        rows.setdefault(key, []).append(e['dur'])
+    lines = ['%-10s %-24s %7s %11s %10s %10s %7s'
+             % ('category', 'span', 'count', 'total (s)', 'mean (ms)',
+                'max (ms)', '% wall')]
+    for ((cat, name), durs) in sorted(rows.items(),
+                                      key=lambda item: -sum(item[1])):
+        total = sum(durs)
+        lines.append('%-10s %-24s %7d %11.3f %10.3f %10.3f %7.1f'
+                     % (cat, name[:24], len(durs), total / 1e6,
+                        total / len(durs) / 1e3, max(durs) / 1e3,
+                        100.0 * total / wall if wall else 0.0))
+    lines.append('wall clock: %.3f s' % (wall / 1e6))
+    return '\n'.join(lines) + '\n'
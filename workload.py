@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+'''Concurrent flow workloads, with Poisson arrivals and heavy-tailed sizes.
+
+Where fcttest measures one flow at a time on an idle network, a workload
+runs many overlapping flows: flow sizes are drawn from an empirical CDF
+(e.g. the web search or data mining distributions), and flows arrive as a
+Poisson process whose rate gives a target load on the bottleneck link.
+
+The client is a single process multiplexing every connection with epoll,
+so thousands of flows need neither a process nor a thread each:
+
+    workload.py -a 10.0.0.2 -p 5679 --cdf websearch --load 0.5 \
+        --bandwidth 100 -n 2000 -o flows.npz [-r] [-C reno]
+
+Each flow is a new connection. The client sends a header holding the flow
+size (HEADER) and then that many bytes, and the server answers with a
+single byte token once it has received them all. This is fcttest's
+protocol, so the server is './fcttest -s', which also serves any number of
+flows at once.
+The flow completion time runs from the client starting the connection until
+the token arrives.
+
+The client saves one entry per flow in a .npz file; see runClient(). Use
+loadFlows() to read it back with FCTs and slowdowns, and bucketReport() to
+break them down by flow size.
+'''
+
+from argparse import ArgumentParser
+import resource
+import select
+import socket
+import struct
+import errno
+import numpy as np
+from flow_schedule import monotonic
+
+# Empirical flow size CDFs, as (size in bytes, cumulative probability), from
+# the web search (DCTCP) and data mining (VL2) workloads, as distributed
+# with pFabric. Sizes are in 1460 byte packets in the originals.
+WEB_SEARCH_CDF = [(6 * 1460, 0.0), (6 * 1460, 0.15), (13 * 1460, 0.2),
+                  (19 * 1460, 0.3), (33 * 1460, 0.4), (53 * 1460, 0.53),
+                  (133 * 1460, 0.6), (667 * 1460, 0.7), (1333 * 1460, 0.8),
+                  (3333 * 1460, 0.9), (6667 * 1460, 0.97),
+                  (20000 * 1460, 1.0)]
+DATA_MINING_CDF = [(1 * 1460, 0.0), (1 * 1460, 0.5), (2 * 1460, 0.6),
+                   (3 * 1460, 0.7), (7 * 1460, 0.8), (267 * 1460, 0.9),
+                   (2107 * 1460, 0.95), (66667 * 1460, 0.99),
+                   (666667 * 1460, 1.0)]
+WORKLOAD_CDFS = {'websearch': WEB_SEARCH_CDF,
+                 'datamining': DATA_MINING_CDF}
+
+# Upper edges (bytes) of the flow size buckets of bucketReport(). Flows
+# larger than the last edge form a final bucket.
+SIZE_BUCKETS = [10000, 100000, 1000000]
+
+# Flow request header: the number of payload bytes that follow.
+HEADER = struct.Struct('!Q')
+RESPONSE_TOKEN = '$'
+
+# Socket options not named by the socket module. SO_RC3 is from the RC3
+# kernel patch, as in fcttest.c.
+SO_RC3 = 60
+TCP_CONGESTION = 13
+
+CHUNK_SIZE = 64 * 1024
+_ZEROS = memoryview('\0' * CHUNK_SIZE)
+
+
+def loadCdf(name):
+    '''A CDF by name (see WORKLOAD_CDFS), or from a file.
+
+    A CDF file has one "size_bytes probability" pair per line, with sizes
+    and probabilities both non-decreasing, and a last probability of 1.
+    '''
+    if name in WORKLOAD_CDFS:
+        return WORKLOAD_CDFS[name]
+    cdf = []
+    with open(name) as f:
+        for line in f:
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                cdf.append((float(fields[0]), float(fields[1])))
+    return cdf
+
+def cdfMean(cdf):
+    '''Mean flow size of a piecewise linear CDF.'''
+    sizes = np.array([s for (s, _) in cdf], dtype=np.float64)
+    probs = np.array([p for (_, p) in cdf], dtype=np.float64)
+    return float(np.sum(np.diff(probs) * (sizes[1:] + sizes[:-1]) / 2))
+
+def sampleSizes(cdf, n, rng):
+    '''Draw n flow sizes (bytes) from a CDF, interpolating linearly.'''
+    sizes = np.array([s for (s, _) in cdf], dtype=np.float64)
+    probs = np.array([p for (_, p) in cdf], dtype=np.float64)
+    u = rng.uniform(probs[0], probs[-1], n)
+    return np.maximum(np.round(np.interp(u, probs, sizes)), 1).astype(np.int64)
+
+def generateWorkload(cdf, load, bandwidth, num_flows, seed=None):
+    '''Arrival times and sizes of a workload.
+
+    Args:
+        cdf: Flow size CDF, e.g. from loadCdf().
+        load: Target utilization of the bottleneck, e.g. 0.5.
+        bandwidth: Bottleneck rate in Mbps.
+        num_flows: Number of flows.
+        seed: Random seed. The same seed gives the same workload, so e.g.
+            TCP and RC3 can be compared on identical flows.
+
+    Returns (arrivals, sizes) arrays, arrivals in seconds from the start.
+    '''
+    rng = np.random.RandomState(seed)
+    rate = load * bandwidth * 1e6 / 8 / cdfMean(cdf) # flows per second
+    arrivals = np.cumsum(rng.exponential(1.0 / rate, num_flows))
+    return (arrivals - arrivals[0], sampleSizes(cdf, num_flows, rng))
+
+def setSocketOptions(sock, rc3, tcp_type):
+    '''Enable RC3 and choose the congestion control of a socket.'''
+    if rc3:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RC3, 1)
+    if tcp_type is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, TCP_CONGESTION, tcp_type)
+
+def raiseFdLimit():
+    '''Allow as many open files as the hard limit permits.'''
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def runClient(addr, port, arrivals, sizes, rc3=False, tcp_type=None,
+              timeout=None):
+    '''Run flows to an fcttest server, each starting at its arrival time.
+
+    Args:
+        addr, port: The server.
+        arrivals: Arrival time of each flow, in seconds from the start.
+        sizes: Size of each flow, in bytes.
+        rc3: Whether to use RC3.
+        tcp_type: Congestion control algorithm, or None for the default.
+        timeout: Seconds after the last arrival to wait for unfinished
+            flows, or None to wait forever.
+
+    Returns a dictionary of per-flow arrays, times in seconds from the
+    start: 'arrival', 'size', 'start' (when the connection was started),
+    'connected', 'done' (token received) and 'ok'. Times of flows that
+    failed or timed out are NaN.
+    '''
+    raiseFdLimit()
+    n = len(sizes)
+    start = np.empty(n)
+    connected = np.empty(n)
+    done = np.empty(n)
+    for a in (start, connected, done):
+        a.fill(np.nan)
+    ok = np.zeros(n, dtype=bool)
+
+    ep = select.epoll()
+    flows = {} # fd -> [flow index, socket, payload bytes left]
+    finished = [0]
+    t0 = monotonic()
+
+    def finish(fd, success):
+        (i, sock, _) = flows.pop(fd)
+        ep.unregister(fd)
+        sock.close()
+        ok[i] = success
+        if success:
+            done[i] = monotonic() - t0
+        finished[0] += 1
+
+    def launch(i):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(0)
+        setSocketOptions(sock, rc3, tcp_type)
+        start[i] = monotonic() - t0
+        err = sock.connect_ex((addr, port))
+        if err not in (0, errno.EINPROGRESS):
+            sock.close()
+            finished[0] += 1
+            return
+        flows[sock.fileno()] = [i, sock, None]
+        ep.register(sock.fileno(), select.EPOLLOUT)
+
+    def send(fd):
+        flow = flows[fd]
+        (i, sock, left) = flow
+        if left is None:
+            # Just connected. The header fits in the empty send buffer.
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                finish(fd, False)
+                return
+            connected[i] = monotonic() - t0
+            sock.send(HEADER.pack(int(sizes[i])))
+            left = flow[2] = int(sizes[i])
+        while left > 0:
+            try:
+                sent = sock.send(_ZEROS[:min(left, CHUNK_SIZE)])
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                finish(fd, False)
+                return
+            left = flow[2] = left - sent
+        if left == 0:
+            ep.modify(fd, select.EPOLLIN)
+
+    def receive(fd):
+        try:
+            token = flows[fd][1].recv(1)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            token = ''
+        finish(fd, token == RESPONSE_TOKEN)
+
+    next_flow = 0
+    while finished[0] < n:
+        now = monotonic() - t0
+        while next_flow < n and arrivals[next_flow] <= now:
+            launch(next_flow)
+            next_flow += 1
+        if next_flow < n:
+            wait = max(arrivals[next_flow] - (monotonic() - t0), 0)
+        else:
+            if timeout is not None and now > arrivals[-1] + timeout:
+                break
+            wait = 1.0
+        for (fd, event) in ep.poll(wait):
+            if fd not in flows:
+                continue
+            if flows[fd][2] != 0:
+                if event & (select.EPOLLERR | select.EPOLLHUP) and \
+                        flows[fd][2] is not None:
+                    finish(fd, False)
+                else:
+                    send(fd)
+            else:
+                receive(fd)
+
+    for fd in list(flows):
+        finish(fd, False)
+    done[~ok] = np.nan
+    return {'arrival': np.asarray(arrivals, dtype=np.float64),
+            'size': np.asarray(sizes, dtype=np.int64),
+            'start': start, 'connected': connected, 'done': done, 'ok': ok}
+
+def loadFlows(filename, bandwidth):
+    '''Load a client's .npz output, adding FCT and slowdown columns.
+
+    'fct_ms' is the flow completion time. 'slowdown' is the FCT over the
+    ideal FCT on an idle network: two round trips (connection setup, then
+    data and token), plus the flow's transmission time at bandwidth. The
+    round trip time is estimated by the fastest connection setup.
+
+    Args:
+        filename: File written by the client.
+        bandwidth: Bottleneck rate in Mbps.
+    '''
+    f = np.load(filename)
+    flows = dict((name, f[name]) for name in f.files)
+    fct = flows['done'] - flows['start']
+    setup = flows['connected'] - flows['start']
+    rtt = np.nanmin(setup) if np.any(~np.isnan(setup)) else 0.0
+    ideal = 2 * rtt + flows['size'] * 8 / (bandwidth * 1e6)
+    flows['fct_ms'] = fct * 1000
+    flows['slowdown'] = fct / ideal
+    return flows
+
+def bucketReport(sizes, fct_ms, slowdown, buckets=SIZE_BUCKETS):
+    '''FCT and slowdown statistics per flow size bucket.
+
+    Returns a list of dictionaries, one per bucket, with 'low' and 'high'
+    size bounds (high is None for the last), 'count', 'failed', and the
+    'mean' and 'p99' of 'fct_ms' and of 'slowdown' over completed flows.
+    '''
+    which = np.digitize(sizes, buckets, right=True)
+    edges = [0] + list(buckets) + [None]
+    rows = []
+    for b in range(len(buckets) + 1):
+        member = which == b
+        good = member & ~np.isnan(fct_ms)
+        row = {'low': edges[b], 'high': edges[b + 1],
+               'count': int(member.sum()),
+               'failed': int(member.sum() - good.sum())}
+        for (name, values) in [('fct_ms', fct_ms), ('slowdown', slowdown)]:
+            v = values[good]
+            row[name + '_mean'] = float(v.mean()) if len(v) else np.nan
+            row[name + '_p99'] = float(np.percentile(v, 99)) if len(v) \
+                else np.nan
+        rows.append(row)
+    return rows
+
+def formatReport(reports):
+    '''Text table of bucketReport() results, by protocol.
+
+    Args:
+        reports: List of (protocol, bucketReport() rows) pairs.
+    '''
+    lines = ['%-8s %-19s %6s %6s %12s %12s %10s %10s'
+             % ('protocol', 'size (bytes)', 'flows', 'failed',
+                'mean FCT ms', 'p99 FCT ms', 'mean slow', 'p99 slow')]
+    for (protocol, rows) in reports:
+        for row in rows:
+            if row['high'] is None:
+                size = '> %d' % row['low']
+            else:
+                size = '%d - %d' % (row['low'], row['high'])
+            lines.append('%-8s %-19s %6d %6d %12.3f %12.3f %10.2f %10.2f'
+                         % (protocol, size, row['count'], row['failed'],
+                            row['fct_ms_mean'], row['fct_ms_p99'],
+                            row['slowdown_mean'], row['slowdown_p99']))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Concurrent flow workload client, "
+                                        "to an fcttest server.")
+    parser.add_argument('--port', '-p', type=int, default=5679)
+    parser.add_argument('--addr', '-a', required=True,
+                        help="Server address.")
+    parser.add_argument('--rc3', '-r', action='store_true', default=False,
+                        help="Enable RC3 (needs the RC3 kernel).")
+    parser.add_argument('--tcp', '-C', dest='tcp_type', default=None,
+                        help="Congestion control algorithm.")
+    parser.add_argument('--cdf', default='websearch',
+                        help="Flow size CDF: %s, or a file."
+                             % ', '.join(sorted(WORKLOAD_CDFS)))
+    parser.add_argument('--load', type=float, default=0.5,
+                        help="Target bottleneck utilization.")
+    parser.add_argument('--bandwidth', type=float, default=100,
+                        help="Bottleneck rate in Mbps.")
+    parser.add_argument('--num-flows', '-n', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="Seconds to wait for flows after the last "
+                             "arrival.")
+    parser.add_argument('--out', '-o', required=True,
+                        help="Output .npz file.")
+    args = parser.parse_args()
+
+    (arrivals, sizes) = generateWorkload(loadCdf(args.cdf), args.load,
+                                         args.bandwidth, args.num_flows,
+                                         args.seed)
+    flows = runClient(args.addr, args.port, arrivals, sizes, args.rc3,
+                      args.tcp_type, args.timeout)
+    np.savez_compressed(args.out, **flows)
+    print "%d of %d flows completed" % (flows['ok'].sum(), len(sizes))